@@ -0,0 +1,89 @@
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+
+from django.core.cache import cache
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from . import slowquery
+from .models import DATABASE_REPLICA_URLS, DATABASE_URL, engine, replica_engines
+from .principal import PRINCIPAL_MAX_AGE, SESSION_KEY, Principal, changed_key, resolve_principal
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+_engines = {}
+
+AsyncSessionLocal = async_sessionmaker(expire_on_commit=False)
+
+
+def async_url(url):
+    """The same database behind an asyncio driver (psycopg2 -> asyncpg)."""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+def get_async_engine(url):
+    """One async engine per database URL, with its own pool separate from the sync engine's.
+
+    Pools are tied to the event loop, so this is only safe under an ASGI
+    server, which runs one loop per process.
+    """
+    if url not in _engines:
+        _engines[url] = create_async_engine(
+            async_url(url),
+            pool_pre_ping=True,
+            pool_size=int(os.environ.get("DB_ASYNC_POOL_SIZE", 20)),
+            max_overflow=int(os.environ.get("DB_ASYNC_MAX_OVERFLOW", 10)),
+            pool_timeout=float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        )
+        # Plans come from the sync engine on the same database
+        sync_engine = engine if url == DATABASE_URL else replica_engines[DATABASE_REPLICA_URLS.index(url)]
+        slowquery.instrument(_engines[url].sync_engine, explain_engine=sync_engine)
+    return _engines[url]
+
+
+async def use_replica(request):
+    if not DATABASE_REPLICA_URLS:
+        return False
+    # Same read-your-writes rule as core.db for the sync views
+    return time.time() >= await request.session.aget('db_primary_until', 0)
+
+
+@asynccontextmanager
+async def async_session(request):
+    """AsyncSession for a read-only request, on a replica unless the user wrote recently."""
+    url = random.choice(DATABASE_REPLICA_URLS) if await use_replica(request) else DATABASE_URL
+    async with AsyncSessionLocal(bind=get_async_engine(url)) as db:
+        yield db
+
+
+async def run_read(request, func, *args):
+    """Await ``func(session, *args)``, a plain sync-ORM function, on an async connection.
+
+    AsyncSession.run_sync lets the async views reuse the pagination, timeline
+    and trend code unchanged while the event loop keeps serving other requests.
+    """
+    async with async_session(request) as db:
+        return await db.run_sync(func, *args)
+
+
+async def aget_principal(request):
+    """Async counterpart of core.principal.get_principal, sharing its session cache."""
+    session = request.session
+    user_id, role = await session.aget('user_id'), await session.aget('role')
+    if not user_id:
+        return None
+    now = time.time()
+    cached = await session.aget(SESSION_KEY)
+    if cached and cached[0] == user_id and cached[1] == role:
+        resolved_at = cached[4]
+        if now - resolved_at < PRINCIPAL_MAX_AGE and resolved_at > await cache.aget(changed_key(user_id), 0):
+            return Principal(*cached[:4])
+    principal = await run_read(request, resolve_principal, user_id, role)
+    if principal is None:
+        await session.apop(SESSION_KEY, None)
+        return None
+    await session.aset(SESSION_KEY, [*principal, now])
+    return principal
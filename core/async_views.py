@@ -0,0 +1,172 @@
+import functools
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import redirect, render
+
+from . import audit
+from .async_db import aget_principal, run_read
+from .conditional import attach_validators, chart_state, chart_validators, not_modified, wants_validators
+from .models import Appointment, LabResult, MedicalRecord, PatientProfile, Prescription
+from .pagination import Page
+from .timeline import patient_timeline
+from .trends import compute_trends, load_series, patient_trends, series_points
+from .views import doctor_patient_records, patient_records
+
+
+def conditional_chart(role, *models):
+    """Async counterpart of core.conditional.conditional_chart."""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            principal = await aget_principal(request)
+            if not principal or principal.role != role or not await sync_to_async(wants_validators)(request):
+                return await view(request, *args, **kwargs)
+            patient_id = kwargs.get('patient_id') if role == 'doctor' else principal.profile_id
+            if patient_id is None:
+                return await view(request, *args, **kwargs)
+            state = await run_read(request, chart_state, patient_id, models, role == 'doctor')
+            if role == 'doctor' and state[-1] is None:
+                return await view(request, *args, **kwargs)
+            etag, last_modified = chart_validators(request, principal, state)
+            return not_modified(request, etag, last_modified) or attach_validators(
+                await view(request, *args, **kwargs), etag, last_modified,
+            )
+        return wrapper
+    return decorator
+
+
+def audit_read(resource):
+    """Async counterpart of core.audit.audit_read."""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            response = await view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                principal = await aget_principal(request)
+                if principal:
+                    audit.record(principal, 'read', resource, kwargs['patient_id'], request=request)
+            return response
+        return wrapper
+    return decorator
+
+
+async def _patient_list(request, model, date_column, template, name):
+    principal = await aget_principal(request)
+    if not principal or principal.role != 'patient':
+        return redirect('login')
+    if principal.profile_id:
+        page = await run_read(request, patient_records, request, principal.profile_id, model, date_column)
+    else:
+        page = Page.empty()
+    return render(request, template, {name: page.items, 'page': page})
+
+
+@conditional_chart('patient', LabResult)
+async def patient_lab_results(request):
+    return await _patient_list(request, LabResult, LabResult.date, 'patient_lab_results.html', 'results')
+
+
+@conditional_chart('patient', Prescription)
+async def patient_prescriptions(request):
+    return await _patient_list(request, Prescription, Prescription.date, 'patient_prescriptions.html', 'prescriptions')
+
+
+@conditional_chart('patient', MedicalRecord)
+async def patient_medical_history(request):
+    return await _patient_list(request, MedicalRecord, MedicalRecord.date, 'patient_medical_history.html', 'records')
+
+
+@conditional_chart('patient', Appointment)
+async def patient_appointments(request):
+    return await _patient_list(request, Appointment, Appointment.appointment_time, 'patient_appointments.html', 'appointments')
+
+
+async def _is_doctor(request):
+    principal = await aget_principal(request)
+    return principal is not None and principal.role == 'doctor'
+
+
+async def _doctor_patient_list(request, patient_id, model, date_column, template, name):
+    if not await _is_doctor(request):
+        return redirect('login')
+    patient, page = await run_read(request, doctor_patient_records, request, patient_id, model, date_column)
+    if not patient:
+        return HttpResponse('Patient profile not found.', status=404)
+    return render(request, template, {'patient': patient, name: page.items, 'page': page})
+
+
+@audit_read('medical_records')
+@conditional_chart('doctor', MedicalRecord)
+async def doctor_patient_medical_history(request, patient_id):
+    return await _doctor_patient_list(
+        request, patient_id, MedicalRecord, MedicalRecord.date, 'doctor_patient_medical_history.html', 'records',
+    )
+
+
+@audit_read('prescriptions')
+@conditional_chart('doctor', Prescription)
+async def doctor_patient_prescriptions(request, patient_id):
+    return await _doctor_patient_list(
+        request, patient_id, Prescription, Prescription.date, 'doctor_patient_prescriptions.html', 'prescriptions',
+    )
+
+
+@audit_read('lab_results')
+@conditional_chart('doctor', LabResult)
+async def doctor_patient_lab_results(request, patient_id):
+    if not await _is_doctor(request):
+        return redirect('login')
+
+    def load(db):
+        patient, page = doctor_patient_records(db, request, patient_id, LabResult, LabResult.date)
+        return patient, page, patient_trends(db, patient_id) if patient else []
+
+    patient, page, trends = await run_read(request, load)
+    if not patient:
+        return HttpResponse('Patient profile not found.', status=404)
+    return render(request, 'doctor_patient_lab_results.html', {'patient': patient, 'results': page.items, 'page': page, 'trends': trends})
+
+
+@audit_read('lab_results')
+@conditional_chart('doctor', LabResult)
+async def doctor_patient_lab_trends(request, patient_id):
+    if not await _is_doctor(request):
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    analyte = (request.GET.get('analyte') or '').strip().upper() or None
+
+    def load(db):
+        if not db.query(PatientProfile.id).filter_by(id=patient_id).first():
+            return None
+        return load_series(db, patient_id, analyte)
+
+    series = await run_read(request, load)
+    if series is None:
+        return JsonResponse({'error': 'Patient profile not found.'}, status=404)
+    codes, units, days, values = series
+    data = {'trends': compute_trends(codes, units, days, values)}
+    if analyte:
+        data['series'] = series_points(units, days, values)
+    return JsonResponse(data)
+
+
+@audit_read('timeline')
+@conditional_chart('doctor', MedicalRecord, LabResult, Prescription, Appointment)
+async def doctor_patient_timeline(request, patient_id):
+    if not await _is_doctor(request):
+        return redirect('login')
+    cursor = request.GET.get('before')
+
+    def load(db):
+        patient = db.query(PatientProfile).filter_by(id=patient_id).first()
+        return patient, patient_timeline(db, patient_id, cursor=cursor) if patient else ([], None)
+
+    patient, (events, next_cursor) = await run_read(request, load)
+    if not patient:
+        return HttpResponse('Patient profile not found.', status=404)
+    return render(request, 'doctor_patient_timeline.html', {
+        'patient': patient,
+        'events': events,
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor,
+    })
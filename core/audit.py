@@ -0,0 +1,186 @@
+import atexit
+import functools
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from .models import AuditLog, engine, utcnow
+
+logger = logging.getLogger(__name__)
+
+# A batch that fails this many times goes to the error log instead of the table
+WRITE_ATTEMPTS = 3
+RETRY_DELAY_SECONDS = 0.5
+SHUTDOWN_TIMEOUT_SECONDS = 10
+
+_lock = threading.Lock()
+_stats = {
+    'enqueued': 0,
+    'written': 0,
+    'batches': 0,
+    'inline_writes': 0,
+    'write_errors': 0,
+    'dropped_to_log': 0,
+}
+_queue = None
+_stop = None
+_thread = None
+_pid = None
+
+
+def _get_queue():
+    """Event queue and writer thread for this (forked) worker, started on first use."""
+    global _queue, _stop, _thread, _pid
+    with _lock:
+        if _pid != os.getpid():
+            _queue = queue.Queue(maxsize=settings.AUDIT_QUEUE_SIZE)
+            _stop = threading.Event()
+            _thread = threading.Thread(target=_run, args=(_queue, _stop), name='audit-writer', daemon=True)
+            _thread.start()
+            _pid = os.getpid()
+        return _queue
+
+
+def record(principal, action, resource, patient_id, record_id=None, request=None, details=None):
+    """Queue one audit event; it reaches the audit_log table within AUDIT_FLUSH_SECONDS.
+
+    Never blocks on the database unless the queue is full, in which case
+    the event is written from the calling thread, once and without retrying;
+    if that fails it goes to the error log.
+    """
+    event = {
+        'occurred_at': utcnow(),
+        'actor_user_id': principal.user_id,
+        'actor_role': principal.role,
+        'action': action,
+        'resource': resource,
+        'patient_id': patient_id,
+        'record_id': record_id,
+        'path': request.path[:255] if request is not None else None,
+        'ip_address': request.META.get('REMOTE_ADDR') if request is not None else None,
+        'details': details,
+    }
+    with _lock:
+        _stats['enqueued'] += 1
+    try:
+        _get_queue().put_nowait(event)
+    except queue.Full:
+        with _lock:
+            _stats['inline_writes'] += 1
+        _write([event], attempts=1)
+
+
+def _run(events, stop):
+    while not (stop.is_set() and events.empty()):
+        try:
+            batch = [events.get(timeout=settings.AUDIT_FLUSH_SECONDS)]
+        except queue.Empty:
+            continue
+        # Collect for up to one flush interval so a busy worker writes a few large INSERTs
+        deadline = time.monotonic() + settings.AUDIT_FLUSH_SECONDS
+        while len(batch) < settings.AUDIT_BATCH_SIZE and not stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(events.get(timeout=remaining))
+            except queue.Empty:
+                break
+        _write(batch)
+
+
+def _drain(events):
+    batch = []
+    while True:
+        try:
+            batch.append(events.get_nowait())
+        except queue.Empty:
+            return batch
+
+
+def _write(batch, attempts=WRITE_ATTEMPTS):
+    """Insert ``batch`` in one multi-row INSERT, retrying before falling back to the log."""
+    for attempt in range(1, attempts + 1):
+        try:
+            with engine.begin() as connection:
+                connection.execute(insert(AuditLog), batch)
+        except SQLAlchemyError:
+            with _lock:
+                _stats['write_errors'] += 1
+            logger.warning('audit: writing %d events failed (attempt %d)', len(batch), attempt, exc_info=True)
+            if attempt < attempts:
+                time.sleep(RETRY_DELAY_SECONDS * attempt)
+            continue
+        with _lock:
+            _stats['written'] += len(batch)
+            _stats['batches'] += 1
+        return
+    with _lock:
+        _stats['dropped_to_log'] += len(batch)
+    for event in batch:
+        logger.error('audit event not stored: %r', event)
+
+
+def flush():
+    """Write everything queued in this process now, from the calling thread."""
+    if _pid == os.getpid():
+        batch = _drain(_queue)
+        for start in range(0, len(batch), settings.AUDIT_BATCH_SIZE):
+            _write(batch[start:start + settings.AUDIT_BATCH_SIZE])
+
+
+@atexit.register
+def shutdown():
+    """Stop the writer thread after it has written what is queued."""
+    if _pid != os.getpid():
+        return
+    _stop.set()
+    _thread.join(SHUTDOWN_TIMEOUT_SECONDS)
+    flush()
+
+
+def audit_stats():
+    with _lock:
+        stats = dict(_stats)
+    stats['queued'] = _queue.qsize() if _pid == os.getpid() else 0
+    return stats
+
+
+def audit_read(resource):
+    """Record every successful read (200, or 304 from a cached copy) of the view's ``patient_id`` chart."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            principal = request.principal
+            if response.status_code in (200, 304) and principal:
+                record(principal, 'read', resource, kwargs['patient_id'], request=request)
+            return response
+        return wrapper
+    return decorator
+
+
+def _events(db, column, value, since, until, limit):
+    query = select(AuditLog).where(column == value)
+    if since is not None:
+        query = query.where(AuditLog.occurred_at >= since)
+    if until is not None:
+        query = query.where(AuditLog.occurred_at < until)
+    query = query.order_by(AuditLog.occurred_at.desc(), AuditLog.id.desc()).limit(limit)
+    return db.execute(query).scalars().all()
+
+
+def patient_events(db, patient_id, since=None, until=None, limit=100):
+    """Newest-first audit entries for one patient's chart."""
+    return _events(db, AuditLog.patient_id, patient_id, since, until, limit)
+
+
+def actor_events(db, user_id, since=None, until=None, limit=100):
+    """Newest-first audit entries for everything one user read or changed."""
+    return _events(db, AuditLog.actor_user_id, user_id, since, until, limit)
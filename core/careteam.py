@@ -0,0 +1,53 @@
+from sqlalchemy import DateTime, bindparam, text
+
+from .models import DoctorPatient, PatientProfile, utcnow
+
+# Add the pair or move last_seen_at forward; an older timestamp never overwrites a newer one
+_SEEN = text("""
+    INSERT INTO doctor_patients (doctor_id, patient_id, last_seen_at)
+    VALUES (:doctor_id, :patient_id, :seen_at)
+    ON CONFLICT (doctor_id, patient_id) DO UPDATE SET last_seen_at = excluded.last_seen_at
+    WHERE doctor_patients.last_seen_at < excluded.last_seen_at
+""").bindparams(bindparam('seen_at', type_=DateTime(timezone=True)))
+
+# Every pair with a booking or chart entry, last seen at its latest one (future appointments count as now)
+_BACKFILL = text("""
+    INSERT INTO doctor_patients (doctor_id, patient_id, last_seen_at)
+    SELECT doctor_id, patient_id,
+           max(CASE WHEN seen_at IS NULL OR seen_at > CURRENT_TIMESTAMP THEN CURRENT_TIMESTAMP ELSE seen_at END)
+    FROM (
+        SELECT doctor_id, patient_id, appointment_time AS seen_at FROM appointments
+        UNION ALL SELECT doctor_id, patient_id, date FROM medical_records
+        UNION ALL SELECT doctor_id, patient_id, date FROM lab_results
+        UNION ALL SELECT doctor_id, patient_id, date FROM prescriptions
+    ) AS activity
+    WHERE doctor_id IS NOT NULL AND patient_id IS NOT NULL
+    GROUP BY doctor_id, patient_id
+    ON CONFLICT (doctor_id, patient_id) DO UPDATE SET last_seen_at = excluded.last_seen_at
+    WHERE doctor_patients.last_seen_at < excluded.last_seen_at
+""")
+
+
+def seen(db, doctor_id, patient_id):
+    """Put the patient on the doctor's panel, or bump them to the top of it.
+
+    Runs in the caller's transaction, so the pair is recorded exactly when the
+    appointment or chart entry that caused it commits.
+    """
+    db.execute(_SEEN, {'doctor_id': doctor_id, 'patient_id': patient_id, 'seen_at': utcnow()})
+
+
+def backfill(db):
+    """Add or refresh panel entries from existing appointments and chart entries, for bulk-loaded data.
+
+    Returns the number of pairs written.
+    """
+    return db.execute(_BACKFILL).rowcount
+
+
+def panel_query(db, doctor_id):
+    """The doctor's patients with their last-seen time, to be paginated on (last_seen_at, patient_id)."""
+    return db.query(
+        DoctorPatient.patient_id, DoctorPatient.last_seen_at,
+        PatientProfile.id, PatientProfile.full_name, PatientProfile.date_of_birth, PatientProfile.phone,
+    ).join(PatientProfile, PatientProfile.id == DoctorPatient.patient_id).filter(DoctorPatient.doctor_id == doctor_id)
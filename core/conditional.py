@@ -0,0 +1,103 @@
+import calendar
+import functools
+import hashlib
+import os
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from sqlalchemy import func, select
+
+from .models import DoctorProfile, PatientProfile
+
+
+def chart_state(db, patient_id, models, profile=False):
+    """Row count and latest updated_at of a patient's rows in each of ``models``, in one query.
+
+    The latest doctor profile change follows, since chart pages show doctors'
+    names. With ``profile`` the patient's own updated_at is included as well;
+    it is None when the patient does not exist. Each value is answered from
+    an index without touching the table.
+    """
+    columns = []
+    for model in models:
+        columns.append(select(func.count()).select_from(model).where(model.patient_id == patient_id).scalar_subquery())
+        columns.append(select(func.max(model.updated_at)).where(model.patient_id == patient_id).scalar_subquery())
+    columns.append(select(func.max(DoctorProfile.updated_at)).scalar_subquery())
+    if profile:
+        columns.append(select(PatientProfile.updated_at).where(PatientProfile.id == patient_id).scalar_subquery())
+    return tuple(db.execute(select(*columns)).one())
+
+
+@functools.cache
+def templates_mtime():
+    """Newest template file in this deploy, so a template change also changes every validator."""
+    newest = 0
+    for template_dir in settings.TEMPLATES[0]['DIRS']:
+        for root, _, files in os.walk(template_dir):
+            for name in files:
+                newest = max(newest, int(os.path.getmtime(os.path.join(root, name))))
+    return newest
+
+
+def chart_validators(request, principal, state):
+    """(ETag, Last-Modified timestamp) for a chart page showing ``state`` (see chart_state).
+
+    The ETag also covers the viewer and the query string (filters and page). A
+    deleted row lowers the count but not the latest updated_at, so only the
+    ETag notices it; browsers send If-None-Match, which takes precedence.
+    """
+    stamps = [calendar.timegm(value.utctimetuple()) for value in state if hasattr(value, 'utctimetuple')]
+    last_modified = max([templates_mtime(), *stamps])
+    raw = repr((tuple(principal), request.get_full_path(), last_modified, state))
+    return f'"{hashlib.sha1(raw.encode()).hexdigest()}"', last_modified
+
+
+def wants_validators(request):
+    # Pending flash messages must be rendered, so those requests always get a full response
+    return request.method in ('GET', 'HEAD') and not len(get_messages(request))
+
+
+def not_modified(request, etag, last_modified):
+    """A 304 (or 412) response if the client's copy is current, else None."""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        return None
+    return attach_validators(response, etag, last_modified)
+
+
+def attach_validators(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # Revalidate every time, and keep medical data out of shared caches
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_chart(role, *models):
+    """Answer If-None-Match / If-Modified-Since for a chart view from a cheap count/max query.
+
+    Patients see their own chart; doctors see the one named by the view's
+    ``patient_id`` argument. When nothing changed the view is not called at
+    all, so its queries and template rendering are skipped.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            principal = request.principal
+            if not principal or principal.role != role or not wants_validators(request):
+                return view(request, *args, **kwargs)
+            patient_id = kwargs.get('patient_id') if role == 'doctor' else principal.profile_id
+            if patient_id is None:
+                return view(request, *args, **kwargs)
+            state = chart_state(request.db, patient_id, models, profile=role == 'doctor')
+            if role == 'doctor' and state[-1] is None:
+                return view(request, *args, **kwargs)
+            etag, last_modified = chart_validators(request, principal, state)
+            return not_modified(request, etag, last_modified) or attach_validators(
+                view(request, *args, **kwargs), etag, last_modified,
+            )
+        return wrapper
+    return decorator
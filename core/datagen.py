@@ -0,0 +1,311 @@
+import datetime
+import io
+
+import numpy as np
+from sqlalchemy import func, insert, text
+
+from . import careteam, directory
+from .loadtest import ANALYTES, DIAGNOSES, FIRST_NAMES, LAST_NAMES, MEDICATIONS, SPECIALTIES
+from .models import (
+    Appointment, DoctorAvailability, DoctorProfile, LabResult, MedicalRecord, PatientProfile, Prescription, User,
+)
+
+USERNAME_PREFIX = 'dataset-'
+EMAIL_DOMAIN = 'dataset.invalid'
+# People per generated batch. Each batch draws from its own seeded stream, so this is
+# part of what a seed means: changing it changes the data.
+CHUNK_SIZE = 20000
+# Appointments fill the generated availability, 09:00-17:00 on weekdays, in 30 minute slots
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 16
+# Weekdays from a year ago to a month ahead
+SCHEDULE_DAYS = 56 * 5
+# Share of chart entries written by the patient's usual doctor rather than any doctor
+PRIMARY_DOCTOR_SHARE = 0.8
+
+TREATMENTS = ['Follow-up in 3 months', 'Lifestyle advice', 'Medication adjusted', 'Referred to specialist', 'No action needed']
+DOSAGES = ['1 tablet daily', '1 tablet twice daily', '2 tablets daily', '5 ml three times daily']
+REASONS = ['Check-up', 'Follow-up', 'Consultation', 'Test results', 'Repeat prescription']
+
+# Tables whose ids the generator assigns itself, so child rows can point at them without RETURNING
+ID_TABLES = [User, DoctorProfile, PatientProfile, MedicalRecord]
+
+
+def _rng(seed, *key):
+    return np.random.default_rng(np.random.SeedSequence([seed, *key]))
+
+
+def _pick(rng, choices, size):
+    return np.array(choices, dtype=object)[rng.integers(len(choices), size=size)]
+
+
+def _numbers(values, width=0):
+    return np.char.zfill(values.astype(str), width).astype(object)
+
+
+def _users(role, start, stop, user_ids, password_hash):
+    names = f'{USERNAME_PREFIX}{role}-' + _numbers(np.arange(start, stop))
+    return User, {
+        'id': user_ids,
+        'username': names,
+        'password_hash': np.full(len(user_ids), password_hash, dtype=object),
+        'role': np.full(len(user_ids), role, dtype=object),
+        'email': names + f'@{EMAIL_DOMAIN}',
+    }
+
+
+class Generator:
+    """Deterministic, vectorized synthetic data: doctors, patients and their charts.
+
+    Each batch of CHUNK_SIZE doctors or patients is drawn with numpy from a
+    stream seeded by (seed, kind, batch number), so a seed always yields the
+    same rows in the same order. Dates are relative to midnight on ``as_of``
+    and ids start after what the database already holds.
+    """
+
+    def __init__(self, seed, patients, doctors, means, first_ids, as_of):
+        self.seed = seed
+        self.patients = patients
+        self.doctors = doctors
+        self.means = means
+        self.first_ids = dict(first_ids)
+        self.now = np.datetime64(as_of, 's')
+        monday = as_of - datetime.timedelta(days=as_of.weekday() + 52 * 7)
+        self.schedule_start = np.datetime64(monday, 's') + np.timedelta64(9, 'h')
+        self.doctor_ids = self.first_ids[DoctorProfile] + np.arange(doctors)
+        # Slots taken so far per doctor; appointments never overlap, even across batches
+        self.next_slot = np.zeros(doctors, dtype=np.int64)
+        expected = patients * means['appointments'] / max(doctors, 1)
+        # Geometric gaps between a doctor's visits, averaging out to filling the schedule
+        self.gap_p = min(1.0, expected / (SCHEDULE_DAYS * SLOTS_PER_DAY)) or 1.0
+
+    def _take_ids(self, model, n):
+        ids = self.first_ids[model] + np.arange(n)
+        self.first_ids[model] += n
+        return ids
+
+    def doctor_batches(self, password_hash):
+        for number, start in enumerate(range(0, self.doctors, CHUNK_SIZE)):
+            stop = min(start + CHUNK_SIZE, self.doctors)
+            n = stop - start
+            rng = _rng(self.seed, 0, number)
+            user_ids = self._take_ids(User, n)
+            doctor_ids = self._take_ids(DoctorProfile, n)
+            weekdays = np.tile(np.arange(5), n)
+            yield stop, [
+                _users('doctor', start, stop, user_ids, password_hash),
+                (DoctorProfile, {
+                    'id': doctor_ids,
+                    'user_id': user_ids,
+                    'full_name': 'Dr ' + _pick(rng, FIRST_NAMES, n) + ' ' + _pick(rng, LAST_NAMES, n),
+                    'specialty': _pick(rng, SPECIALTIES, n),
+                    'phone': '555' + _numbers(rng.integers(10**7, size=n), 7),
+                }),
+                (DoctorAvailability, {
+                    'doctor_id': np.repeat(doctor_ids, 5),
+                    'weekday': weekdays,
+                    'start_time': np.full(5 * n, datetime.time(9), dtype=object),
+                    'end_time': np.full(5 * n, datetime.time(17), dtype=object),
+                    'slot_minutes': np.full(5 * n, SLOT_MINUTES),
+                }),
+            ]
+
+    def patient_batches(self, password_hash):
+        for number, start in enumerate(range(0, self.patients, CHUNK_SIZE)):
+            stop = min(start + CHUNK_SIZE, self.patients)
+            yield stop, self._patient_batch(_rng(self.seed, 1, number), start, stop, password_hash)
+
+    def _patient_batch(self, rng, start, stop, password_hash):
+        n = stop - start
+        user_ids = self._take_ids(User, n)
+        patient_ids = self._take_ids(PatientProfile, n)
+        digits = _numbers(rng.integers(10**7, size=n), 7)
+        primary = rng.integers(self.doctors, size=n)
+        tables = [
+            _users('patient', start, stop, user_ids, password_hash),
+            (PatientProfile, {
+                'id': patient_ids,
+                'user_id': user_ids,
+                'full_name': _pick(rng, FIRST_NAMES, n) + ' ' + _pick(rng, LAST_NAMES, n),
+                'date_of_birth': np.datetime64('1940-01-01') + rng.integers(80 * 365, size=n).astype('timedelta64[D]'),
+                'address': _numbers(rng.integers(1, 1000, size=n)) + ' Main Street',
+                'phone': '+1 555-' + digits,
+                'phone_normalized': '1555' + digits,
+            }),
+        ]
+
+        def entries(kind):
+            counts = rng.poisson(self.means[kind], size=n)
+            owners = np.repeat(np.arange(n), counts)
+            m = len(owners)
+            doctors = np.where(rng.random(m) < PRIMARY_DOCTOR_SHARE, primary[owners], rng.integers(self.doctors, size=m))
+            dates = self.now - (rng.integers(5 * 365 * 24 * 60, size=m) * 60).astype('timedelta64[s]')
+            return counts, owners, doctors, dates
+
+        record_counts, owners, doctors, dates = entries('records')
+        record_ids = self._take_ids(MedicalRecord, len(owners))
+        record_doctors = self.doctor_ids[doctors]
+        tables.append((MedicalRecord, {
+            'id': record_ids,
+            'patient_id': patient_ids[owners],
+            'doctor_id': record_doctors,
+            'diagnosis': _pick(rng, DIAGNOSES, len(owners)),
+            'treatment': _pick(rng, TREATMENTS, len(owners)),
+            'date': dates,
+        }))
+        record_dates = dates
+
+        _, owners, doctors, dates = entries('prescriptions')
+        m = len(owners)
+        doctors = self.doctor_ids[doctors]
+        record = np.full(m, None, dtype=object)
+        if len(record_ids):
+            # Most prescriptions belong to one of the patient's own records, same doctor and date
+            linked = (record_counts[owners] > 0) & (rng.random(m) < 0.7)
+            first_record = np.concatenate(([0], np.cumsum(record_counts)[:-1]))
+            chosen = first_record[owners] + (rng.random(m) * record_counts[owners]).astype(np.int64)
+            chosen = np.minimum(chosen, len(record_ids) - 1)
+            record[linked] = record_ids[chosen[linked]].tolist()
+            doctors = np.where(linked, record_doctors[chosen], doctors)
+            dates = np.where(linked, record_dates[chosen], dates)
+        tables.append((Prescription, {
+            'patient_id': patient_ids[owners],
+            'doctor_id': doctors,
+            'medical_record_id': record,
+            'medication': _pick(rng, MEDICATIONS, m),
+            'dosage': _pick(rng, DOSAGES, m),
+            'instructions': np.full(m, 'With food', dtype=object),
+            'date': dates,
+        }))
+
+        _, owners, doctors, dates = entries('labs')
+        m = len(owners)
+        analyte = rng.integers(len(ANALYTES), size=m)
+        codes, names, units, mean, sd = (np.array(column)[analyte] for column in zip(*ANALYTES))
+        values = np.round(rng.normal(mean.astype(float), sd.astype(float)), 1)
+        tables.append((LabResult, {
+            'patient_id': patient_ids[owners],
+            'doctor_id': self.doctor_ids[doctors],
+            'test_name': names.astype(object),
+            'result': values.astype(str).astype(object) + ' ' + units.astype(object),
+            'date': dates,
+            'analyte_code': codes.astype(object),
+            'value_numeric': values,
+            'unit': units.astype(object),
+        }))
+
+        tables.append((Appointment, self._appointments(rng, *entries('appointments')[1:3], patient_ids)))
+        return tables
+
+    def _appointments(self, rng, owners, doctors, patient_ids):
+        m = len(owners)
+        order = np.argsort(doctors, kind='stable')
+        owners, doctors = owners[order], doctors[order]
+        # Each doctor's visits follow one another at random gaps, after the last slot they filled
+        running = np.cumsum(rng.geometric(self.gap_p, size=m))
+        first = np.flatnonzero(np.concatenate(([True], doctors[1:] != doctors[:-1]))) if m else np.array([], dtype=np.int64)
+        offset = np.repeat(np.concatenate(([0], running))[first], np.diff(np.append(first, m)))
+        slots = self.next_slot[doctors] + running - offset
+        if m:
+            last = np.append(first[1:], m) - 1
+            self.next_slot[doctors[last]] = slots[last]
+        weeks, weekday = np.divmod(slots // SLOTS_PER_DAY, 5)
+        times = (
+            self.schedule_start + (weeks * 7 + weekday).astype('timedelta64[D]')
+            + (slots % SLOTS_PER_DAY * SLOT_MINUTES).astype('timedelta64[m]')
+        ).astype('datetime64[s]')
+        past = times < self.now
+        status = np.where(
+            past,
+            np.where(rng.random(m) < 0.1, 'cancelled', 'completed'),
+            np.where(rng.random(m) < 0.7, 'confirmed', 'pending'),
+        ).astype(object)
+        return {
+            'patient_id': patient_ids[owners],
+            'doctor_id': self.doctor_ids[doctors],
+            'appointment_time': times,
+            'duration_minutes': np.full(m, SLOT_MINUTES),
+            'reason': _pick(rng, REASONS, m),
+            'status': status,
+        }
+
+
+def _copy_column(values):
+    if values.dtype.kind == 'M':
+        return np.datetime_as_string(values).tolist()
+    if values.dtype.kind == 'O':
+        return [r'\N' if value is None else str(value) for value in values]
+    return values.astype(str).tolist()
+
+
+def copy_rows(db, model, columns):
+    """Load one batch with COPY ... FROM STDIN (psycopg2 only).
+
+    Generated text never contains tabs, newlines or backslashes, so it needs
+    no escaping. Omitted columns such as updated_at take their server default.
+    """
+    names = list(columns)
+    data = '\n'.join('\t'.join(row) for row in zip(*(_copy_column(columns[name]) for name in names)))
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY {model.__tablename__} ({", ".join(names)}) FROM STDIN', io.StringIO(data + '\n'))
+    finally:
+        cursor.close()
+
+
+def insert_rows(db, model, columns):
+    """Load one batch with a single multi-row executemany INSERT."""
+    names = list(columns)
+    rows = [dict(zip(names, row)) for row in zip(*(columns[name].tolist() for name in names))]
+    if rows:
+        db.execute(insert(model.__table__), rows)
+
+
+def first_ids(db):
+    return {model: (db.query(func.max(model.id)).scalar() or 0) + 1 for model in ID_TABLES}
+
+
+def reset_sequences(db):
+    """Move Postgres id sequences past the ids the generator assigned itself."""
+    if db.get_bind().dialect.name != 'postgresql':
+        return
+    for model in ID_TABLES:
+        table = model.__tablename__
+        db.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT coalesce(max(id), 1) FROM {table}))"
+        ))
+
+
+def generated_count(db):
+    return db.query(func.count(User.id)).filter(User.username.like(f'{USERNAME_PREFIX}%')).scalar()
+
+
+def generate(db, patients, doctors, means, seed, as_of, password_hash, use_copy, progress=print):
+    """Generate and load the whole dataset, committing after every batch; returns rows per table.
+
+    Assumes nothing else writes to these tables while it runs, since it hands
+    out ids itself starting after the current maximum.
+    """
+    generator = Generator(seed, patients, doctors, means, first_ids(db), as_of)
+    load = copy_rows if use_copy else insert_rows
+    loaded = dict.fromkeys(model.__tablename__ for model in ID_TABLES + [DoctorAvailability, Prescription, LabResult, Appointment])
+
+    def load_batch(tables):
+        for model, columns in tables:
+            load(db, model, columns)
+            loaded[model.__tablename__] = (loaded[model.__tablename__] or 0) + len(next(iter(columns.values())))
+        db.commit()
+
+    for done, tables in generator.doctor_batches(password_hash):
+        load_batch(tables)
+        progress(f'doctors: {done}/{doctors}')
+    # Bulk inserts skip the mapper events that normally bump the directory version
+    directory.invalidate()
+    for done, tables in generator.patient_batches(password_hash):
+        load_batch(tables)
+        progress(f'patients: {done}/{patients}')
+    # Doctors' panels, derived from the loaded appointments and chart entries in one statement
+    loaded['doctor_patients'] = careteam.backfill(db)
+    reset_sequences(db)
+    db.commit()
+    return {table: count or 0 for table, count in loaded.items()}
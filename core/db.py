@@ -0,0 +1,123 @@
+import logging
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from sqlalchemy import event
+
+from .models import SessionLocal
+from .pool import check_for_leaks, pool_stats
+
+logger = logging.getLogger(__name__)
+
+# How often (seconds) each worker writes a pool status line to the log.
+POOL_STATS_LOG_INTERVAL = 60
+
+_last_stats_log = 0.0
+
+
+def read_only(view):
+    """Mark a view as safe to serve from a read replica."""
+    view.db_read_only = True
+    return view
+
+
+def pinned_to_primary(request):
+    """Read-your-writes: True for READ_REPLICA_STICKY_SECONDS after this user wrote something."""
+    pinned_until = request.session.get('db_primary_until', 0) if hasattr(request, 'session') else 0
+    return time.time() < pinned_until
+
+
+def _use_replica(request):
+    return getattr(request, 'db_read_only', False) and not pinned_to_primary(request)
+
+
+@event.listens_for(SessionLocal, 'after_flush')
+def _mark_write(session, flush_context):
+    session.info['wrote'] = True
+
+
+@contextmanager
+def session_scope(use_replica=False):
+    """Session for code that runs outside a request (management commands, scripts, streamed responses)."""
+    db = SessionLocal()
+    db.info['use_replica'] = use_replica
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+class DBSessionMiddleware:
+    """Give each request one lazily-opened ``request.db`` session and always close it.
+
+    Views marked with :func:`read_only` get a session that reads from a replica,
+    unless the user wrote something in the last READ_REPLICA_STICKY_SECONDS.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        opened = self._attach(request)
+        try:
+            return self.get_response(request)
+        finally:
+            self._close(request, opened)
+
+    async def __acall__(self, request):
+        # Async views use core.async_db; sync views still get request.db in their thread
+        opened = self._attach(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            if opened:
+                await sync_to_async(self._close)(request, opened)
+
+    def _attach(self, request):
+        opened = []
+
+        def open_session():
+            db = SessionLocal()
+            db.info['use_replica'] = _use_replica(request)
+            opened.append(db)
+            return db
+
+        request.db = SimpleLazyObject(open_session)
+        return opened
+
+    def _close(self, request, opened):
+        for db in opened:
+            if db.info.get('wrote') and hasattr(request, 'session'):
+                request.session['db_primary_until'] = time.time() + settings.READ_REPLICA_STICKY_SECONDS
+            db.close()
+        _log_pool_stats()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.db_read_only = getattr(view_func, 'db_read_only', False)
+
+
+def _log_pool_stats():
+    global _last_stats_log
+    now = time.monotonic()
+    if now - _last_stats_log < POOL_STATS_LOG_INTERVAL:
+        return
+    _last_stats_log = now
+    check_for_leaks()
+    stats = pool_stats()
+    logger.info(
+        'db pool: size=%d checked_out=%d overflow=%d checkouts=%d wait_avg=%.4fs wait_max=%.4fs '
+        'timeouts=%d overflow_checkouts=%d leak_warnings=%d',
+        stats['size'], stats['checked_out'], stats['overflow'], stats['checkouts'],
+        stats['checkout_wait_avg'], stats['checkout_wait_max'], stats['checkout_timeouts'],
+        stats['overflow_checkouts'], stats['leak_warnings'],
+    )
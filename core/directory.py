@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import namedtuple
+
+from django.core.cache import cache
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from .models import DoctorProfile, SessionLocal
+
+DirectoryEntry = namedtuple('DirectoryEntry', 'id full_name specialty')
+
+# Stored without a timeout, so the version only changes when invalidate() runs
+VERSION_KEY = 'doctor_directory:version'
+# How long a process trusts its copy and a cached list before checking again. With a
+# shared cache (REDIS_URL) invalidate() reaches every worker at once; with the default
+# per-process cache other workers only pick up a change after this long.
+TTL_SECONDS = 60
+
+_lock = threading.Lock()
+_local = {'version': None, 'entries': None, 'by_id': None, 'loaded_at': 0.0}
+
+
+def _new_version():
+    # Never reused, so entries cached under an evicted version can't come back
+    return time.time_ns()
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _new_version(), None)
+        version = cache.get(VERSION_KEY) or _new_version()
+    return version
+
+
+def _load():
+    # Always from the primary: a lagging replica would be cached under the new version
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(DoctorProfile.id, DoctorProfile.full_name, DoctorProfile.specialty)
+            .order_by(DoctorProfile.full_name, DoctorProfile.id)
+            .all()
+        )
+    finally:
+        db.close()
+    return [DirectoryEntry(id, full_name or f'Doctor {id}', specialty or '') for id, full_name, specialty in rows]
+
+
+def doctor_directory():
+    """All doctors as DirectoryEntry tuples sorted by name, plus an id -> entry dict.
+
+    Kept in this process and in the Django cache under a version number, for
+    at most TTL_SECONDS; a request costs one cache lookup of the version
+    unless a DoctorProfile changed since, in which case the list is fetched
+    from the cache or, failing that, rebuilt from the primary with one query.
+    """
+    version = current_version()
+    with _lock:
+        if _local['version'] == version and time.monotonic() - _local['loaded_at'] < TTL_SECONDS:
+            return _local['entries'], _local['by_id']
+    key = f'doctor_directory:{version}'
+    entries = cache.get(key)
+    if entries is None:
+        entries = _load()
+        cache.set(key, entries, TTL_SECONDS)
+    by_id = {entry.id: entry for entry in entries}
+    with _lock:
+        _local.update(version=version, entries=entries, by_id=by_id, loaded_at=time.monotonic())
+    return entries, by_id
+
+
+def invalidate():
+    """Start a new directory version; this process reloads at once, others see it via the cache (see TTL_SECONDS)."""
+    cache.set(VERSION_KEY, _new_version(), None)
+    with _lock:
+        _local['version'] = None
+
+
+def specialties(entries):
+    return sorted({entry.specialty for entry in entries if entry.specialty})
+
+
+def search_directory(entries, text='', specialty='', limit=10):
+    """Doctors whose name contains every word of ``text``, optionally limited to one specialty."""
+    words = text.lower().split()
+    specialty = specialty.lower()
+    results = []
+    for entry in entries:
+        if specialty and entry.specialty.lower() != specialty:
+            continue
+        name = entry.full_name.lower()
+        if all(word in name for word in words):
+            results.append(entry)
+            if len(results) >= limit:
+                break
+    return results
+
+
+# A DoctorProfile insert/update/delete marks the session; the version is bumped only once it commits
+@event.listens_for(DoctorProfile, 'after_insert')
+@event.listens_for(DoctorProfile, 'after_update')
+@event.listens_for(DoctorProfile, 'after_delete')
+def _mark_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['doctor_directory_changed'] = True
+
+
+@event.listens_for(SessionLocal, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop('doctor_directory_changed', False):
+        invalidate()
+
+
+@event.listens_for(SessionLocal, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('doctor_directory_changed', None)
@@ -0,0 +1,139 @@
+import csv
+import datetime
+import io
+import json
+import zlib
+
+from django.http import StreamingHttpResponse
+from sqlalchemy import select
+
+from .db import session_scope
+from .models import Appointment, DoctorPatient, PatientProfile
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 2000
+
+APPOINTMENT_COLUMNS = {
+    'id': Appointment.id,
+    'appointment_time': Appointment.appointment_time,
+    'status': Appointment.status,
+    'reason': Appointment.reason,
+    'patient_id': Appointment.patient_id,
+    'patient_name': PatientProfile.full_name,
+    'patient_phone': PatientProfile.phone,
+}
+
+PATIENT_COLUMNS = {
+    'id': PatientProfile.id,
+    'full_name': PatientProfile.full_name,
+    'date_of_birth': PatientProfile.date_of_birth,
+    'phone': PatientProfile.phone,
+    'address': PatientProfile.address,
+}
+
+# Spreadsheets run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def select_columns(available, requested):
+    """Pick the requested columns (comma-separated names) in order; all of them when empty."""
+    if not requested:
+        return dict(available)
+    names = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ExportError(f"Unknown column(s): {', '.join(unknown)}. Available: {', '.join(available)}.")
+    return {name: available[name] for name in names}
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _encode(batches, names, fmt):
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+        for rows in batches:
+            writer.writerows([_csv_cell(value) for value in row] for row in rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    else:
+        for rows in batches:
+            yield ''.join(json.dumps(dict(zip(names, row)), default=_json_default) + '\n' for row in rows)
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _stream_rows(statement, use_replica):
+    """Yield lists of rows from a server-side cursor; memory stays at one batch."""
+    with session_scope(use_replica=use_replica) as db:
+        result = db.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for partition in result.partitions():
+            yield partition
+
+
+def export_response(statement, names, fmt, filename, compress=False, use_replica=False):
+    """StreamingHttpResponse that encodes ``statement``'s rows as CSV or NDJSON while they are read.
+
+    CSV cells that a spreadsheet would run as a formula get a leading ``'``.
+    """
+    content_type, extension = FORMATS[fmt]
+    chunks = _encode(_stream_rows(statement, use_replica), names, fmt)
+    filename = f'{filename}.{extension}'
+    if compress:
+        chunks = _gzip(chunks)
+        content_type = 'application/gzip'
+        filename += '.gz'
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def appointments_statement(doctor_id, columns):
+    return (
+        select(*columns.values())
+        .select_from(Appointment)
+        .outerjoin(PatientProfile, Appointment.patient_id == PatientProfile.id)
+        .where(Appointment.doctor_id == doctor_id)
+        .order_by(Appointment.appointment_time, Appointment.id)
+    )
+
+
+def patients_statement(doctor_id, columns):
+    """The doctor's care-team panel."""
+    return (
+        select(*columns.values())
+        .select_from(PatientProfile)
+        .join(DoctorPatient, DoctorPatient.patient_id == PatientProfile.id)
+        .where(DoctorPatient.doctor_id == doctor_id)
+        .order_by(PatientProfile.full_name, PatientProfile.id)
+    )
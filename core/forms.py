@@ -74,6 +74,20 @@ class LabResultForm(forms.Form):
     test_name = forms.CharField(max_length=255, required=True)
     result = forms.CharField(widget=forms.Textarea, required=True)
     date = forms.DateTimeField(widget=forms.DateTimeInput(attrs={'type': 'datetime-local'}), required=True)
+    analyte_code = forms.CharField(max_length=32, required=False, label='Analyte code (optional, e.g. GLU)')
+    value_numeric = forms.FloatField(required=False, label='Numeric value (optional)')
+    unit = forms.CharField(max_length=32, required=False, label='Unit (optional, e.g. mmol/L)')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        code = (cleaned_data.get('analyte_code') or '').strip().upper()
+        cleaned_data['analyte_code'] = code or None
+        cleaned_data['unit'] = (cleaned_data.get('unit') or '').strip() or None
+        if cleaned_data.get('value_numeric') is not None and not code:
+            self.add_error('analyte_code', 'An analyte code is required with a numeric value.')
+        if code and cleaned_data.get('value_numeric') is None and 'value_numeric' not in self.errors:
+            self.add_error('value_numeric', 'A numeric value is required with an analyte code.')
+        return cleaned_data
 
 class PrescriptionForm(forms.Form):
     medication = forms.CharField(max_length=255, required=True)
@@ -81,6 +95,48 @@ class PrescriptionForm(forms.Form):
     instructions = forms.CharField(widget=forms.Textarea, required=True)
     date = forms.DateTimeField(widget=forms.DateTimeInput(attrs={'type': 'datetime-local'}), required=True)
 
+WEEKDAY_CHOICES = [
+    (0, 'Monday'),
+    (1, 'Tuesday'),
+    (2, 'Wednesday'),
+    (3, 'Thursday'),
+    (4, 'Friday'),
+    (5, 'Saturday'),
+    (6, 'Sunday'),
+]
+
+class AvailabilityForm(forms.Form):
+    weekday = forms.TypedChoiceField(choices=WEEKDAY_CHOICES, coerce=int, required=True)
+    start_time = forms.TimeField(widget=forms.TimeInput(attrs={'type': 'time'}), required=True)
+    end_time = forms.TimeField(widget=forms.TimeInput(attrs={'type': 'time'}), required=True)
+    slot_minutes = forms.IntegerField(min_value=5, max_value=240, initial=30, required=True, label='Slot length (minutes)')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start_time'), cleaned_data.get('end_time')
+        if start and end and end <= start:
+            self.add_error('end_time', 'End time must be after start time.')
+        return cleaned_data
+
+class AvailabilityExceptionForm(forms.Form):
+    date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}), required=True)
+    start_time = forms.TimeField(widget=forms.TimeInput(attrs={'type': 'time'}), required=False, label='Start time (empty for the whole day)')
+    end_time = forms.TimeField(widget=forms.TimeInput(attrs={'type': 'time'}), required=False, label='End time (empty for the whole day)')
+    available = forms.BooleanField(required=False, label='Extra working hours (leave unticked for time off)')
+    slot_minutes = forms.IntegerField(min_value=5, max_value=240, initial=30, required=True, label='Slot length (minutes)')
+    reason = forms.CharField(max_length=255, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start_time'), cleaned_data.get('end_time')
+        if bool(start) != bool(end):
+            self.add_error('end_time', 'Give both a start and an end time, or neither.')
+        elif start and end and end <= start:
+            self.add_error('end_time', 'End time must be after start time.')
+        elif cleaned_data.get('available') and not start:
+            self.add_error('start_time', 'Extra working hours need a start and an end time.')
+        return cleaned_data
+
 class ChangePasswordForm(forms.Form):
     old_password = forms.CharField(widget=forms.PasswordInput, required=True)
     new_password = forms.CharField(widget=forms.PasswordInput, required=True)
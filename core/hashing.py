@@ -0,0 +1,128 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from werkzeug.security import check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+# How often (seconds) each worker writes a hashing status line to the log.
+HASH_STATS_LOG_INTERVAL = 60
+
+_lock = threading.Lock()
+_stats = {
+    'hashes': 0,
+    'hash_time_total': 0.0,
+    'hash_time_max': 0.0,
+    'verifies': 0,
+    'verify_time_total': 0.0,
+    'verify_time_max': 0.0,
+    'rehashes': 0,
+    'busy_rejections': 0,
+}
+_COUNTERS = {'hash': 'hashes', 'verify': 'verifies'}
+_executor = None
+_executor_pid = None
+_slots = None
+_method_prefixes = {}
+_last_stats_log = 0.0
+
+
+class HashingBusy(Exception):
+    """Too many hashes are already queued; the caller should ask the user to retry."""
+
+
+def _get_executor():
+    """Process pool for this (forked) worker, created on first use."""
+    global _executor, _executor_pid, _slots
+    with _lock:
+        if _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS)
+            _slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_WORKERS * settings.PASSWORD_HASH_QUEUE_FACTOR)
+            _executor_pid = os.getpid()
+        return _executor, _slots
+
+
+def _run(kind, func, *args):
+    start = time.perf_counter()
+    if settings.PASSWORD_HASH_WORKERS <= 0:
+        result = func(*args)
+    else:
+        executor, slots = _get_executor()
+        if not slots.acquire(timeout=settings.PASSWORD_HASH_TIMEOUT):
+            with _lock:
+                _stats['busy_rejections'] += 1
+            raise HashingBusy()
+        try:
+            result = executor.submit(func, *args).result()
+        finally:
+            slots.release()
+    elapsed = time.perf_counter() - start
+    with _lock:
+        _stats[_COUNTERS[kind]] += 1
+        _stats[f'{kind}_time_total'] += elapsed
+        if elapsed > _stats[f'{kind}_time_max']:
+            _stats[f'{kind}_time_max'] = elapsed
+    _log_stats()
+    return result
+
+
+def hash_password(password):
+    """Hash ``password`` with PASSWORD_HASH_METHOD, off the request thread."""
+    return _run('hash', generate_password_hash, password, settings.PASSWORD_HASH_METHOD)
+
+
+def verify_password(password_hash, password):
+    """Check ``password``; returns ``(ok, needs_rehash)``.
+
+    ``needs_rehash`` is true when the stored hash was made with a method or
+    work factor other than the current PASSWORD_HASH_METHOD.
+    """
+    ok = _run('verify', check_password_hash, password_hash, password)
+    return ok, ok and password_hash.split('$', 1)[0] != _current_prefix()
+
+
+def verify_and_upgrade(db, user, password):
+    """Verify ``user``'s password and store a fresh hash if the parameters changed."""
+    ok, needs_rehash = verify_password(user.password_hash, password)
+    if needs_rehash:
+        user.password_hash = hash_password(password)
+        db.commit()
+        with _lock:
+            _stats['rehashes'] += 1
+    return ok
+
+
+def _current_prefix():
+    """werkzeug's normalised form of PASSWORD_HASH_METHOD, e.g. 'scrypt' -> 'scrypt:32768:8:1'."""
+    method = settings.PASSWORD_HASH_METHOD
+    if method not in _method_prefixes:
+        _method_prefixes[method] = generate_password_hash('', method).split('$', 1)[0]
+    return _method_prefixes[method]
+
+
+def hashing_stats():
+    with _lock:
+        stats = dict(_stats)
+    stats['hash_time_avg'] = stats['hash_time_total'] / stats['hashes'] if stats['hashes'] else 0.0
+    stats['verify_time_avg'] = stats['verify_time_total'] / stats['verifies'] if stats['verifies'] else 0.0
+    return stats
+
+
+def _log_stats():
+    global _last_stats_log
+    now = time.monotonic()
+    if now - _last_stats_log < HASH_STATS_LOG_INTERVAL:
+        return
+    _last_stats_log = now
+    stats = hashing_stats()
+    logger.info(
+        'password hashing: method=%s hashes=%d hash_avg=%.4fs hash_max=%.4fs verifies=%d verify_avg=%.4fs '
+        'verify_max=%.4fs rehashes=%d busy=%d',
+        settings.PASSWORD_HASH_METHOD, stats['hashes'], stats['hash_time_avg'], stats['hash_time_max'],
+        stats['verifies'], stats['verify_time_avg'], stats['verify_time_max'], stats['rehashes'],
+        stats['busy_rejections'],
+    )
@@ -0,0 +1,320 @@
+import datetime
+import http.cookiejar
+import json
+import math
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from sqlalchemy import func, insert
+
+from . import careteam, directory
+from .models import (
+    Appointment, DoctorAvailability, DoctorProfile, LabResult, MedicalRecord, PatientProfile, Prescription, User,
+    normalize_phone,
+)
+
+USERNAME_PREFIX = 'loadtest-'
+EMAIL_DOMAIN = 'loadtest.invalid'
+SEED_BATCH_SIZE = 2000
+
+FIRST_NAMES = ['Ada', 'Ben', 'Chloe', 'Dev', 'Elena', 'Farid', 'Grace', 'Hugo', 'Ines', 'Jon', 'Kira', 'Liam', 'Maya', 'Noah', 'Omar', 'Priya']
+LAST_NAMES = ['Adams', 'Baker', 'Chen', 'Diaz', 'Evans', 'Fischer', 'Garcia', 'Hughes', 'Ivanova', 'Jones', 'Khan', 'Lopez', 'Meyer', 'Novak']
+SPECIALTIES = ['Cardiology', 'Dermatology', 'Endocrinology', 'Family Medicine', 'Neurology', 'Oncology', 'Pediatrics', 'Psychiatry']
+DIAGNOSES = ['Hypertension', 'Type 2 diabetes', 'Asthma', 'Migraine', 'Hypothyroidism', 'Anxiety disorder', 'Back pain']
+MEDICATIONS = ['Metformin', 'Lisinopril', 'Atorvastatin', 'Levothyroxine', 'Salbutamol', 'Sertraline', 'Ibuprofen']
+ANALYTES = [('GLU', 'Glucose', 'mmol/L', 5.5, 1.2), ('HBA1C', 'HbA1c', '%', 6.0, 0.8), ('LDL', 'LDL cholesterol', 'mmol/L', 3.0, 0.7)]
+
+
+def username(role, index):
+    return f'{USERNAME_PREFIX}{role}-{index}'
+
+
+def _insert_returning_ids(db, model, rows):
+    return db.execute(insert(model).returning(model.id, sort_by_parameter_order=True), rows).scalars().all()
+
+
+def _synthetic_users(role, start, stop, password_hash):
+    return [
+        {'username': username(role, i), 'email': f'{username(role, i)}@{EMAIL_DOMAIN}', 'password_hash': password_hash, 'role': role}
+        for i in range(start, stop)
+    ]
+
+
+def seeded_count(db, role):
+    return db.query(func.count(User.id)).filter(User.username.like(f'{USERNAME_PREFIX}{role}-%')).scalar()
+
+
+def seed(db, patients, doctors, records, rng, password_hash, progress=print):
+    """Create synthetic doctors and patients with chart data until the given counts exist.
+
+    Users are named loadtest-doctor-N / loadtest-patient-N and share
+    ``password_hash``; running it again only adds what is missing. Rows go in
+    with bulk INSERTs of SEED_BATCH_SIZE users at a time.
+    """
+    now = datetime.datetime.now().replace(second=0, microsecond=0)
+    start = seeded_count(db, 'doctor')
+    for batch_start in range(start, doctors, SEED_BATCH_SIZE):
+        batch_stop = min(batch_start + SEED_BATCH_SIZE, doctors)
+        user_ids = _insert_returning_ids(db, User, _synthetic_users('doctor', batch_start, batch_stop, password_hash))
+        doctor_ids = _insert_returning_ids(db, DoctorProfile, [
+            {'user_id': user_id, 'full_name': f'Dr {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+             'specialty': rng.choice(SPECIALTIES), 'phone': f'555{rng.randrange(10**7):07d}'}
+            for user_id in user_ids
+        ])
+        db.execute(insert(DoctorAvailability), [
+            {'doctor_id': doctor_id, 'weekday': weekday, 'start_time': datetime.time(9), 'end_time': datetime.time(17), 'slot_minutes': 30}
+            for doctor_id in doctor_ids for weekday in range(5)
+        ])
+        db.commit()
+        progress(f'doctors: {batch_stop}/{doctors}')
+    if doctors > start:
+        # Bulk inserts skip the mapper events that normally bump the directory version
+        directory.invalidate()
+
+    doctor_ids = [id for (id,) in db.query(DoctorProfile.id).join(User).filter(User.username.like(f'{USERNAME_PREFIX}doctor-%'))]
+    if not doctor_ids:
+        return
+    # Past appointments take consecutive slots per doctor, so they never overlap
+    next_slot = {doctor_id: now - datetime.timedelta(days=365) for doctor_id in doctor_ids}
+    start = seeded_count(db, 'patient')
+    for batch_start in range(start, patients, SEED_BATCH_SIZE):
+        batch_stop = min(batch_start + SEED_BATCH_SIZE, patients)
+        user_ids = _insert_returning_ids(db, User, _synthetic_users('patient', batch_start, batch_stop, password_hash))
+        patient_ids = _insert_returning_ids(db, PatientProfile, [
+            {'user_id': user_id, 'full_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+             'date_of_birth': datetime.date(1940, 1, 1) + datetime.timedelta(days=rng.randrange(80 * 365)),
+             'address': f'{rng.randrange(1, 999)} Main Street', 'phone': phone, 'phone_normalized': normalize_phone(phone)}
+            for user_id, phone in zip(user_ids, (f'+1 555-{rng.randrange(10**7):07d}' for _ in user_ids))
+        ])
+        chart = defaultdict(list)
+        for patient_id in patient_ids:
+            for _ in range(rng.randint(0, 2 * records)):
+                doctor_id = rng.choice(doctor_ids)
+                date = now - datetime.timedelta(minutes=rng.randrange(5 * 365 * 24 * 60))
+                kind = rng.random()
+                if kind < 0.3:
+                    chart[MedicalRecord].append({'patient_id': patient_id, 'doctor_id': doctor_id, 'date': date,
+                                                 'diagnosis': rng.choice(DIAGNOSES), 'treatment': 'Follow-up in 3 months'})
+                elif kind < 0.7:
+                    code, name, unit, mean, sd = rng.choice(ANALYTES)
+                    value = round(rng.gauss(mean, sd), 1)
+                    chart[LabResult].append({'patient_id': patient_id, 'doctor_id': doctor_id, 'date': date, 'test_name': name,
+                                             'result': f'{value} {unit}', 'analyte_code': code, 'value_numeric': value, 'unit': unit})
+                elif kind < 0.9:
+                    chart[Prescription].append({'patient_id': patient_id, 'doctor_id': doctor_id, 'date': date,
+                                                'medication': rng.choice(MEDICATIONS), 'dosage': '1 tablet daily', 'instructions': 'With food'})
+                else:
+                    slot = next_slot[doctor_id]
+                    next_slot[doctor_id] = slot + datetime.timedelta(minutes=30)
+                    chart[Appointment].append({'patient_id': patient_id, 'doctor_id': doctor_id, 'appointment_time': slot,
+                                               'duration_minutes': 30, 'reason': 'Check-up', 'status': 'completed'})
+        for model, rows in chart.items():
+            db.execute(insert(model), rows)
+        db.commit()
+        progress(f'patients: {batch_stop}/{patients}')
+    if patients > start:
+        # Bulk inserts bypass the views that keep doctors' panels current
+        careteam.backfill(db)
+        db.commit()
+
+
+class _SecureCookiesOverHttp(http.cookiejar.DefaultCookiePolicy):
+    # The app sets Secure session and CSRF cookies; send them to a plain-http test server too
+    def return_ok_secure(self, cookie, request):
+        return True
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Recorder:
+    """Thread-safe latency samples per endpoint."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, endpoint, seconds, ok):
+        with self.lock:
+            self.samples[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+
+class VirtualUser:
+    """One logged-in browser: its own cookies, talking to the server over HTTP."""
+
+    def __init__(self, base_url, recorder, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar(policy=_SecureCookiesOverHttp())
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect)
+
+    def request(self, endpoint, path, data=None, ok=(200, 302, 304)):
+        """Time one request and record it under ``endpoint``; returns (status, body)."""
+        url = self.base_url + path
+        headers = {'Referer': url}
+        if data is not None:
+            data = urllib.parse.urlencode({**data, 'csrfmiddlewaretoken': self.csrf_token()}).encode()
+        request = urllib.request.Request(url, data=data, headers=headers)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status, body = response.status, response.read()
+        except urllib.error.HTTPError as error:
+            status, body = error.code, error.read()
+        except (urllib.error.URLError, OSError):
+            status, body = 0, b''
+        self.recorder.add(endpoint, time.perf_counter() - start, status in ok)
+        return status, body
+
+    def get(self, endpoint, path, **kw):
+        return self.request(endpoint, path, **kw)
+
+    def post(self, endpoint, path, data, **kw):
+        return self.request(f'{endpoint} POST', path, data=data, **kw)
+
+    def csrf_token(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def login(self, username, password, role):
+        self.get('login', '/login/')
+        status, _ = self.post('login', '/login/', {'username': username, 'password': password, 'role': role}, ok=(302,))
+        return status == 302
+
+
+_SLOT = re.compile(rb'value="(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)"')
+
+
+def _form_date(rng):
+    return (datetime.datetime.now() - datetime.timedelta(days=rng.randrange(30))).strftime('%Y-%m-%dT%H:%M')
+
+
+def _book(user, rng, data):
+    week = datetime.date.today() + datetime.timedelta(weeks=rng.randint(1, 8))
+    doctor_id = rng.choice(data['doctor_ids'])
+    _, body = user.get('book_appointment', f'/patient/book-appointment/?doctor_id={doctor_id}&week={week.isoformat()}')
+    slots = _SLOT.findall(body)
+    if slots:
+        # 200 means somebody else got the slot first, which is expected under load
+        user.post('book_appointment', '/patient/book-appointment/',
+                  {'doctor_id': doctor_id, 'slot': rng.choice(slots).decode(), 'reason': 'Load test'}, ok=(200, 302))
+
+
+def _patient_chart(name, path):
+    return lambda user, rng, data: user.get(name, path.format(patient_id=rng.choice(data['patient_ids'])))
+
+
+# (weight, action) pairs; each action makes one or more timed requests
+PATIENT_MIX = [
+    (5, lambda user, rng, data: user.get('home', '/')),
+    (10, lambda user, rng, data: user.get('dashboard', '/dashboard/')),
+    (5, lambda user, rng, data: user.get('patient_profile', '/patient/profile/')),
+    (15, lambda user, rng, data: user.get('patient_lab_results', '/patient/lab-results/')),
+    (10, lambda user, rng, data: user.get('patient_prescriptions', '/patient/prescriptions/')),
+    (10, lambda user, rng, data: user.get('patient_medical_history', '/patient/medical-history/')),
+    (10, lambda user, rng, data: user.get('patient_appointments', '/patient/appointments/')),
+    (10, lambda user, rng, data: user.get('doctor_search', f'/doctors/search/?q={rng.choice(LAST_NAMES)[:3]}')),
+    (6, _book),
+    (2, lambda user, rng, data: user.get('change_password', '/change-password/')),
+    (1, lambda user, rng, data: user.get('register', '/register/')),
+]
+
+DOCTOR_MIX = [
+    (5, lambda user, rng, data: user.get('dashboard', '/dashboard/')),
+    (10, lambda user, rng, data: user.get('doctor_appointments', '/doctor/appointments/')),
+    (3, lambda user, rng, data: user.get('doctor_availability', '/doctor/availability/')),
+    (5, lambda user, rng, data: user.get('doctor_patients', '/doctor/patients/')),
+    (10, lambda user, rng, data: user.get('doctor_patient_search', f'/doctor/patients/search/?q={rng.choice(LAST_NAMES)[:4]}')),
+    (10, _patient_chart('patient_profile_view', '/patient/profile/{patient_id}/')),
+    (10, _patient_chart('doctor_patient_medical_history', '/doctor/patient/{patient_id}/medical-history/')),
+    (10, _patient_chart('doctor_patient_lab_results', '/doctor/patient/{patient_id}/lab-results/')),
+    (5, _patient_chart('doctor_patient_lab_trends', '/doctor/patient/{patient_id}/lab-trends/')),
+    (10, _patient_chart('doctor_patient_prescriptions', '/doctor/patient/{patient_id}/prescriptions/')),
+    (10, _patient_chart('doctor_patient_timeline', '/doctor/patient/{patient_id}/timeline/')),
+    (2, lambda user, rng, data: user.get('edit_medical_record', f'/doctor/medical-record/{rng.choice(data["record_ids"])}/edit/')),
+    (2, lambda user, rng, data: user.post('add_medical_record', f'/doctor/patient/{rng.choice(data["patient_ids"])}/add-medical-record/',
+                                          {'diagnosis': rng.choice(DIAGNOSES), 'treatment': 'Rest', 'date': _form_date(rng)})),
+    (2, lambda user, rng, data: user.post('add_lab_result', f'/doctor/patient/{rng.choice(data["patient_ids"])}/add-lab-result/',
+                                          {'test_name': 'Glucose', 'result': '5.4', 'date': _form_date(rng),
+                                           'analyte_code': 'GLU', 'value_numeric': '5.4', 'unit': 'mmol/L'})),
+    (2, lambda user, rng, data: user.post('add_prescription', f'/doctor/patient/{rng.choice(data["patient_ids"])}/add-prescription/',
+                                          {'medication': rng.choice(MEDICATIONS), 'dosage': '1 daily', 'instructions': 'With food',
+                                           'date': _form_date(rng)})),
+    (1, lambda user, rng, data: user.get('doctor_appointments_export', '/doctor/appointments/export/')),
+    (1, lambda user, rng, data: user.get('doctor_patients_export', '/doctor/patients/export/')),
+]
+
+
+def run_user(base_url, role, index, password, data, recorder, rng, deadline, think_time):
+    """Log in as loadtest-<role>-<index> and run the role's mix until ``deadline``."""
+    user = VirtualUser(base_url, recorder)
+    if not user.login(username(role, index), password, role):
+        return
+    weights, actions = zip(*(PATIENT_MIX if role == 'patient' else DOCTOR_MIX))
+    while time.monotonic() < deadline:
+        rng.choices(actions, weights)[0](user, rng, data)
+        if think_time:
+            time.sleep(rng.expovariate(1 / think_time))
+    user.get('logout', '/logout/')
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def summarize(samples, errors, duration):
+    values = sorted(samples)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'throughput_rps': round(len(values) / duration, 3) if duration else None,
+        'mean_ms': round(1000 * sum(values) / len(values), 2) if values else None,
+        **{f'p{p}_ms': round(1000 * percentile(values, p / 100), 2) if values else None for p in (50, 95, 99)},
+        'max_ms': round(1000 * values[-1], 2) if values else None,
+    }
+
+
+def build_report(recorder, duration, meta):
+    every = [value for samples in recorder.samples.values() for value in samples]
+    return {
+        'meta': meta,
+        'total': summarize(every, sum(recorder.errors.values()), duration),
+        'endpoints': {
+            endpoint: summarize(samples, recorder.errors[endpoint], duration)
+            for endpoint, samples in sorted(recorder.samples.items())
+        },
+    }
+
+
+def compare_reports(baseline, current, metric='p95_ms', threshold=0.10):
+    """Rows of (endpoint, baseline, current, relative change, regressed) for ``metric``."""
+    rows = []
+    endpoints = {'(total)': (baseline['total'], current['total'])}
+    for endpoint, stats in current['endpoints'].items():
+        if endpoint in baseline['endpoints']:
+            endpoints[endpoint] = (baseline['endpoints'][endpoint], stats)
+    for endpoint, (before, after) in endpoints.items():
+        old, new = before.get(metric), after.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        rows.append((endpoint, old, new, change, change > threshold))
+    return rows
+
+
+def load_report(path):
+    with open(path) as handle:
+        return json.load(handle)
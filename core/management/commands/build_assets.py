@@ -0,0 +1,137 @@
+import posixpath
+import re
+import urllib.request
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+BOOTSTRAP = 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist'
+FONT_AWESOME = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0'
+GOOGLE_FONTS_CSS = 'https://fonts.googleapis.com/css2?family=Montserrat:wght@400;700&display=swap'
+# Google Fonts only serves woff2 to user agents it knows support it
+BROWSER_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+
+FONT_AWESOME_WEBFONTS = [
+    f'{name}.{ext}'
+    for name in ('fa-brands-400', 'fa-regular-400', 'fa-solid-900', 'fa-v4compatibility')
+    for ext in ('woff2', 'ttf')
+]
+
+# Paths are relative to the first STATICFILES_DIRS entry (static/)
+VENDOR_FILES = {
+    'vendor/bootstrap/bootstrap.min.css': f'{BOOTSTRAP}/css/bootstrap.min.css',
+    'vendor/bootstrap/bootstrap.bundle.min.js': f'{BOOTSTRAP}/js/bootstrap.bundle.min.js',
+    'vendor/fontawesome/css/all.min.css': f'{FONT_AWESOME}/css/all.min.css',
+    **{f'vendor/fontawesome/webfonts/{name}': f'{FONT_AWESOME}/webfonts/{name}' for name in FONT_AWESOME_WEBFONTS},
+}
+MONTSERRAT_CSS = 'vendor/montserrat/montserrat.css'
+
+BUNDLES = {
+    'dist/app.css': [
+        'vendor/bootstrap/bootstrap.min.css',
+        'vendor/fontawesome/css/all.min.css',
+        MONTSERRAT_CSS,
+        'css/site.css',
+    ],
+    'dist/app.js': [
+        'vendor/bootstrap/bootstrap.bundle.min.js',
+        'js/site.js',
+    ],
+}
+
+_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+_SOURCE_MAP = re.compile(r'^\s*(/\*# sourceMappingURL=[^*]*\*/|//# sourceMappingURL=\S+)\s*$', re.M)
+_CSS_COMMENT = re.compile(r'/\*(?!!).*?\*/', re.S)
+
+
+def _fetch(url, user_agent=None):
+    request = urllib.request.Request(url, headers={'User-Agent': user_agent or 'pmc-build-assets'})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.read()
+
+
+def _strip_source_maps(data):
+    # The .map files are not vendored; a dangling reference breaks ManifestStaticFilesStorage
+    return _SOURCE_MAP.sub('', data.decode()).encode()
+
+
+def minify_css(css):
+    """Drop comments (except /*! licences */) and insignificant whitespace."""
+    css = _CSS_COMMENT.sub('', css)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip() + '\n'
+
+
+def rebase_css_urls(css, source, target):
+    """Rewrite relative url()s in ``source`` so they still resolve from ``target``."""
+    def rebase(match):
+        url = match.group(2).strip()
+        if url.startswith(('data:', 'http:', 'https:', '/', '#')):
+            return match.group(0)
+        path, _, suffix = url.partition('?')
+        path, hash_sep, fragment = path.partition('#')
+        resolved = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+        rebased = posixpath.relpath(resolved, posixpath.dirname(target))
+        return f"url('{rebased}{hash_sep}{fragment}{'?' + suffix if suffix else ''}')"
+    return _URL.sub(rebase, css)
+
+
+class Command(BaseCommand):
+    help = (
+        'Vendor Bootstrap, Font Awesome and Montserrat into static/vendor/ and bundle them with the '
+        'site CSS/JS into static/dist/. Run before collectstatic, which fingerprints and precompresses them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refresh', action='store_true', help='Download vendored files again even if present.')
+        parser.add_argument('--offline', action='store_true', help='Only bundle; fail instead of downloading.')
+
+    def handle(self, *args, **options):
+        root = Path(settings.STATICFILES_DIRS[0])
+        for relative, url in VENDOR_FILES.items():
+            self._vendor(root / relative, lambda url=url: _strip_source_maps(_fetch(url)), options)
+        self._vendor(root / MONTSERRAT_CSS, lambda: self._google_fonts(root), options)
+        for target, sources in BUNDLES.items():
+            self._bundle(root, target, sources)
+
+    def _vendor(self, path, download, options):
+        if path.exists() and not options['refresh']:
+            return
+        if options['offline']:
+            raise CommandError(f'{path} is missing; run without --offline to download it.')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(download())
+        self.stdout.write(f'Vendored {path}')
+
+    def _google_fonts(self, root):
+        """Download the Montserrat CSS and its font files, pointing the CSS at the local copies."""
+        css = _fetch(GOOGLE_FONTS_CSS, BROWSER_USER_AGENT).decode()
+        font_dir = root / posixpath.dirname(MONTSERRAT_CSS)
+        font_dir.mkdir(parents=True, exist_ok=True)
+
+        def localise(match):
+            url = match.group(2)
+            if not url.startswith('https://fonts.gstatic.com/'):
+                return match.group(0)
+            name = '-'.join(url.split('/')[-3:])
+            (font_dir / name).write_bytes(_fetch(url))
+            return f"url('{name}')"
+        return _URL.sub(localise, css).encode()
+
+    def _bundle(self, root, target, sources):
+        parts = []
+        for source in sources:
+            text = (root / source).read_text()
+            if target.endswith('.css'):
+                text = rebase_css_urls(text, source, target)
+                if not source.startswith('vendor/'):
+                    text = minify_css(text)
+            parts.append(text if text.endswith('\n') else text + '\n')
+        separator = '' if target.endswith('.css') else ';\n'
+        path = root / target
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(separator.join(parts))
+        self.stdout.write(f'Bundled {path} ({path.stat().st_size} bytes)')
@@ -0,0 +1,19 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.management.commands import collectstatic
+from django.core.management.base import CommandError
+
+from .build_assets import BUNDLES
+
+
+class Command(collectstatic.Command):
+    help = 'Check that build_assets has produced static/dist/, then collect static files.'
+
+    def handle(self, **options):
+        # Every page links the bundles through the manifest; deploying without them fails every page off DEBUG
+        root = Path(settings.STATICFILES_DIRS[0])
+        missing = [target for target in BUNDLES if not (root / target).exists()]
+        if missing:
+            raise CommandError(f'{", ".join(missing)} missing from {root}; run `manage.py build_assets` first.')
+        return super().handle(**options)
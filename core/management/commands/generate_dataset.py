@@ -0,0 +1,57 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import datagen
+from core.db import session_scope
+from core.hashing import hash_password
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a large, reproducible synthetic dataset (doctors, patients, records, prescriptions, labs and '
+        'appointments) with numpy and bulk-load it with COPY on Postgres or multi-row INSERTs elsewhere.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=100000, help='Patients to generate.')
+        parser.add_argument('--doctors', type=int, help='Doctors to generate (default: one per 500 patients).')
+        parser.add_argument('--records', type=float, default=3, help='Mean medical records per patient.')
+        parser.add_argument('--prescriptions', type=float, default=2, help='Mean prescriptions per patient.')
+        parser.add_argument('--labs', type=float, default=6, help='Mean lab results per patient.')
+        parser.add_argument('--appointments', type=float, default=4, help='Mean appointments per patient.')
+        parser.add_argument('--random-seed', type=int, default=1, help='Same seed, same data.')
+        parser.add_argument(
+            '--as-of', type=datetime.date.fromisoformat, default=datetime.date.today(),
+            help='Date the data is generated relative to (YYYY-MM-DD, default today); fix it to reproduce a dataset exactly.',
+        )
+        parser.add_argument('--password', default='Dataset#2026', help='Password of every generated user.')
+        parser.add_argument('--no-copy', action='store_true', help='Use multi-row INSERTs even on Postgres.')
+
+    def handle(self, *args, **options):
+        patients = options['patients']
+        doctors = options['doctors'] if options['doctors'] is not None else max(1, patients // 500)
+        if patients < 0 or doctors < 1:
+            raise CommandError('Need at least one doctor and a non-negative number of patients.')
+        means = {kind: options[kind] for kind in ('records', 'prescriptions', 'labs', 'appointments')}
+        expected = doctors * 7 + patients * (2 + sum(means.values()))
+        # One hash for every generated user; hashing millions of passwords would dominate the run
+        password_hash = hash_password(options['password'])
+        with session_scope() as db:
+            if datagen.generated_count(db):
+                raise CommandError(f'This database already holds a generated dataset ({datagen.USERNAME_PREFIX}* users).')
+            use_copy = db.get_bind().dialect.driver == 'psycopg2' and not options['no_copy']
+            self.stdout.write(
+                f'Generating about {expected:,.0f} rows with {"COPY" if use_copy else "multi-row INSERTs"} '
+                f'(seed {options["random_seed"]}, as of {options["as_of"]})...'
+            )
+            start = time.monotonic()
+            loaded = datagen.generate(
+                db, patients, doctors, means, options['random_seed'], options['as_of'], password_hash, use_copy, self.stdout.write,
+            )
+        elapsed = time.monotonic() - start
+        for table, count in loaded.items():
+            self.stdout.write(f'{table:<24} {count:>12,}')
+        total = sum(loaded.values())
+        self.stdout.write(f'{total:,} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)')
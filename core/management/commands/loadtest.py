@@ -0,0 +1,130 @@
+import datetime
+import json
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import loadtest
+from core.db import session_scope
+from core.hashing import hash_password
+from core.models import DoctorProfile, MedicalRecord, PatientProfile, User
+
+# How many ids of seeded patients and records the doctors pick from
+SAMPLE_SIZE = 10000
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a synthetic dataset and/or drive a running server with simulated patients and doctors, '
+        'writing per-endpoint throughput and p50/p95/p99 latency to a JSON report.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true', help='Create the synthetic dataset (only what is missing) first.')
+        parser.add_argument('--patients', type=int, default=100000, help='Synthetic patients to seed.')
+        parser.add_argument('--doctors', type=int, default=200, help='Synthetic doctors to seed.')
+        parser.add_argument('--records', type=int, default=10, help='Average chart entries per seeded patient.')
+        parser.add_argument('--random-seed', type=int, default=1, help='Seed for the data and the request mix.')
+        parser.add_argument('--password', default='LoadTest#2026', help='Password of every synthetic user.')
+        parser.add_argument('--base-url', help='Server to load, e.g. http://127.0.0.1:8000. Without it only --seed runs.')
+        parser.add_argument('--patient-users', type=int, default=50, help='Concurrent simulated patients.')
+        parser.add_argument('--doctor-users', type=int, default=50, help='Concurrent simulated doctors.')
+        parser.add_argument('--duration', type=float, default=60, help='Seconds to run after ramp-up starts.')
+        parser.add_argument('--ramp-up', type=float, default=10, help='Seconds over which users log in.')
+        parser.add_argument('--think-time', type=float, default=0.5, help='Mean pause between a user\'s actions, in seconds.')
+        parser.add_argument('--output', default='loadtest-report.json', help='Where to write the JSON report.')
+        parser.add_argument('--compare', help='Earlier report to compare this run against.')
+        parser.add_argument('--metric', default='p95_ms', help='Report field compared with --compare.')
+        parser.add_argument('--threshold', type=float, default=0.10, help='Relative slowdown counted as a regression.')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Exit non-zero if any endpoint regressed.')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self._seed(options)
+        if options['base_url']:
+            report = self._run(options)
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self._print_report(report)
+            self.stdout.write(f'Report written to {options["output"]}')
+            if options['compare']:
+                self._compare(loadtest.load_report(options['compare']), report, options)
+        elif not options['seed']:
+            raise CommandError('Nothing to do: pass --seed and/or --base-url.')
+
+    def _seed(self, options):
+        rng = random.Random(options['random_seed'])
+        # One hash for every synthetic user; hashing 100k passwords would dominate seeding
+        password_hash = hash_password(options['password'])
+        start = time.monotonic()
+        with session_scope() as db:
+            loadtest.seed(db, options['patients'], options['doctors'], options['records'], rng, password_hash, self.stdout.write)
+        self.stdout.write(f'Seeding finished in {time.monotonic() - start:.1f}s')
+
+    def _load_targets(self, options):
+        with session_scope() as db:
+            seeded = User.username.like(f'{loadtest.USERNAME_PREFIX}%')
+            data = {
+                'doctor_ids': [id for (id,) in db.query(DoctorProfile.id).join(User).filter(seeded).limit(SAMPLE_SIZE)],
+                'patient_ids': [id for (id,) in db.query(PatientProfile.id).join(User).filter(seeded).limit(SAMPLE_SIZE)],
+            }
+            data['record_ids'] = [
+                id for (id,) in db.query(MedicalRecord.id).filter(MedicalRecord.patient_id.in_(data['patient_ids'][:1000])).limit(SAMPLE_SIZE)
+            ]
+            counts = {role: loadtest.seeded_count(db, role) for role in ('patient', 'doctor')}
+        if not data['doctor_ids'] or not data['patient_ids'] or not data['record_ids']:
+            raise CommandError('No synthetic data found; run with --seed first.')
+        if counts['patient'] < options['patient_users'] or counts['doctor'] < options['doctor_users']:
+            raise CommandError(f'Only {counts["patient"]} patients and {counts["doctor"]} doctors are seeded.')
+        return data
+
+    def _run(self, options):
+        data = self._load_targets(options)
+        recorder = loadtest.Recorder()
+        users = [('patient', i) for i in range(options['patient_users'])] + [('doctor', i) for i in range(options['doctor_users'])]
+        random.Random(options['random_seed']).shuffle(users)
+        started_at = datetime.datetime.now(datetime.timezone.utc)
+        start = time.monotonic()
+        deadline = start + options['duration']
+        threads = []
+        for n, (role, index) in enumerate(users):
+            thread = threading.Thread(target=loadtest.run_user, daemon=True, args=(
+                options['base_url'], role, index, options['password'], data, recorder,
+                random.Random(options['random_seed'] * 100003 + n), deadline, options['think_time'],
+            ))
+            thread.start()
+            threads.append(thread)
+            time.sleep(options['ramp_up'] / len(users))
+        self.stdout.write(f'{len(users)} users started; running until the deadline...')
+        for thread in threads:
+            thread.join()
+        duration = time.monotonic() - start
+        meta = {
+            'started_at': started_at.isoformat(),
+            'duration_s': round(duration, 1),
+            **{key: options[key] for key in (
+                'base_url', 'patient_users', 'doctor_users', 'ramp_up', 'think_time', 'random_seed',
+            )},
+        }
+        return loadtest.build_report(recorder, duration, meta)
+
+    def _print_report(self, report):
+        self.stdout.write(f'{"endpoint":<36} {"reqs":>7} {"err":>5} {"rps":>8} {"p50":>8} {"p95":>8} {"p99":>8}')
+        rows = [*report['endpoints'].items(), ('(total)', report['total'])]
+        for endpoint, stats in rows:
+            self.stdout.write(
+                f'{endpoint:<36} {stats["requests"]:>7} {stats["errors"]:>5} {stats["throughput_rps"]:>8} '
+                f'{stats["p50_ms"]:>8} {stats["p95_ms"]:>8} {stats["p99_ms"]:>8}'
+            )
+
+    def _compare(self, baseline, report, options):
+        rows = loadtest.compare_reports(baseline, report, options['metric'], options['threshold'])
+        self.stdout.write(f'\n{options["metric"]} vs {options["compare"]}:')
+        for endpoint, old, new, change, regressed in rows:
+            flag = '  REGRESSION' if regressed else ''
+            self.stdout.write(f'{endpoint:<36} {old:>9} -> {new:>9} ({change:+.1%}){flag}')
+        regressions = [row[0] for row in rows if row[4]]
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} endpoint(s) regressed: {", ".join(regressions)}')
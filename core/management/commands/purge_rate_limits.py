@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.ratelimit import login_limiter
+
+
+class Command(BaseCommand):
+    help = 'Delete rate limit counters idle for two windows or more. Run it from cron, e.g. hourly.'
+
+    def handle(self, *args, **options):
+        deleted = login_limiter().purge()
+        self.stdout.write(f'Deleted {deleted} idle login rate limit counters.')
@@ -0,0 +1,41 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import slowquery
+
+
+class Command(BaseCommand):
+    help = 'Summarize the slow query log by statement fingerprint: count, total/mean/max time, views and plan.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help=f'Log to read, with its rotated copies (default: {slowquery.LOG_FILE}).')
+        parser.add_argument('--top', type=int, default=20, help='Fingerprints to show, most total time first.')
+        parser.add_argument('--since-hours', type=float, help='Only statements logged in the last N hours.')
+        parser.add_argument('--json', action='store_true', help='Print the summary as JSON.')
+
+    def handle(self, *args, **options):
+        entries = slowquery.read_log(options['file'])
+        if options['since_hours'] is not None:
+            cutoff = datetime.datetime.now().timestamp() - options['since_hours'] * 3600
+            entries = (entry for entry in entries if entry['ts'] >= cutoff or entry.get('type') == 'explain')
+        summary = slowquery.summarize(entries)[:options['top']]
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+        if not summary:
+            raise CommandError(f'No slow statements in {options["file"] or slowquery.LOG_FILE}.')
+        for group in summary:
+            last_seen = datetime.datetime.fromtimestamp(group['last_seen']).isoformat(timespec='seconds')
+            self.stdout.write(
+                f'{group["fingerprint"]}  count={group["count"]} total_ms={group["total_ms"]} '
+                f'mean_ms={group["mean_ms"]} max_ms={group["max_ms"]} last_seen={last_seen}'
+            )
+            self.stdout.write(f'  sql:    {group["sql"][:500]}')
+            self.stdout.write(f'  params: {json.dumps(group["params"])}')
+            views = sorted(group['views'].items(), key=lambda item: item[1], reverse=True)
+            self.stdout.write('  views:  ' + ', '.join(f'{view} ({n})' for view, n in views))
+            for line in group['plan'] or []:
+                self.stdout.write(f'  plan:   {line}')
+            self.stdout.write('')
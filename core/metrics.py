@@ -0,0 +1,165 @@
+import hmac
+import os
+import re
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.http import HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import text
+
+from .audit import audit_stats
+from .hashing import hashing_stats
+from .models import engine
+from .pool import pool_stats
+
+# Each gunicorn worker writes its samples to files in PROMETHEUS_MULTIPROC_DIR
+# (see gunicorn.conf.py) and /metrics merges them, so any worker can answer a scrape.
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+REQUEST_LATENCY = Histogram(
+    'pmc_http_request_duration_seconds', 'Request latency by URL name.', ['view', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+RESPONSES = Counter('pmc_http_responses_total', 'Responses by URL name and status code.', ['view', 'method', 'status'])
+CACHE_REQUESTS = Counter('pmc_cache_requests_total', 'Django cache lookups by key prefix.', ['prefix', 'result'])
+POOL_SIZE = Gauge('pmc_db_pool_size', 'Configured pool size.', multiprocess_mode='livesum')
+POOL_CHECKED_OUT = Gauge('pmc_db_pool_checked_out', 'Connections currently checked out.', multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge('pmc_db_pool_overflow', 'Overflow connections currently open.', multiprocess_mode='livesum')
+AUDIT_QUEUED = Gauge('pmc_audit_queued_events', 'Audit events waiting to be written.', multiprocess_mode='livesum')
+# Cumulative per-process counters kept by core.pool, core.hashing and core.audit, exported as deltas
+POOL_EVENTS = Counter('pmc_db_pool_events_total', 'Pool checkouts, timeouts and overflow checkouts.', ['event'])
+HASHING_EVENTS = Counter('pmc_password_hashing_events_total', 'Password hashes, verifications and busy rejections.', ['event'])
+AUDIT_EVENTS = Counter('pmc_audit_events_total', 'Audit events written, written inline or sent to the log.', ['event'])
+
+EXPORTED_COUNTERS = [
+    (POOL_EVENTS, pool_stats, ('checkouts', 'checkout_timeouts', 'overflow_checkouts', 'leak_warnings')),
+    (HASHING_EVENTS, hashing_stats, ('hashes', 'verifies', 'rehashes', 'busy_rejections')),
+    (AUDIT_EVENTS, audit_stats, ('written', 'inline_writes', 'write_errors', 'dropped_to_log')),
+]
+
+_lock = threading.Lock()
+_exported = {}
+_KEY_PREFIX = re.compile(r'[a-z_]+')
+
+
+def _key_prefix(key):
+    match = _KEY_PREFIX.match(key)
+    return match.group(0) if match else 'other'
+
+
+def _update_process_metrics():
+    """Copy this process's pool state and stats counters into the metrics."""
+    with _lock:
+        for counter, stats_func, keys in EXPORTED_COUNTERS:
+            stats = stats_func()
+            for key in keys:
+                seen = _exported.get((counter, key), 0)
+                if stats[key] > seen:
+                    counter.labels(key).inc(stats[key] - seen)
+                    _exported[counter, key] = stats[key]
+        stats = pool_stats()
+        POOL_SIZE.set(stats['size'])
+        POOL_CHECKED_OUT.set(stats['checked_out'])
+        POOL_OVERFLOW.set(stats['overflow'])
+        AUDIT_QUEUED.set(audit_stats()['queued'])
+
+
+class MetricsMiddleware:
+    """Time every request and count responses, labelled with the URL name from core/urls.py."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, time.perf_counter() - start)
+        return response
+
+    def _observe(self, request, response, seconds):
+        match = request.resolver_match
+        # Unresolved paths share one label so scanners can't blow up the series count
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        REQUEST_LATENCY.labels(view, request.method).observe(seconds)
+        RESPONSES.labels(view, request.method, str(response.status_code)).inc()
+        _update_process_metrics()
+
+
+class CacheMetricsMixin:
+    """Count hits and misses of ``get``/``get_many`` by key prefix (page, doctor_directory, template, ...)."""
+
+    _missing = object()
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self._missing, version)
+        CACHE_REQUESTS.labels(_key_prefix(key), 'miss' if value is self._missing else 'hit').inc()
+        return default if value is self._missing else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = super().get_many(keys, version)
+        for key in keys:
+            CACHE_REQUESTS.labels(_key_prefix(key), 'hit' if key in found else 'miss').inc()
+        return found
+
+
+class InstrumentedLocMemCache(CacheMetricsMixin, LocMemCache):
+    pass
+
+
+class InstrumentedRedisCache(CacheMetricsMixin, RedisCache):
+    pass
+
+
+def metrics(request):
+    """Prometheus text exposition of this process, or of every worker in multiprocess mode.
+
+    Needs the METRICS_TOKEN bearer token; without one configured, it is only
+    open in DEBUG.
+    """
+    token = settings.METRICS_TOKEN
+    if not token and not settings.DEBUG:
+        return HttpResponse('Forbidden', status=403)
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse('Forbidden', status=403)
+    _update_process_metrics()
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def healthz(request):
+    """Liveness: the process is up and serving requests. Touches nothing else."""
+    return HttpResponse('ok', content_type='text/plain')
+
+
+def readyz(request):
+    """Readiness: a pooled connection to the primary database answers SELECT 1."""
+    try:
+        with engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+    except Exception:
+        return HttpResponse('database unavailable', content_type='text/plain', status=503)
+    return HttpResponse('ok', content_type='text/plain')
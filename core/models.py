@@ -1,14 +1,69 @@
-from sqlalchemy import create_engine, Column, Integer, String, Date, DateTime, ForeignKey, Text, Enum
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Date, DateTime, Time, Boolean, Float, ForeignKey, Text, Enum, Index, JSON, false, func
+from sqlalchemy.orm import Session, declarative_base, relationship, sessionmaker, validates
+import calendar
+import datetime
 import os
+import random
+import re
+from . import pool, slowquery
 
 Base = declarative_base()
 
 # SQLAlchemy engine and session
 # Set DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME in your .env file and never commit it
 DATABASE_URL = os.environ.get("DATABASE_URL")
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Optional comma-separated read replicas, used by views marked with core.db.read_only
+DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# Pool sizing is per gunicorn worker; tune it from the numbers in core.pool.pool_stats()
+pool.LEAK_THRESHOLD_SECONDS = float(os.environ.get("DB_POOL_LEAK_SECONDS", 30))
+# Statements slower than SLOW_QUERY_MS (0 = off) go to a JSON-lines file shared by all workers; rotate it
+# with logrotate and summarize it with manage.py slow_queries. SLOW_QUERY_EXPLAIN=1 also records one plan
+# per new statement fingerprint.
+slowquery.THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+slowquery.EXPLAIN = os.environ.get("SLOW_QUERY_EXPLAIN", "false").lower() in ("1", "true", "yes")
+slowquery.LOG_FILE = os.environ.get("SLOW_QUERY_LOG_FILE", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "slow_queries.log"))
+
+def _create_engine(url):
+    engine = create_engine(
+        url,
+        pool_pre_ping=True,
+        poolclass=pool.InstrumentedQueuePool,
+        pool_size=int(os.environ.get("DB_POOL_SIZE", 5)),
+        max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        pool_timeout=float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+    )
+    slowquery.instrument(engine)
+    return engine
+
+engine = _create_engine(DATABASE_URL)
+replica_engines = [_create_engine(url) for url in DATABASE_REPLICA_URLS]
+
+class RoutingSession(Session):
+    """Session that reads from a replica when ``info['use_replica']`` is set.
+
+    Flushes always go to the primary. One replica is picked per session so a
+    request sees a single consistent snapshot.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.info.get('use_replica') and replica_engines and not self._flushing:
+            if 'replica' not in self.info:
+                self.info['replica'] = random.choice(replica_engines)
+            return self.info['replica']
+        return engine
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+
+def utcnow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def updated_at_column():
+    """Last change time, set on every ORM insert and update; chart pages derive their ETags from it."""
+    return Column(DateTime(timezone=True), nullable=False, default=utcnow, onupdate=utcnow, server_default=func.now())
+
+def normalize_phone(phone):
+    """Digits only, so '+1 (555) 123-4567' and '15551234567' hit the same index entry."""
+    return re.sub(r'\D', '', phone or '') or None
 
 class User(Base):
     __tablename__ = 'users'
@@ -23,61 +78,147 @@ class User(Base):
 
 class PatientProfile(Base):
     __tablename__ = 'patient_profiles'
+    __table_args__ = (
+        Index('uq_patient_profiles_user_id', 'user_id', unique=True),
+        # Trigram indexes (pg_trgm) for fuzzy name and partial phone search; plain indexes elsewhere
+        Index('ix_patient_profiles_full_name_trgm', 'full_name',
+              postgresql_using='gin', postgresql_ops={'full_name': 'gin_trgm_ops'}),
+        Index('ix_patient_profiles_phone_normalized', 'phone_normalized',
+              postgresql_using='gin', postgresql_ops={'phone_normalized': 'gin_trgm_ops'}),
+        Index('ix_patient_profiles_date_of_birth', 'date_of_birth'),
+    )
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     full_name = Column(String(255))
     date_of_birth = Column(Date)
     address = Column(String(255))
     phone = Column(String(50))
+    phone_normalized = Column(String(50))
+    updated_at = updated_at_column()
     user = relationship('User', back_populates='patient_profile')
     medical_records = relationship('MedicalRecord', back_populates='patient')
     appointments = relationship('Appointment', back_populates='patient')
 
+    @validates('phone')
+    def _normalize_phone(self, key, phone):
+        self.phone_normalized = normalize_phone(phone)
+        return phone
+
 class DoctorProfile(Base):
     __tablename__ = 'doctor_profiles'
+    __table_args__ = (
+        Index('uq_doctor_profiles_user_id', 'user_id', unique=True),
+        Index('ix_doctor_profiles_updated_at', 'updated_at'),
+    )
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     full_name = Column(String(255))
     specialty = Column(String(255))
     phone = Column(String(50))
+    updated_at = updated_at_column()
     user = relationship('User', back_populates='doctor_profile')
     appointments = relationship('Appointment', back_populates='doctor')
+    availability = relationship('DoctorAvailability', back_populates='doctor')
+
+class DoctorAvailability(Base):
+    """Weekly working hours: every ``weekday`` (0 = Monday) from start_time to end_time."""
+    __tablename__ = 'doctor_availability'
+    __table_args__ = (
+        Index('ix_doctor_availability_doctor_weekday', 'doctor_id', 'weekday'),
+    )
+    id = Column(Integer, primary_key=True)
+    doctor_id = Column(Integer, ForeignKey('doctor_profiles.id'), nullable=False)
+    weekday = Column(Integer, nullable=False)
+    start_time = Column(Time, nullable=False)
+    end_time = Column(Time, nullable=False)
+    slot_minutes = Column(Integer, nullable=False, default=30, server_default='30')
+    doctor = relationship('DoctorProfile', back_populates='availability')
+
+    @property
+    def weekday_name(self):
+        return calendar.day_name[self.weekday]
+
+class AvailabilityException(Base):
+    """One-off change to a doctor's week: time off (available=False) or extra hours.
+
+    A blocking exception without start/end times takes the whole day off.
+    """
+    __tablename__ = 'availability_exceptions'
+    __table_args__ = (
+        Index('ix_availability_exceptions_doctor_date', 'doctor_id', 'date'),
+    )
+    id = Column(Integer, primary_key=True)
+    doctor_id = Column(Integer, ForeignKey('doctor_profiles.id'), nullable=False)
+    date = Column(Date, nullable=False)
+    start_time = Column(Time)
+    end_time = Column(Time)
+    available = Column(Boolean, nullable=False, default=False, server_default=false())
+    slot_minutes = Column(Integer, nullable=False, default=30, server_default='30')
+    reason = Column(String(255))
+    doctor = relationship('DoctorProfile')
 
 class MedicalRecord(Base):
     __tablename__ = 'medical_records'
+    __table_args__ = (
+        Index('ix_medical_records_patient_date', 'patient_id', 'date'),
+        Index('ix_medical_records_patient_updated', 'patient_id', 'updated_at'),
+    )
     id = Column(Integer, primary_key=True)
     patient_id = Column(Integer, ForeignKey('patient_profiles.id'))
     doctor_id = Column(Integer, ForeignKey('doctor_profiles.id'))
     diagnosis = Column(Text)
     treatment = Column(Text)
     date = Column(DateTime)
+    updated_at = updated_at_column()
     patient = relationship('PatientProfile', back_populates='medical_records')
     doctor = relationship('DoctorProfile')
 
 class Appointment(Base):
     __tablename__ = 'appointments'
+    __table_args__ = (
+        Index('ix_appointments_doctor_time', 'doctor_id', 'appointment_time'),
+        Index('ix_appointments_patient_time', 'patient_id', 'appointment_time'),
+        Index('ix_appointments_patient_updated', 'patient_id', 'updated_at'),
+        # On Postgres, ex_appointments_no_overlap (dbmigrations 0006, 0014) rejects overlapping bookings per doctor
+    )
     id = Column(Integer, primary_key=True)
     patient_id = Column(Integer, ForeignKey('patient_profiles.id'))
     doctor_id = Column(Integer, ForeignKey('doctor_profiles.id'))
     appointment_time = Column(DateTime)
+    duration_minutes = Column(Integer, nullable=False, default=30, server_default='30')
     reason = Column(Text)
     status = Column(Enum('pending', 'confirmed', 'completed', 'cancelled', name='appointment_status'))
+    updated_at = updated_at_column()
     patient = relationship('PatientProfile', back_populates='appointments')
     doctor = relationship('DoctorProfile', back_populates='appointments')
 
 class LabResult(Base):
     __tablename__ = 'lab_results'
+    __table_args__ = (
+        Index('ix_lab_results_patient_date', 'patient_id', 'date'),
+        Index('ix_lab_results_patient_analyte_date', 'patient_id', 'analyte_code', 'date'),
+        Index('ix_lab_results_patient_updated', 'patient_id', 'updated_at'),
+    )
     id = Column(Integer, primary_key=True)
     patient_id = Column(Integer, ForeignKey('patient_profiles.id'))
     doctor_id = Column(Integer, ForeignKey('doctor_profiles.id'))
     test_name = Column(String(255))
     result = Column(Text)
     date = Column(DateTime)
+    # Optional structured value (e.g. GLU / 5.4 / mmol/L) used for trends
+    analyte_code = Column(String(32))
+    value_numeric = Column(Float)
+    unit = Column(String(32))
+    updated_at = updated_at_column()
     patient = relationship('PatientProfile')
     doctor = relationship('DoctorProfile')
 
 class Prescription(Base):
     __tablename__ = 'prescriptions'
+    __table_args__ = (
+        Index('ix_prescriptions_patient_date', 'patient_id', 'date'),
+        Index('ix_prescriptions_patient_updated', 'patient_id', 'updated_at'),
+    )
     id = Column(Integer, primary_key=True)
     patient_id = Column(Integer, ForeignKey('patient_profiles.id'))
     doctor_id = Column(Integer, ForeignKey('doctor_profiles.id'))
@@ -86,8 +227,55 @@ class Prescription(Base):
     dosage = Column(String(255))
     instructions = Column(Text)
     date = Column(DateTime)
+    updated_at = updated_at_column()
     patient = relationship('PatientProfile')
     doctor = relationship('DoctorProfile')
     medical_record = relationship('MedicalRecord')
 
-# To create tables, run: Base.metadata.create_all(engine)
+class DoctorPatient(Base):
+    """A patient on a doctor's panel: they booked with the doctor or have a chart entry from them (see core.careteam)."""
+    __tablename__ = 'doctor_patients'
+    __table_args__ = (
+        # Covers the panel page, newest first, as an index-only range scan per doctor
+        Index('ix_doctor_patients_doctor_last_seen', 'doctor_id', 'last_seen_at', 'patient_id'),
+    )
+    doctor_id = Column(Integer, ForeignKey('doctor_profiles.id'), primary_key=True)
+    patient_id = Column(Integer, ForeignKey('patient_profiles.id'), primary_key=True)
+    last_seen_at = Column(DateTime(timezone=True), nullable=False)
+
+class RateLimitCounter(Base):
+    """Two-bucket sliding-window counter for one rate-limit key (see core.ratelimit)."""
+    __tablename__ = 'rate_limit_counters'
+    __table_args__ = (
+        Index('ix_rate_limit_counters_window_start', 'window_start'),
+    )
+    key = Column(String(255), primary_key=True)
+    window_start = Column(BigInteger, nullable=False)
+    count = Column(Integer, nullable=False)
+    previous_count = Column(Integer, nullable=False)
+
+class AuditLog(Base):
+    """Append-only record of who read, changed or exported patient data (written by core.audit).
+
+    No foreign keys, so entries outlive the users and rows they mention.
+    Exports span many patients: they have no patient_id and keep their
+    columns and filters in details.
+    """
+    __tablename__ = 'audit_log'
+    __table_args__ = (
+        Index('ix_audit_log_patient_occurred', 'patient_id', 'occurred_at'),
+        Index('ix_audit_log_actor_occurred', 'actor_user_id', 'occurred_at'),
+    )
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    occurred_at = Column(DateTime(timezone=True), nullable=False)
+    actor_user_id = Column(Integer, nullable=False)
+    actor_role = Column(String(20), nullable=False)
+    action = Column(Enum('read', 'create', 'update', 'export', name='audit_action'), nullable=False)
+    resource = Column(String(64), nullable=False)
+    patient_id = Column(Integer)
+    record_id = Column(Integer)
+    path = Column(String(255))
+    ip_address = Column(String(45))
+    details = Column(JSON)
+
+# Schema changes are versioned in dbmigrations/; apply them with: alembic upgrade head
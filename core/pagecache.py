@@ -0,0 +1,89 @@
+import functools
+import threading
+import time
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+
+# How long a page stays cached, and how long other workers wait for one that is being rendered
+PAGE_CACHE_SECONDS = 300
+RENDER_LOCK_SECONDS = 10
+RENDER_WAIT_SECONDS = 2.0
+RENDER_POLL_SECONDS = 0.05
+
+_locks_guard = threading.Lock()
+_locks = {}
+
+
+def _local_lock(key):
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def get_or_render(key, render, timeout=PAGE_CACHE_SECONDS):
+    """Cached value for ``key``, calling ``render()`` to fill it at most once at a time.
+
+    Threads of one process queue on a local lock. Across processes, the first
+    to win ``cache.add`` on the lock key renders while the others poll the
+    cache for up to RENDER_WAIT_SECONDS, then render themselves as a fallback.
+    A cold cache under load therefore costs about one render, not one per request.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+    with _local_lock(key):
+        value = cache.get(key)
+        if value is not None:
+            return value
+        lock_key = f'{key}:rendering'
+        if cache.add(lock_key, 1, RENDER_LOCK_SECONDS):
+            try:
+                value = render()
+                if value is not None:
+                    cache.set(key, value, timeout)
+            finally:
+                cache.delete(lock_key)
+            return value
+        deadline = time.monotonic() + RENDER_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(RENDER_POLL_SECONDS)
+            value = cache.get(key)
+            if value is not None:
+                return value
+        return render()
+
+
+def cache_page_per_role(timeout=PAGE_CACHE_SECONDS):
+    """Cache a GET view's whole page once per role (and once for anonymous visitors).
+
+    Only for pages whose output depends on nothing but the role. Requests with
+    flash messages waiting are rendered normally so the messages are shown
+    and consumed.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or len(get_messages(request)):
+                return view(request, *args, **kwargs)
+            principal = request.principal
+            role = principal.role if principal else 'anonymous'
+            key = f'page:{role}:{request.path}'
+            rendered = {}
+
+            def render():
+                response = view(request, *args, **kwargs)
+                rendered['response'] = response
+                if response.status_code != 200:
+                    return None
+                return (response.content, response['Content-Type'])
+
+            cached = get_or_render(key, render, timeout)
+            if cached is None:
+                return rendered['response']
+            if 'response' in rendered:
+                return rendered['response']
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+        return wrapper
+    return decorator
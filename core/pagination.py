@@ -0,0 +1,190 @@
+import base64
+import datetime
+import json
+
+from sqlalchemy import and_, tuple_
+
+PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+
+class Page:
+    """One window of a keyset-paginated list plus the query strings to move around it."""
+
+    def __init__(self, items, next_query=None, previous_query=None, estimated_total=None, order='desc'):
+        self.items = items
+        self.next_query = next_query
+        self.previous_query = previous_query
+        self.estimated_total = estimated_total
+        self.order = order
+
+    @classmethod
+    def empty(cls):
+        return cls([])
+
+    @property
+    def has_next(self):
+        return self.next_query is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_query is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+    values = [v.isoformat() if isinstance(v, (datetime.date, datetime.datetime)) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, types):
+    """Turn a cursor back into values of the given Python types, or None if it is malformed."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if len(raw) != len(types):
+            return None
+        values = []
+        for value, python_type in zip(raw, types):
+            if value is not None and python_type in (datetime.datetime, datetime.date):
+                value = python_type.fromisoformat(value)
+            elif value is not None:
+                value = python_type(value)
+            values.append(value)
+        return values
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+
+
+def get_order(request, default='desc'):
+    order = request.GET.get('order', default)
+    return order if order in ('asc', 'desc') else default
+
+
+def filter_date_range(query, column, request):
+    """Apply the optional ``from``/``to`` (YYYY-MM-DD) GET parameters to ``column``."""
+    try:
+        start = datetime.date.fromisoformat(request.GET['from']) if request.GET.get('from') else None
+        end = datetime.date.fromisoformat(request.GET['to']) if request.GET.get('to') else None
+    except ValueError:
+        return query
+    if start:
+        query = query.filter(column >= datetime.datetime.combine(start, datetime.time.min))
+    if end:
+        query = query.filter(column < datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min))
+    return query
+
+
+def estimate_count(db, query):
+    """Row estimate from the Postgres planner; None on other databases.
+
+    EXPLAIN costs a planning round trip instead of a scan, so later pages are
+    as cheap as the first one.
+    """
+    bind = db.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return None
+    compiled = query.order_by(None).statement.compile(dialect=bind.dialect)
+    params = compiled.params
+    if compiled.positional:  # e.g. asyncpg's $1 placeholders
+        params = tuple(params[name] for name in compiled.positiontup)
+    plan = db.connection().exec_driver_sql('EXPLAIN (FORMAT JSON) ' + str(compiled), params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def paginate(request, query, sort_column, id_column, default_order='desc', page_size=PAGE_SIZE):
+    """Keyset-paginate ``query`` on (sort_column, id_column).
+
+    The ``after``/``before`` GET parameters carry the cursor, ``order`` picks
+    the direction and ``size`` the page size. Each page is one indexed range
+    scan of ``page_size + 1`` rows no matter how deep into the list it is.
+    On a nullable ``sort_column``, rows without a value come last in both
+    orders; a page that reaches them takes a second scan.
+    """
+    order = get_order(request, default_order)
+    try:
+        size = min(max(int(request.GET.get('size', page_size)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        size = page_size
+    types = (sort_column.type.python_type, id_column.type.python_type)
+    after = decode_cursor(request.GET['after'], types) if request.GET.get('after') else None
+    before = decode_cursor(request.GET['before'], types) if request.GET.get('before') else None
+
+    estimated_total = estimate_count(query.session, query)
+    backwards = before is not None and after is None
+    cursor = before if backwards else after
+    # Walking backwards flips the comparison and the ORDER BY, then the rows are reversed.
+    ascending = (order == 'asc') != backwards
+    if getattr(sort_column.expression, 'nullable', True):
+        segments = _segments(sort_column, id_column, cursor, ascending, backwards)
+    else:
+        condition = _after_value(sort_column, id_column, cursor, ascending) if cursor is not None else None
+        segments = [(condition, _order_by(sort_column, id_column, ascending))]
+    rows = []
+    for condition, order_by in segments:
+        segment = query if condition is None else query.filter(condition)
+        rows += segment.order_by(*order_by).limit(size + 1 - len(rows)).all()
+        if len(rows) > size:
+            break
+    more = len(rows) > size
+    rows = rows[:size]
+    if backwards:
+        rows.reverse()
+
+    has_next = (more and not backwards) or (backwards and bool(rows))
+    has_previous = (more and backwards) or (after is not None and bool(rows))
+    next_query = previous_query = None
+    if has_next:
+        next_query = _page_query(request, 'after', rows[-1], sort_column, id_column)
+    if has_previous:
+        previous_query = _page_query(request, 'before', rows[0], sort_column, id_column)
+    return Page(rows, next_query, previous_query, estimated_total, order)
+
+
+def _after_value(sort_column, id_column, cursor, ascending):
+    key = tuple_(sort_column, id_column)
+    # The single-column bound lets the (patient_id, date) style indexes drive the range scan.
+    if ascending:
+        return and_(sort_column >= cursor[0], key > tuple_(*cursor))
+    return and_(sort_column <= cursor[0], key < tuple_(*cursor))
+
+
+def _order_by(sort_column, id_column, ascending):
+    if ascending:
+        return sort_column.asc(), id_column.asc()
+    return sort_column.desc(), id_column.desc()
+
+
+def _segments(sort_column, id_column, cursor, ascending, backwards):
+    """(filter, ORDER BY) pairs for a nullable sort column, in walking order from ``cursor``.
+
+    Rows with a value and rows without one are fetched by separate queries,
+    so each stays a single range scan instead of an OR across both parts.
+    NULLs come last going forward, so first when walking backwards.
+    """
+    values_order = _order_by(sort_column, id_column, ascending)
+    nulls_order = (id_column.asc() if ascending else id_column.desc(),)
+    if cursor is None:
+        values = (sort_column.isnot(None), values_order)
+        nulls = (sort_column.is_(None), nulls_order)
+        return [nulls, values] if backwards else [values, nulls]
+    if cursor[0] is None:
+        past = id_column > cursor[1] if ascending else id_column < cursor[1]
+        nulls = (and_(sort_column.is_(None), past), nulls_order)
+        return [nulls, (sort_column.isnot(None), values_order)] if backwards else [nulls]
+    values = (_after_value(sort_column, id_column, cursor, ascending), values_order)
+    return [values] if backwards else [values, (sort_column.is_(None), nulls_order)]
+
+
+def _page_query(request, param, row, sort_column, id_column):
+    params = request.GET.copy()
+    params.pop('after', None)
+    params.pop('before', None)
+    params[param] = encode_cursor([getattr(row, sort_column.key), getattr(row, id_column.key)])
+    return params.urlencode()
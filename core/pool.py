@@ -0,0 +1,96 @@
+import logging
+import threading
+import time
+import weakref
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+# Connections held longer than this are reported as probable leaks.
+LEAK_THRESHOLD_SECONDS = 30.0
+
+_lock = threading.Lock()
+_stats = {
+    'checkouts': 0,
+    'checkout_wait_total': 0.0,
+    'checkout_wait_max': 0.0,
+    'checkout_timeouts': 0,
+    'overflow_checkouts': 0,
+    'leak_warnings': 0,
+}
+_pools = weakref.WeakSet()
+_held = {}
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait to get a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _pools.add(self)
+        # recreate() hands the new pool the old dispatcher, listeners included
+        if not event.contains(self, 'checkout', _on_checkout):
+            event.listen(self, 'checkout', _on_checkout)
+            event.listen(self, 'checkin', _on_checkin)
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except Exception:
+            with _lock:
+                _stats['checkout_timeouts'] += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with _lock:
+                _stats['checkouts'] += 1
+                _stats['checkout_wait_total'] += waited
+                if waited > _stats['checkout_wait_max']:
+                    _stats['checkout_wait_max'] = waited
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    _held[id(connection_record)] = (time.monotonic(), threading.current_thread().name)
+    if connection_proxy._pool.overflow() > 0:
+        with _lock:
+            _stats['overflow_checkouts'] += 1
+
+
+def _on_checkin(dbapi_connection, connection_record):
+    checked_out = _held.pop(id(connection_record), None)
+    if checked_out is None:
+        return
+    held_for = time.monotonic() - checked_out[0]
+    if held_for > LEAK_THRESHOLD_SECONDS:
+        logger.warning('Connection held for %.1fs by thread %s before being returned to the pool',
+                       held_for, checked_out[1])
+
+
+def check_for_leaks(threshold=None):
+    """Log a warning for every connection checked out longer than ``threshold`` seconds."""
+    threshold = LEAK_THRESHOLD_SECONDS if threshold is None else threshold
+    now = time.monotonic()
+    leaks = []
+    for since, thread_name in list(_held.values()):
+        if now - since > threshold:
+            leaks.append((now - since, thread_name))
+    for held_for, thread_name in leaks:
+        logger.warning('Possible connection leak: checked out for %.1fs by thread %s', held_for, thread_name)
+    if leaks:
+        with _lock:
+            _stats['leak_warnings'] += len(leaks)
+    return leaks
+
+
+def pool_stats():
+    """Snapshot of pool counters, summed over every instrumented pool in this process."""
+    with _lock:
+        stats = dict(_stats)
+    stats['checkout_wait_avg'] = stats['checkout_wait_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+    stats['size'] = sum(pool.size() for pool in _pools)
+    stats['checked_out'] = sum(pool.checkedout() for pool in _pools)
+    stats['overflow'] = sum(max(pool.overflow(), 0) for pool in _pools)
+    return stats
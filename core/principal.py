@@ -0,0 +1,110 @@
+import time
+from collections import namedtuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from .models import DoctorProfile, PatientProfile, SessionLocal, User
+
+Principal = namedtuple('Principal', 'user_id role profile_id display_name')
+
+SESSION_KEY = 'principal'
+# Upper bound on how stale a session's principal can get if a change marker is evicted from the cache
+PRINCIPAL_MAX_AGE = 300
+
+
+def changed_key(user_id):
+    return f'principal_changed:{user_id}'
+
+
+def resolve_principal(db, user_id, role):
+    """Look up a user's role, profile id and display name in one query."""
+    profile = DoctorProfile if role == 'doctor' else PatientProfile
+    row = (
+        db.query(User.role, User.username, profile.id, profile.full_name)
+        .outerjoin(profile, profile.user_id == User.id)
+        .filter(User.id == user_id)
+        .first()
+    )
+    if row is None or row.role != role:
+        return None
+    user_role, username, profile_id, full_name = row
+    return Principal(user_id, user_role, profile_id, full_name or username)
+
+
+def get_principal(request):
+    """The logged-in user's Principal, cached in the session; None when logged out.
+
+    The cached copy is dropped when the user's profile changed after it was
+    resolved (see ``invalidate``), and at the latest after PRINCIPAL_MAX_AGE.
+    """
+    session = request.session
+    user_id, role = session.get('user_id'), session.get('role')
+    if not user_id:
+        return None
+    now = time.time()
+    cached = session.get(SESSION_KEY)
+    if cached and cached[0] == user_id and cached[1] == role:
+        resolved_at = cached[4]
+        if now - resolved_at < PRINCIPAL_MAX_AGE and resolved_at > cache.get(changed_key(user_id), 0):
+            return Principal(*cached[:4])
+    principal = resolve_principal(request.db, user_id, role)
+    if principal is None:
+        session.pop(SESSION_KEY, None)
+        return None
+    session[SESSION_KEY] = [*principal, now]
+    return principal
+
+
+def invalidate(user_id):
+    cache.set(changed_key(user_id), time.time(), PRINCIPAL_MAX_AGE)
+
+
+class PrincipalMiddleware:
+    """Attach a lazily resolved ``request.principal`` (user id, role, profile id, display name).
+
+    Views check ``principal.role`` and use ``principal.profile_id`` directly
+    instead of querying the profile table on every request.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        # Async views resolve it with core.async_db.aget_principal instead
+        request.principal = SimpleLazyObject(lambda: get_principal(request))
+        return self.get_response(request)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+@event.listens_for(PatientProfile, 'after_insert')
+@event.listens_for(PatientProfile, 'after_update')
+@event.listens_for(PatientProfile, 'after_delete')
+@event.listens_for(DoctorProfile, 'after_insert')
+@event.listens_for(DoctorProfile, 'after_update')
+@event.listens_for(DoctorProfile, 'after_delete')
+def _mark_changed(mapper, connection, target):
+    session = object_session(target)
+    user_id = target.id if isinstance(target, User) else target.user_id
+    if session is not None and user_id is not None:
+        session.info.setdefault('principal_changed', set()).add(user_id)
+
+
+@event.listens_for(SessionLocal, 'after_commit')
+def _invalidate_on_commit(session):
+    for user_id in session.info.pop('principal_changed', ()):
+        invalidate(user_id)
+
+
+@event.listens_for(SessionLocal, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('principal_changed', None)
@@ -0,0 +1,128 @@
+import contextvars
+import logging
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('query_stats', default=None)
+
+
+class QueryStats:
+    """Statements run during one request: how many, how long, and which ones repeat."""
+
+    def __init__(self, method=None):
+        self.method = method
+        # Dotted path of the view function, set once the URL resolves
+        self.view = None
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def add(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+    def repeated(self, threshold=None):
+        """Statements run at least ``threshold`` times, most frequent first.
+
+        Parameters are bound separately, so a loop that lazy-loads one row per
+        item shows up here as one statement text with a high count (N+1).
+        """
+        threshold = threshold or settings.N_PLUS_ONE_THRESHOLD
+        return [(statement, n) for statement, n in self.statements.most_common() if n >= threshold]
+
+
+def current_stats():
+    """QueryStats of the request being handled in this thread or task, or None."""
+    return _current.get()
+
+
+# Listening on the Engine class covers the primary, the replicas and the async engines
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        context.query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = getattr(context, 'query_started', None)
+    if stats is not None and started is not None:
+        stats.add(statement, time.perf_counter() - started)
+
+
+def _short(statement, length=200):
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= length else statement[:length] + '...'
+
+
+class QueryCountMiddleware:
+    """Count SQLAlchemy statements and DB time per request and flag N+1 patterns.
+
+    With DEBUG the numbers go into X-DB-* response headers; otherwise each
+    request gets one key=value log line, at WARNING when a statement ran
+    N_PLUS_ONE_THRESHOLD times or more.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._report(request, response, stats)
+
+    async def __acall__(self, request):
+        stats, token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._report(request, response, stats)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = getattr(request, 'query_stats', None)
+        if stats is not None:
+            stats.view = f'{view_func.__module__}.{getattr(view_func, "__qualname__", type(view_func).__name__)}'
+
+    def _start(self, request):
+        stats = QueryStats(request.method)
+        request.query_stats = stats
+        return stats, _current.set(stats)
+
+    def _report(self, request, response, stats):
+        repeated = stats.repeated()
+        if settings.DEBUG:
+            response['X-DB-Queries'] = str(stats.count)
+            response['X-DB-Time-Ms'] = f'{stats.seconds * 1000:.1f}'
+            response['X-DB-Repeated'] = str(len(repeated))
+            if repeated:
+                response['X-DB-Repeated-Top'] = f'{repeated[0][1]}x {_short(repeated[0][0], 120)}'
+        level = logging.WARNING if repeated else logging.INFO
+        if logger.isEnabledFor(level):
+            logger.log(
+                level,
+                'db queries: method=%s path=%s status=%d queries=%d db_ms=%.1f repeated=%d%s',
+                request.method, request.path, response.status_code, stats.count, stats.seconds * 1000, len(repeated),
+                ''.join(f' top="{n}x {_short(statement)}"' for statement, n in repeated[:3]),
+                extra={'db_queries': stats.count, 'db_ms': round(stats.seconds * 1000, 1), 'db_repeated': len(repeated)},
+            )
+        return response
@@ -0,0 +1,167 @@
+import functools
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from sqlalchemy import bindparam, delete, select, text
+
+from .models import RateLimitCounter, engine
+
+# One atomic round trip: roll the window if needed, increment, return the new state
+_HIT = text("""
+    INSERT INTO rate_limit_counters (key, window_start, count, previous_count)
+    VALUES (:key, :window_start, 1, 0)
+    ON CONFLICT (key) DO UPDATE SET
+        previous_count = CASE
+            WHEN rate_limit_counters.window_start >= :window_start THEN rate_limit_counters.previous_count
+            WHEN rate_limit_counters.window_start = :window_start - :window THEN rate_limit_counters.count
+            ELSE 0 END,
+        count = CASE
+            WHEN rate_limit_counters.window_start >= :window_start THEN rate_limit_counters.count + 1
+            ELSE 1 END,
+        window_start = CASE
+            WHEN rate_limit_counters.window_start >= :window_start THEN rate_limit_counters.window_start
+            ELSE :window_start END
+    RETURNING window_start, count, previous_count
+""")
+
+
+class DatabaseBackend:
+    """Counters in the rate_limit_counters table, shared by every worker and node."""
+
+    def counters(self, keys):
+        statement = select(
+            RateLimitCounter.key, RateLimitCounter.window_start, RateLimitCounter.count, RateLimitCounter.previous_count,
+        ).where(RateLimitCounter.key.in_(bindparam('keys', expanding=True)))
+        with engine.connect() as connection:
+            return {row.key: tuple(row[1:]) for row in connection.execute(statement, {'keys': list(keys)})}
+
+    def hit(self, keys, window_start, window):
+        with engine.begin() as connection:
+            return {
+                key: tuple(connection.execute(_HIT, {'key': key, 'window_start': window_start, 'window': window}).one())
+                for key in keys
+            }
+
+    def reset(self, keys):
+        with engine.begin() as connection:
+            connection.execute(delete(RateLimitCounter).where(RateLimitCounter.key.in_(list(keys))))
+
+    def purge(self, prefix, before):
+        """Delete ``prefix`` counters whose window started before ``before``; returns how many."""
+        statement = delete(RateLimitCounter).where(
+            RateLimitCounter.window_start < before, RateLimitCounter.key.startswith(prefix, autoescape=True),
+        )
+        with engine.begin() as connection:
+            return connection.execute(statement).rowcount
+
+
+class LocalBackend:
+    """In-process counters with the same semantics, for tests and single-process development."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def counters(self, keys):
+        with self._lock:
+            return {key: self._counters[key] for key in keys if key in self._counters}
+
+    def hit(self, keys, window_start, window):
+        result = {}
+        with self._lock:
+            for key in keys:
+                start, count, previous = self._counters.get(key, (window_start, 0, 0))
+                if start < window_start:
+                    previous = count if start == window_start - window else 0
+                    start, count = window_start, 0
+                self._counters[key] = result[key] = (start, count + 1, previous)
+        return result
+
+    def reset(self, keys):
+        with self._lock:
+            for key in keys:
+                self._counters.pop(key, None)
+
+    def purge(self, prefix, before):
+        with self._lock:
+            stale = [key for key, (start, _, _) in self._counters.items() if key.startswith(prefix) and start < before]
+            for key in stale:
+                del self._counters[key]
+        return len(stale)
+
+
+class SlidingWindowLimiter:
+    """Approximate sliding-window limits on several keys at once (e.g. per IP and per username).
+
+    Each key keeps the counts of the current and the previous fixed window;
+    the previous one is weighted by how much of it still overlaps the sliding
+    window. That is O(1) storage and one indexed row per key per check.
+    """
+
+    def __init__(self, name, limits, window, backend):
+        self.name = name
+        self.limits = limits
+        self.window = window
+        self.backend = backend
+
+    def _keys(self, values):
+        return {
+            f'{self.name}:{kind}:{str(value).strip().lower()[:200]}': self.limits[kind]
+            for kind, value in values.items() if value
+        }
+
+    def _window_start(self, now):
+        return int(now // self.window) * self.window
+
+    def _estimate(self, counter, now):
+        window_start = self._window_start(now)
+        overlap = 1 - (now - window_start) / self.window
+        start, count, previous = counter
+        if start >= window_start:
+            return count + previous * overlap
+        if start == window_start - self.window:
+            return count * overlap
+        return 0
+
+    def is_blocked(self, **values):
+        """True if any of the keys is already at its limit. Reads only; nothing is counted."""
+        keys = self._keys(values)
+        if not keys:
+            return False
+        now = time.time()
+        counters = self.backend.counters(keys)
+        return any(self._estimate(counter, now) >= keys[key] for key, counter in counters.items())
+
+    def hit(self, **values):
+        """Count one event against every key; returns True if any key is now at its limit."""
+        keys = self._keys(values)
+        if not keys:
+            return False
+        now = time.time()
+        counters = self.backend.hit(keys, self._window_start(now), self.window)
+        return any(self._estimate(counter, now) >= keys[key] for key, counter in counters.items())
+
+    def reset(self, **values):
+        keys = self._keys(values)
+        if keys:
+            self.backend.reset(keys)
+
+    def purge(self):
+        """Delete counters idle for two windows or more, which no longer count; returns how many.
+
+        Run from cron (manage.py purge_rate_limits) rather than on the login path.
+        """
+        return self.backend.purge(f'{self.name}:', self._window_start(time.time()) - self.window)
+
+
+@functools.cache
+def login_limiter():
+    """Failed-login limiter, keyed by ``ip`` and ``username``."""
+    return SlidingWindowLimiter(
+        'login',
+        {'ip': settings.LOGIN_RATE_LIMIT_PER_IP, 'username': settings.LOGIN_RATE_LIMIT_PER_USERNAME},
+        settings.LOGIN_RATE_LIMIT_WINDOW,
+        import_string(settings.RATE_LIMIT_BACKEND)(),
+    )
@@ -0,0 +1,205 @@
+import datetime
+from collections import defaultdict
+
+from sqlalchemy.exc import IntegrityError
+
+from . import careteam
+from .models import Appointment, AvailabilityException, DoctorAvailability
+
+# Used for doctors who have not set up weekly availability yet: Monday to Friday, 09:00-17:00
+DEFAULT_WEEKLY_HOURS = [(weekday, datetime.time(9), datetime.time(17), 30) for weekday in range(5)]
+DEFAULT_SLOT_MINUTES = 30
+
+# SQLSTATE raised by Postgres when an insert violates an exclusion constraint
+EXCLUSION_VIOLATION = '23P01'
+
+
+class SlotUnavailable(Exception):
+    """The requested time overlaps another booking for the same doctor."""
+
+
+def week_start(day):
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def merge_intervals(intervals):
+    """Sort (start, end) intervals and merge the overlapping ones."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_intervals(intervals, removed):
+    """``intervals`` minus ``removed``; both must be sorted and disjoint (see merge_intervals)."""
+    result = []
+    j = 0
+    for start, end in intervals:
+        while j < len(removed) and removed[j][1] <= start:
+            j += 1
+        k = j
+        while k < len(removed) and removed[k][0] < end:
+            if removed[k][0] > start:
+                result.append((start, removed[k][0]))
+            start = max(start, removed[k][1])
+            k += 1
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def _working_blocks(templates, exceptions, start_date, end_date):
+    """Working hours in [start_date, end_date) as (start, end, slot_minutes) tuples, after exceptions."""
+    by_weekday = defaultdict(list)
+    for weekday, start, end, slot_minutes in templates:
+        by_weekday[weekday].append((start, end, slot_minutes))
+    exceptions_by_date = defaultdict(list)
+    for exception in exceptions:
+        exceptions_by_date[exception.date].append(exception)
+
+    blocks = []
+    day = start_date
+    while day < end_date:
+        day_exceptions = exceptions_by_date.get(day, [])
+        blocked = []
+        for exception in day_exceptions:
+            if exception.available:
+                if exception.start_time and exception.end_time:
+                    blocks.append(_block(day, exception.start_time, exception.end_time, exception.slot_minutes))
+            elif exception.start_time and exception.end_time:
+                blocked.append((datetime.datetime.combine(day, exception.start_time),
+                                datetime.datetime.combine(day, exception.end_time)))
+            else:
+                blocked.append((datetime.datetime.combine(day, datetime.time.min),
+                                datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time.min)))
+        blocked = merge_intervals(blocked)
+        for start, end, slot_minutes in by_weekday.get(day.weekday(), []):
+            block = _block(day, start, end, slot_minutes)
+            for piece_start, piece_end in subtract_intervals([block[:2]], blocked):
+                blocks.append((piece_start, piece_end, slot_minutes))
+        day += datetime.timedelta(days=1)
+    return blocks
+
+
+def _block(day, start, end, slot_minutes):
+    return (datetime.datetime.combine(day, start), datetime.datetime.combine(day, end), slot_minutes)
+
+
+def load_week(db, doctor_id, start_date, end_date):
+    """Availability templates, exceptions and booked intervals for one doctor and date range.
+
+    Three indexed queries in total, whatever the number of candidate slots.
+    """
+    templates = [
+        (t.weekday, t.start_time, t.end_time, t.slot_minutes)
+        for t in db.query(DoctorAvailability).filter_by(doctor_id=doctor_id)
+    ] or DEFAULT_WEEKLY_HOURS
+    exceptions = (
+        db.query(AvailabilityException)
+        .filter(AvailabilityException.doctor_id == doctor_id,
+                AvailabilityException.date >= start_date,
+                AvailabilityException.date < end_date)
+        .all()
+    )
+    range_start = datetime.datetime.combine(start_date, datetime.time.min)
+    range_end = datetime.datetime.combine(end_date, datetime.time.min)
+    booked = (
+        db.query(Appointment.appointment_time, Appointment.duration_minutes)
+        .filter(Appointment.doctor_id == doctor_id,
+                # NULL is not 'cancelled' either; != would drop those rows
+                Appointment.status.is_distinct_from('cancelled'),
+                # Widened by a day so appointments starting before the range but overlapping it count
+                Appointment.appointment_time >= range_start - datetime.timedelta(days=1),
+                Appointment.appointment_time < range_end)
+        .all()
+    )
+    booked = [(start, start + datetime.timedelta(minutes=minutes or DEFAULT_SLOT_MINUTES)) for start, minutes in booked]
+    return templates, exceptions, booked
+
+
+def free_slots(templates, exceptions, booked, start_date, end_date, now=None):
+    """Free (start, end) slots in [start_date, end_date), in order.
+
+    Candidate slots are laid out on each working block and the booked
+    intervals are subtracted with one sorted sweep, so the cost is linear in
+    slots plus bookings.
+    """
+    now = now or datetime.datetime.now()
+    booked = merge_intervals(booked)
+    candidates = []
+    for block_start, block_end, slot_minutes in sorted(_working_blocks(templates, exceptions, start_date, end_date)):
+        step = datetime.timedelta(minutes=slot_minutes)
+        slot_start = block_start
+        while slot_start + step <= block_end:
+            if slot_start >= now:
+                candidates.append((slot_start, slot_start + step))
+            slot_start += step
+    candidates.sort()
+
+    slots = []
+    j = 0
+    for start, end in candidates:
+        while j < len(booked) and booked[j][1] <= start:
+            j += 1
+        if j < len(booked) and booked[j][0] < end:
+            continue
+        if slots and start < slots[-1][1]:
+            continue  # overlapping templates
+        slots.append((start, end))
+    return slots
+
+
+def doctor_free_slots(db, doctor_id, start_date, end_date, now=None):
+    templates, exceptions, booked = load_week(db, doctor_id, start_date, end_date)
+    return free_slots(templates, exceptions, booked, start_date, end_date, now=now)
+
+
+def _overlaps(db, doctor_id, start, end):
+    booked = (
+        db.query(Appointment.appointment_time, Appointment.duration_minutes)
+        .filter(Appointment.doctor_id == doctor_id,
+                Appointment.status.is_distinct_from('cancelled'),
+                Appointment.appointment_time >= start - datetime.timedelta(days=1),
+                Appointment.appointment_time < end)
+    )
+    return any(
+        booked_start + datetime.timedelta(minutes=minutes or DEFAULT_SLOT_MINUTES) > start
+        for booked_start, minutes in booked
+    )
+
+
+def book_slot(db, patient_id, doctor_id, start, duration_minutes, reason):
+    """Insert and commit a pending appointment, or raise SlotUnavailable.
+
+    On Postgres the ex_appointments_no_overlap exclusion constraint makes the
+    insert itself the check: of two concurrent bookings for overlapping times
+    only one can commit, and only the conflicting index entries are locked.
+    The query beforehand just answers the common case without an insert.
+    The patient joins the doctor's panel in the same transaction.
+    """
+    end = start + datetime.timedelta(minutes=duration_minutes)
+    if _overlaps(db, doctor_id, start, end):
+        raise SlotUnavailable()
+    appointment = Appointment(
+        patient_id=patient_id,
+        doctor_id=doctor_id,
+        appointment_time=start,
+        duration_minutes=duration_minutes,
+        reason=reason,
+        status='pending',
+    )
+    db.add(appointment)
+    careteam.seen(db, doctor_id, patient_id)
+    try:
+        db.commit()
+    except IntegrityError as exc:
+        db.rollback()
+        code = getattr(exc.orig, 'pgcode', None) or getattr(exc.orig, 'sqlstate', None)
+        if code == EXCLUSION_VIOLATION:
+            raise SlotUnavailable() from exc
+        raise
+    return appointment
@@ -0,0 +1,71 @@
+import datetime
+import re
+
+from sqlalchemy import func, or_
+
+from .models import DoctorPatient, PatientProfile, normalize_phone
+
+SEARCH_LIMIT = 50
+TYPEAHEAD_LIMIT = 10
+
+_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d.%m.%Y')
+_PHONE_CHARS = re.compile(r'^\+?[\d\s().-]+$')
+
+
+def _like_pattern(text):
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _parse_date(token):
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(token, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+def parse_query(text):
+    """Split a search box value into name words, phone digits and a date of birth."""
+    words, phone, dob = [], None, None
+    for token in text.split():
+        date = _parse_date(token)
+        if date:
+            dob = date
+        elif _PHONE_CHARS.match(token) and len(normalize_phone(token) or '') >= 3:
+            phone = (phone or '') + normalize_phone(token)
+        else:
+            words.append(token)
+    return ' '.join(words), phone, dob
+
+
+def search_patients(db, text, limit=SEARCH_LIMIT, doctor_id=None):
+    """Ranked patient lookup by name, phone and date of birth.
+
+    Names go through the pg_trgm index on full_name (similarity plus
+    substring match), phone digits through the trigram index on the
+    digits-only phone_normalized column, so a number matches with or without
+    its country code, and dates of birth through an equality lookup. Other
+    databases fall back to plain LIKE scans. With ``doctor_id``, only that
+    doctor's care-team panel is searched.
+    """
+    name, phone, dob = parse_query(text)
+    query = db.query(PatientProfile)
+    if doctor_id is not None:
+        query = query.join(DoctorPatient, DoctorPatient.patient_id == PatientProfile.id).filter(DoctorPatient.doctor_id == doctor_id)
+    if dob:
+        query = query.filter(PatientProfile.date_of_birth == dob)
+    if phone:
+        query = query.filter(PatientProfile.phone_normalized.like(f'%{phone}%'))
+    if not name:
+        return query.order_by(PatientProfile.full_name, PatientProfile.id).limit(limit).all()
+    if db.get_bind().dialect.name == 'postgresql':
+        rank = func.similarity(PatientProfile.full_name, name)
+        query = query.filter(or_(
+            PatientProfile.full_name.op('%')(name),
+            PatientProfile.full_name.ilike(_like_pattern(name), escape='\\'),
+        ))
+        return query.order_by(rank.desc(), PatientProfile.id).limit(limit).all()
+    query = query.filter(PatientProfile.full_name.ilike(_like_pattern(name), escape='\\'))
+    return query.order_by(PatientProfile.full_name, PatientProfile.id).limit(limit).all()
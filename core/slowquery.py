@@ -0,0 +1,254 @@
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import threading
+import time
+
+from sqlalchemy import event
+
+from .querycount import current_stats
+
+logger = logging.getLogger(__name__)
+
+# Set from the environment in core.models, next to the engines
+THRESHOLD_MS = 200.0
+EXPLAIN = False
+LOG_FILE = 'slow_queries.log'
+
+# Statements waiting for EXPLAIN beyond this are skipped, not queued
+EXPLAIN_QUEUE_SIZE = 100
+# Fingerprints remembered per process; past this the set starts over
+MAX_EXPLAINED = 10000
+
+_lock = threading.Lock()
+_stats = {
+    'slow_statements': 0,
+    'explained': 0,
+    'explain_errors': 0,
+    'explain_skipped': 0,
+}
+_explained = set()
+_explaining = threading.local()
+_queue = None
+_pid = None
+_file_logger = None
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+|\?')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ROWS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+
+
+def normalize(statement):
+    """Statement text with literals and placeholders as ``?`` and lists collapsed.
+
+    ``IN (?, ?, ?)`` and multi-row VALUES differ only in length, so they
+    normalize to the same text and share a fingerprint.
+    """
+    statement = _STRING.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    statement = _PLACEHOLDER.sub('?', statement)
+    statement = _LIST.sub('(...)', statement)
+    statement = _ROWS.sub('(...)', statement)
+    return ' '.join(statement.split()).lower()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def parameter_shape(parameters):
+    """Type names of the bound parameters; the values themselves may be PHI and are never logged."""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def instrument(engine, explain_engine=None):
+    """Log statements on ``engine`` slower than THRESHOLD_MS.
+
+    ``explain_engine`` runs the EXPLAIN; it defaults to ``engine`` itself and
+    must be a sync engine (async engines pass the matching one from core.models).
+    """
+    explain_engine = explain_engine or engine
+    event.listen(engine, 'before_cursor_execute', _before_execute)
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, 'slowquery_started', None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms >= THRESHOLD_MS:
+            _record(conn, statement, parameters, executemany, elapsed_ms, explain_engine)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    # THRESHOLD_MS = 0 turns the log off; EXPLAIN's own statements are not timed
+    if THRESHOLD_MS > 0 and not getattr(_explaining, 'active', False):
+        context.slowquery_started = time.perf_counter()
+
+
+def _record(conn, statement, parameters, executemany, elapsed_ms, explain_engine):
+    normalized = normalize(statement)
+    key = fingerprint(normalized)
+    stats = current_stats()
+    entry = {
+        'type': 'statement',
+        'ts': time.time(),
+        'fingerprint': key,
+        'duration_ms': round(elapsed_ms, 1),
+        'sql': normalized,
+        'params': parameter_shape(parameters[0] if executemany and parameters else parameters),
+        'rows': len(parameters) if executemany else 1,
+        'database': conn.engine.url.database,
+        'view': stats.view if stats is not None else None,
+        'method': stats.method if stats is not None else None,
+        'pid': os.getpid(),
+    }
+    with _lock:
+        _stats['slow_statements'] += 1
+        new = key not in _explained
+        if new:
+            if len(_explained) >= MAX_EXPLAINED:
+                _explained.clear()
+            _explained.add(key)
+    _write(entry)
+    if EXPLAIN and new and not executemany and _explainable(statement, conn, explain_engine):
+        try:
+            # The real parameters stay in memory; only the plan is written out
+            _get_queue().put_nowait((key, statement, parameters, explain_engine))
+        except queue.Full:
+            with _lock:
+                _stats['explain_skipped'] += 1
+
+
+def _explainable(statement, conn, explain_engine):
+    # Only plain reads: EXPLAIN without ANALYZE doesn't execute, but there's no use planning DML here.
+    # The statement is re-run as-is, so the explaining driver must use the same placeholder style.
+    words = statement.split(None, 1)
+    return bool(words) and words[0].lower() in ('select', 'with') and conn.dialect.paramstyle == explain_engine.dialect.paramstyle
+
+
+def _get_file_logger():
+    """JSON-lines logger appending to LOG_FILE, opened on first use.
+
+    Every gunicorn worker appends to the same file, so none of them may
+    rotate it; logrotate does (numbered copies, optionally compressed), and
+    the handler reopens the file once it has been moved away.
+    """
+    global _file_logger
+    with _lock:
+        if _file_logger is None:
+            handler = logging.handlers.WatchedFileHandler(LOG_FILE, delay=True, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            _file_logger = logging.getLogger(f'{__name__}.file')
+            _file_logger.addHandler(handler)
+            _file_logger.setLevel(logging.INFO)
+            _file_logger.propagate = False
+        return _file_logger
+
+
+def _write(entry):
+    try:
+        _get_file_logger().info(json.dumps(entry, default=str))
+    except Exception:
+        logger.exception('Could not write the slow query log')
+
+
+def _get_queue():
+    """EXPLAIN queue and worker thread for this (forked) worker, started on first use."""
+    global _queue, _pid
+    with _lock:
+        if _pid != os.getpid():
+            _queue = queue.Queue(maxsize=EXPLAIN_QUEUE_SIZE)
+            threading.Thread(target=_run, args=(_queue,), name='slowquery-explain', daemon=True).start()
+            _pid = os.getpid()
+        return _queue
+
+
+def _run(jobs):
+    _explaining.active = True
+    while True:
+        key, statement, parameters, explain_engine = jobs.get()
+        entry = {'type': 'explain', 'ts': time.time(), 'fingerprint': key}
+        try:
+            entry['plan'] = explain(explain_engine, statement, parameters)
+            with _lock:
+                _stats['explained'] += 1
+        except Exception as exc:
+            entry['error'] = type(exc).__name__
+            with _lock:
+                _stats['explain_errors'] += 1
+        _write(entry)
+
+
+def explain(engine, statement, parameters):
+    """Plan of ``statement`` as a list of lines; EXPLAIN without ANALYZE, so nothing is executed."""
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(prefix + statement, parameters).fetchall()
+        connection.rollback()
+    if engine.dialect.name == 'sqlite':
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+
+def slowquery_stats():
+    with _lock:
+        return dict(_stats)
+
+
+def read_log(path=None):
+    """Entries of the slow query log, oldest rotated file (``path.N`` or ``path.N.gz``) first."""
+    path = path or LOG_FILE
+    rotated = {}
+    for name in glob.glob(glob.escape(path) + '.*'):
+        suffix = name[len(path) + 1:].removesuffix('.gz')
+        if suffix.isdigit():
+            rotated[int(suffix)] = name
+    for name in [rotated[n] for n in sorted(rotated, reverse=True)] + [path]:
+        if not os.path.exists(name):
+            continue
+        with (gzip.open if name.endswith('.gz') else open)(name, 'rt', encoding='utf-8') as handle:
+            for line in handle:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def summarize(entries):
+    """Slow statements grouped by fingerprint, most total time first."""
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault(entry['fingerprint'], {
+            'fingerprint': entry['fingerprint'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            'sql': None, 'params': None, 'views': {}, 'plan': None, 'last_seen': None,
+        })
+        if entry.get('type') == 'explain':
+            group['plan'] = entry.get('plan') or [f'EXPLAIN failed: {entry.get("error")}']
+            continue
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+        group['sql'] = entry['sql']
+        group['params'] = entry['params']
+        group['last_seen'] = entry['ts']
+        view = entry.get('view') or '(no request)'
+        group['views'][view] = group['views'].get(view, 0) + 1
+    summary = [group for group in groups.values() if group['count']]
+    for group in summary:
+        group['total_ms'] = round(group['total_ms'], 1)
+        group['mean_ms'] = round(group['total_ms'] / group['count'], 1)
+    return sorted(summary, key=lambda group: group['total_ms'], reverse=True)
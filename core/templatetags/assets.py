@@ -0,0 +1,27 @@
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.template import Library
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+from ..management.commands.build_assets import BUNDLES
+
+register = Library()
+
+
+@register.simple_tag
+def bundle(path):
+    """<link> or <script> tags for a build_assets bundle such as 'dist/app.css'.
+
+    static/dist/ is not committed, so on a fresh checkout the bundle's
+    sources are linked one by one instead: css/site.css and js/site.js, plus
+    any vendor files already downloaded. collectstatic still refuses to run
+    without the bundles, so deploys always serve them.
+    """
+    files = [path] if _exists(path) else [source for source in BUNDLES[path] if _exists(source)]
+    template = '<link rel="stylesheet" href="{}">' if path.endswith('.css') else '<script src="{}"></script>'
+    return format_html_join('\n    ', template, ((static(name),) for name in files))
+
+
+def _exists(path):
+    return bool(finders.find(path)) or staticfiles_storage.exists(path)
@@ -1,3 +1,728 @@
-from django.test import TestCase
+import datetime
+import gzip
+import os
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from . import async_views, audit, careteam, directory, exports, models, ratelimit, slowquery, views
+from .conditional import conditional_chart
+from .datagen import Generator
+from .db import DBSessionMiddleware, _use_replica, pinned_to_primary
+from .hashing import verify_and_upgrade
+from .loadtest import Recorder, build_report, compare_reports, percentile
+from .models import (
+    DATABASE_URL, Appointment, AvailabilityException, Base, DoctorAvailability, DoctorPatient, DoctorProfile, LabResult, MedicalRecord, PatientProfile, Prescription, SessionLocal, User,
+)
+from .pagination import decode_cursor, encode_cursor, paginate
+from .principal import Principal
+from .ratelimit import DatabaseBackend, LocalBackend, SlidingWindowLimiter
+from .scheduling import SlotUnavailable, book_slot, doctor_free_slots, week_start
+from .search import search_patients
+from .slowquery import fingerprint, normalize, parameter_shape, read_log, summarize
+from .timeline import SOURCES, patient_timeline
+
+BOOKING_ATTEMPTS = int(os.environ.get('BOOKING_STRESS_ATTEMPTS', 300))
+BOOKING_WORKERS = int(os.environ.get('BOOKING_STRESS_WORKERS', 50))
+
+
+@unittest.skipUnless((DATABASE_URL or '').startswith('postgresql'), 'needs DATABASE_URL on Postgres, migrated to head')
+class ConcurrentBookingTests(SimpleTestCase):
+    """Fires many simultaneous bookings at one slot against the real database."""
+
+    def setUp(self):
+        self.engine = create_engine(DATABASE_URL, poolclass=NullPool)
+        self.Session = sessionmaker(bind=self.engine)
+        suffix = uuid.uuid4().hex[:10]
+        with self.Session() as db:
+            doctor = User(username=f'stress-doc-{suffix}', email=f'doc-{suffix}@example.org', password_hash='-', role='doctor')
+            patient = User(username=f'stress-pat-{suffix}', email=f'pat-{suffix}@example.org', password_hash='-', role='patient')
+            db.add_all([doctor, patient])
+            db.flush()
+            self.doctor = DoctorProfile(user_id=doctor.id, full_name='Stress Doctor')
+            self.patient = PatientProfile(user_id=patient.id, full_name='Stress Patient')
+            db.add_all([self.doctor, self.patient])
+            db.commit()
+            self.user_ids = [doctor.id, patient.id]
+            self.doctor_id, self.patient_id = self.doctor.id, self.patient.id
+
+    def tearDown(self):
+        with self.Session() as db:
+            db.query(Appointment).filter_by(doctor_id=self.doctor_id).delete()
+            db.query(DoctorProfile).filter_by(id=self.doctor_id).delete()
+            db.query(PatientProfile).filter_by(id=self.patient_id).delete()
+            db.query(User).filter(User.id.in_(self.user_ids)).delete(synchronize_session=False)
+            db.commit()
+        self.engine.dispose()
+
+    def test_exactly_one_booking_wins(self):
+        start = datetime.datetime(2031, 3, 3, 10, 0)
+        barrier = threading.Barrier(BOOKING_WORKERS)
+
+        def attempt(i):
+            if i < BOOKING_WORKERS:
+                barrier.wait()
+            with self.Session() as db:
+                try:
+                    # Staggered start times so some attempts partly overlap instead of matching exactly
+                    book_slot(db, self.patient_id, self.doctor_id, start + datetime.timedelta(minutes=i % 3 * 10), 30, f'attempt {i}')
+                except SlotUnavailable:
+                    return False
+                return True
+
+        with ThreadPoolExecutor(max_workers=BOOKING_WORKERS) as executor:
+            results = list(executor.map(attempt, range(BOOKING_ATTEMPTS)))
+
+        self.assertEqual(results.count(True), 1)
+        with self.Session() as db:
+            self.assertEqual(db.query(Appointment).filter_by(doctor_id=self.doctor_id).count(), 1)
+
+
+class SQLiteTestCase(SimpleTestCase):
+    """Gives each test ``self.db`` on a throwaway SQLite database with one doctor and one patient."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.engine = create_engine(f'sqlite:///{directory.name}/test.db', poolclass=NullPool)
+        self.addCleanup(self.engine.dispose)
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.db = self.Session()
+        self.addCleanup(self.db.close)
+        doctor = User(username='doc', email='doc@example.org', password_hash='-', role='doctor')
+        patient = User(username='pat', email='pat@example.org', password_hash='-', role='patient')
+        self.db.add_all([doctor, patient])
+        self.db.flush()
+        self.doctor = DoctorProfile(user_id=doctor.id, full_name='Test Doctor')
+        self.patient = PatientProfile(user_id=patient.id, full_name='Test Patient')
+        self.db.add_all([self.doctor, self.patient])
+        self.db.commit()
+
+
+class KeysetPaginationTests(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        # Ties on the date and rows without one, which must still show up exactly once
+        times = [datetime.datetime(2026, 1, 1 + i % 4, 9) for i in range(9)] + [None] * 4
+        self.db.add_all(Appointment(patient_id=self.patient.id, appointment_time=t) for t in times)
+        self.db.commit()
+        self.rows = self.db.query(Appointment).all()
+
+    def page(self, query_string, query=None):
+        request = RequestFactory().get('/?' + query_string)
+        return paginate(request, query or self.db.query(Appointment), Appointment.appointment_time, Appointment.id)
+
+    def walk(self, order, query=None):
+        pages, query_string = [], f'order={order}&size=3'
+        while query_string is not None:
+            page = self.page(query_string, query)
+            pages.append((query_string, [row.id for row in page]))
+            query_string = page.next_query
+        return pages
+
+    def expected(self, reverse):
+        dated = sorted((row for row in self.rows if row.appointment_time), key=lambda row: (row.appointment_time, row.id), reverse=reverse)
+        undated = sorted((row for row in self.rows if not row.appointment_time), key=lambda row: row.id, reverse=reverse)
+        return [row.id for row in dated + undated]
+
+    def test_forward_walk_visits_every_row_once_nulls_last(self):
+        for order, reverse in (('asc', False), ('desc', True)):
+            pages = self.walk(order)
+            self.assertEqual([row_id for _, ids in pages for row_id in ids], self.expected(reverse))
+            self.assertTrue(all(len(ids) == 3 for _, ids in pages[:-1]))
+
+    def test_previous_links_return_the_same_pages(self):
+        pages = self.walk('desc')
+        page = self.page(pages[-1][0])
+        for _, ids in reversed(pages[:-1]):
+            page = self.page(page.previous_query)
+            self.assertEqual([row.id for row in page], ids)
+        self.assertFalse(page.has_previous)
+
+    def test_every_page_is_a_bounded_index_range_scan(self):
+        statements = []
+
+        def listener(conn, cursor, statement, params, context, many):
+            if 'FROM appointments' in statement:
+                statements.append((statement, params))
+        event.listen(self.engine, 'before_cursor_execute', listener)
+        for order in ('asc', 'desc'):
+            self.walk(order, self.db.query(Appointment).filter(Appointment.patient_id == self.patient.id))
+        event.remove(self.engine, 'before_cursor_execute', listener)
+        plans = []
+        with self.engine.connect() as conn:
+            for statement, params in statements:
+                plans += [row[3] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, params)]
+        # e.g. SEARCH appointments USING INDEX ix_appointments_patient_time (patient_id=? AND appointment_time<?)
+        self.assertTrue(plans)
+        for plan in plans:
+            self.assertRegex(plan, r'USING INDEX ix_appointments_patient_time \(patient_id=\? AND appointment_time')
+
+    def test_cursor_round_trip(self):
+        when = datetime.datetime(2026, 3, 4, 5, 6, 7)
+        self.assertEqual(decode_cursor(encode_cursor([when, 12]), (datetime.datetime, int)), [when, 12])
+        self.assertEqual(decode_cursor(encode_cursor([None, 12]), (datetime.datetime, int)), [None, 12])
+        self.assertIsNone(decode_cursor('not-a-cursor', (datetime.datetime, int)))
+        self.assertIsNone(decode_cursor(encode_cursor([when]), (datetime.datetime, int)))
+
+
+class ReplicaRoutingTests(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.replica = create_engine(f'sqlite:///{directory.name}/replica.db', poolclass=NullPool)
+        self.addCleanup(self.replica.dispose)
+        Base.metadata.create_all(self.replica)
+        with sessionmaker(bind=self.replica)() as db:
+            db.add(PatientProfile(full_name='Replica Patient'))
+            db.commit()
+        for patcher in (mock.patch.object(models, 'engine', self.engine), mock.patch.object(models, 'replica_engines', [self.replica])):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def request(self, read_only, pinned_until=0):
+        request = RequestFactory().get('/')
+        request.session = {'db_primary_until': pinned_until}
+        request.db_read_only = read_only
+        return request
+
+    def count_records(self, engine):
+        with sessionmaker(bind=engine)() as db:
+            return db.query(MedicalRecord).count()
+
+    def test_only_read_only_views_use_a_replica(self):
+        self.assertTrue(_use_replica(self.request(True)))
+        self.assertFalse(_use_replica(self.request(False)))
+
+    def test_recent_writer_stays_on_the_primary(self):
+        self.assertFalse(_use_replica(self.request(True, time.time() + 30)))
+        self.assertTrue(_use_replica(self.request(True, time.time() - 1)))
+
+    def test_export_after_a_write_reads_the_primary(self):
+        statement = select(PatientProfile.full_name).order_by(PatientProfile.id)
+        for pinned_until, name in ((time.time() + 30, 'Test Patient'), (0, 'Replica Patient')):
+            use_replica = not pinned_to_primary(self.request(False, pinned_until))
+            response = exports.export_response(statement, ['full_name'], 'csv', 'patients', use_replica=use_replica)
+            self.assertEqual(b''.join(response.streaming_content).decode().splitlines()[1], name)
+
+    def test_reads_from_the_replica_and_writes_to_the_primary(self):
+        db = SessionLocal()
+        self.addCleanup(db.close)
+        db.info['use_replica'] = True
+        self.assertEqual(db.query(PatientProfile.full_name).scalar(), 'Replica Patient')
+        db.add(MedicalRecord(patient_id=self.patient.id, diagnosis='Flu'))
+        db.commit()
+        self.assertEqual((self.count_records(self.engine), self.count_records(self.replica)), (1, 0))
+
+    def test_a_write_pins_the_user_to_the_primary(self):
+        def view(request):
+            request.db.add(MedicalRecord(patient_id=self.patient.id, diagnosis='Flu'))
+            request.db.commit()
+            return HttpResponse()
+
+        request = self.request(True)
+        DBSessionMiddleware(view)(request)
+        self.assertGreater(request.session['db_primary_until'], time.time())
+        self.assertFalse(_use_replica(request))
+
+
+class TimelineTests(SQLiteTestCase):
+    def test_pages_merge_every_table_newest_first(self):
+        noon = datetime.datetime(2026, 5, 1, 12)
+        rows = []
+        for i in range(7):
+            # Equal timestamps across tables and within one, plus an undated row that never shows
+            when = noon - datetime.timedelta(days=i // 2)
+            rows += [
+                Appointment(patient_id=self.patient.id, doctor_id=self.doctor.id, appointment_time=when),
+                MedicalRecord(patient_id=self.patient.id, doctor_id=self.doctor.id, date=when - datetime.timedelta(hours=i % 3)),
+                LabResult(patient_id=self.patient.id, doctor_id=self.doctor.id, date=when),
+                Prescription(patient_id=self.patient.id, doctor_id=self.doctor.id, date=None if i == 3 else when),
+            ]
+        self.db.add_all(rows)
+        self.db.add(LabResult(patient_id=self.patient.id + 1, date=noon))
+        self.db.commit()
+        ranks = {model: rank for rank, (_, model, _) in enumerate(SOURCES)}
+        dates = {model: column.key for _, model, column in SOURCES}
+        expected = sorted(
+            ((getattr(row, dates[type(row)]), ranks[type(row)], row.id) for row in rows if getattr(row, dates[type(row)])),
+            reverse=True,
+        )
+
+        seen, cursor, pages = [], None, 0
+        while True:
+            events, cursor = patient_timeline(self.db, self.patient.id, cursor=cursor, page_size=4)
+            seen += [(event.date, event.rank, event.id) for event in events]
+            pages += 1
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+        self.assertEqual(pages, -(-len(expected) // 4))
+
+
+class SlotGenerationTests(SQLiteTestCase):
+    monday = datetime.date(2031, 3, 3)
+
+    def at(self, day, hour, minute=0):
+        return datetime.datetime.combine(self.monday + datetime.timedelta(days=day), datetime.time(hour, minute))
+
+    def slots(self, now=None):
+        return [start for start, _ in doctor_free_slots(
+            self.db, self.doctor.id, self.monday, self.monday + datetime.timedelta(days=7), now=now or self.at(-7, 0),
+        )]
+
+    def test_doctors_without_hours_get_weekday_office_hours(self):
+        slots = self.slots()
+        self.assertEqual(len(slots), 5 * 16)
+        self.assertEqual((slots[0], slots[-1]), (self.at(0, 9), self.at(4, 16, 30)))
+        self.assertEqual(week_start(self.monday + datetime.timedelta(days=3)), self.monday)
+
+    def test_hours_minus_exceptions_bookings_and_the_past(self):
+        self.db.add_all([
+            DoctorAvailability(doctor_id=self.doctor.id, weekday=0, start_time=datetime.time(9), end_time=datetime.time(11), slot_minutes=30),
+            DoctorAvailability(doctor_id=self.doctor.id, weekday=1, start_time=datetime.time(9), end_time=datetime.time(10), slot_minutes=30),
+            AvailabilityException(doctor_id=self.doctor.id, date=self.monday, start_time=datetime.time(10), end_time=datetime.time(10, 30)),
+            AvailabilityException(doctor_id=self.doctor.id, date=self.monday + datetime.timedelta(days=1)),
+            AvailabilityException(
+                doctor_id=self.doctor.id, date=self.monday + datetime.timedelta(days=2), available=True,
+                start_time=datetime.time(14), end_time=datetime.time(15), slot_minutes=60,
+            ),
+            Appointment(doctor_id=self.doctor.id, patient_id=self.patient.id, appointment_time=self.at(0, 9, 30), duration_minutes=30, status='pending'),
+            Appointment(doctor_id=self.doctor.id, patient_id=self.patient.id, appointment_time=self.at(0, 10, 30), duration_minutes=30, status='cancelled'),
+        ])
+        self.db.commit()
+        self.assertEqual(self.slots(), [self.at(0, 9), self.at(0, 10, 30), self.at(2, 14)])
+        self.assertEqual(self.slots(now=self.at(0, 10)), [self.at(0, 10, 30), self.at(2, 14)])
+
+
+class BookingTests(SQLiteTestCase):
+    start = datetime.datetime(2031, 3, 3, 10, 0)
+
+    def book(self, minutes_later, duration=30):
+        return book_slot(self.db, self.patient.id, self.doctor.id, self.start + datetime.timedelta(minutes=minutes_later), duration, 'Checkup')
+
+    def test_overlapping_bookings_are_refused(self):
+        first = self.book(0)
+        self.assertEqual((first.status, first.duration_minutes), ('pending', 30))
+        for minutes_later, duration in ((0, 30), (15, 30), (-15, 30), (-60, 120)):
+            with self.assertRaises(SlotUnavailable):
+                self.book(minutes_later, duration)
+        self.book(30)
+        self.book(-30)
+        self.assertEqual(self.db.query(Appointment).count(), 3)
+
+    def test_cancelled_booking_frees_the_slot(self):
+        self.book(0).status = 'cancelled'
+        self.db.commit()
+        self.book(0)
+        self.assertEqual(self.db.query(Appointment).filter_by(status='pending').count(), 1)
+
+    def test_booking_without_a_status_still_holds_the_slot(self):
+        self.book(0).status = None
+        self.db.commit()
+        with self.assertRaises(SlotUnavailable):
+            self.book(15)
+        day = self.start.date()
+        slots = doctor_free_slots(
+            self.db, self.doctor.id, day, day + datetime.timedelta(days=1), now=self.start - datetime.timedelta(days=1),
+        )
+        self.assertIn(self.start + datetime.timedelta(minutes=30), [start for start, _ in slots])
+        self.assertNotIn(self.start, [start for start, _ in slots])
+
+    def test_booking_puts_the_patient_on_the_panel(self):
+        self.book(0)
+        self.assertEqual(
+            [(row.doctor_id, row.patient_id) for row in self.db.query(DoctorPatient)],
+            [(self.doctor.id, self.patient.id)],
+        )
+
+
+@override_settings(PASSWORD_HASH_WORKERS=0, PASSWORD_HASH_METHOD='pbkdf2:sha256:2000')
+class PasswordRehashTests(SQLiteTestCase):
+    def user_with_hash(self, method):
+        user = self.db.query(User).filter_by(role='patient').one()
+        user.password_hash = generate_password_hash('s3cret!', method)
+        self.db.commit()
+        return user
+
+    def stored_hash(self, user):
+        with self.Session() as db:
+            return db.get(User, user.id).password_hash
+
+    def test_outdated_hash_is_replaced_on_login(self):
+        user = self.user_with_hash('pbkdf2:sha256:1000')
+        self.assertTrue(verify_and_upgrade(self.db, user, 's3cret!'))
+        stored = self.stored_hash(user)
+        self.assertTrue(stored.startswith('pbkdf2:sha256:2000$'))
+        self.assertTrue(check_password_hash(stored, 's3cret!'))
+
+    def test_wrong_password_or_current_hash_is_left_alone(self):
+        user = self.user_with_hash('pbkdf2:sha256:1000')
+        old = user.password_hash
+        self.assertFalse(verify_and_upgrade(self.db, user, 'wrong'))
+        self.assertEqual(self.stored_hash(user), old)
+        user = self.user_with_hash('pbkdf2:sha256:2000')
+        current = user.password_hash
+        self.assertTrue(verify_and_upgrade(self.db, user, 's3cret!'))
+        self.assertEqual(self.stored_hash(user), current)
+
+
+class RateLimitTests(SQLiteTestCase):
+    window_start = 6_000_000
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(ratelimit, 'engine', self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def limiters(self):
+        for backend in (LocalBackend(), DatabaseBackend()):
+            with self.subTest(backend=type(backend).__name__):
+                yield SlidingWindowLimiter('login', {'ip': 10, 'username': 3}, 60, backend)
+
+    def at(self, seconds):
+        return mock.patch.object(ratelimit.time, 'time', return_value=self.window_start + seconds)
+
+    def test_limit_is_reached_per_key(self):
+        for limiter in self.limiters():
+            with self.at(5):
+                self.assertEqual([limiter.hit(ip='10.0.0.1', username='Ann') for _ in range(3)], [False, False, True])
+                self.assertTrue(limiter.is_blocked(ip='10.0.0.1', username='ann '))
+                self.assertFalse(limiter.is_blocked(ip='10.0.0.1', username='bob'))
+                limiter.reset(username='ann')
+                self.assertFalse(limiter.is_blocked(username='ann'))
+
+    def test_previous_window_fades_out(self):
+        for limiter in self.limiters():
+            with self.at(50):
+                for _ in range(3):
+                    limiter.hit(username='ann')
+            with self.at(60):
+                self.assertTrue(limiter.is_blocked(username='ann'))
+            with self.at(90):
+                # Half of the previous window still overlaps: 3 * 0.5 + 1 < 3
+                self.assertFalse(limiter.hit(username='ann'))
+            with self.at(180):
+                self.assertFalse(limiter.is_blocked(username='ann'))
+                self.assertFalse(limiter.hit(username='ann'))
+
+    def test_purge_deletes_only_idle_counters(self):
+        for limiter in self.limiters():
+            with self.at(5):
+                limiter.hit(username='ann')
+            with self.at(65):
+                limiter.hit(username='bob')
+            with self.at(130):
+                # ann's window ended two windows ago; bob's previous count still weighs in
+                self.assertEqual(limiter.purge(), 1)
+                remaining = limiter.backend.counters(['login:username:ann', 'login:username:bob'])
+                self.assertEqual(set(remaining), {'login:username:bob'})
+
+
+class ConditionalChartTests(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.record = MedicalRecord(patient_id=self.patient.id, doctor_id=self.doctor.id, diagnosis='Flu')
+        self.db.add(self.record)
+        self.db.commit()
+        self.rendered = 0
+
+        @conditional_chart('doctor', MedicalRecord)
+        def chart(request, patient_id):
+            self.rendered += 1
+            return HttpResponse('chart')
+        self.view = chart
+
+    def get(self, etag=None, principal_id=None):
+        request = RequestFactory().get('/chart/', **({'HTTP_IF_NONE_MATCH': etag} if etag else {}))
+        request.db = self.db
+        request.principal = Principal(principal_id or self.doctor.user_id, 'doctor', self.doctor.id, 'Test Doctor')
+        return self.view(request, patient_id=self.patient.id)
+
+    def test_unchanged_chart_is_not_rendered_again(self):
+        first = self.get()
+        self.assertEqual((first.status_code, self.rendered), (200, 1))
+        self.assertIn('private', first['Cache-Control'])
+        second = self.get(first['ETag'])
+        self.assertEqual((second.status_code, self.rendered), (304, 1))
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_edits_and_deletes_change_the_etag(self):
+        etag = self.get()['ETag']
+        self.record.diagnosis = 'Cold'
+        self.db.commit()
+        edited = self.get(etag)
+        self.assertEqual(edited.status_code, 200)
+        self.db.delete(self.record)
+        self.db.commit()
+        self.assertEqual(self.get(edited['ETag']).status_code, 200)
+
+    def test_etag_is_per_viewer(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(etag, principal_id=999).status_code, 200)
+
+    def test_etag_outlives_the_directory_ttl(self):
+        etag = self.get()['ETag']
+        with mock.patch('time.time', return_value=time.time() + directory.TTL_SECONDS * 10):
+            self.assertEqual(self.get(etag).status_code, 304)
+
+    def test_doctor_rename_changes_the_etag(self):
+        etag = self.get()['ETag']
+        self.doctor.full_name = 'Renamed Doctor'
+        self.db.commit()
+        self.assertEqual(self.get(etag).status_code, 200)
+
+
+class AuditReadTests(SQLiteTestCase):
+    def get(self, view, patient_id):
+        request = RequestFactory().get('/')
+        request.db = self.db
+        request.principal = Principal(self.doctor.user_id, 'doctor', self.doctor.id, 'Test Doctor')
+        with mock.patch.object(audit, 'record') as record:
+            return view(request, patient_id=patient_id), record
+
+    def aget(self, view, patient_id):
+        async def principal(request):
+            return Principal(self.doctor.user_id, 'doctor', self.doctor.id, 'Test Doctor')
+
+        async def run_read(request, func, *args):
+            return func(self.db, *args)
+
+        with mock.patch.object(async_views, 'aget_principal', principal), \
+                mock.patch.object(async_views, 'run_read', run_read), mock.patch.object(audit, 'record') as record:
+            return async_to_sync(view)(RequestFactory().get('/'), patient_id=patient_id), record
+
+    def test_unknown_patient_is_not_found_and_not_audited(self):
+        for view in (
+            views.doctor_patient_medical_history, views.doctor_patient_lab_results, views.doctor_patient_lab_trends,
+            views.doctor_patient_prescriptions, views.doctor_patient_timeline, views.patient_profile_view,
+        ):
+            with self.subTest(view=view.__name__):
+                response, record = self.get(view, self.patient.id + 1000)
+                self.assertEqual(response.status_code, 404)
+                record.assert_not_called()
+        for view in (
+            async_views.doctor_patient_medical_history, async_views.doctor_patient_lab_results,
+            async_views.doctor_patient_lab_trends, async_views.doctor_patient_prescriptions,
+            async_views.doctor_patient_timeline,
+        ):
+            with self.subTest(view=f'async {view.__name__}'):
+                response, record = self.aget(view, self.patient.id + 1000)
+                self.assertEqual(response.status_code, 404)
+                record.assert_not_called()
+
+    def test_known_patient_read_is_audited(self):
+        response, record = self.get(views.doctor_patient_lab_trends, self.patient.id)
+        self.assertEqual(response.status_code, 200)
+        record.assert_called_once_with(mock.ANY, 'read', 'lab_results', self.patient.id, request=mock.ANY)
+
+
+class CareTeamTests(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User(username='other', email='other@example.org', password_hash='-', role='patient')
+        self.db.add(user)
+        self.db.flush()
+        self.other = PatientProfile(user_id=user.id, full_name='Other Patient')
+        self.db.add(self.other)
+        self.db.commit()
+
+    def seen_at(self, when):
+        with mock.patch.object(careteam, 'utcnow', return_value=when):
+            careteam.seen(self.db, self.doctor.id, self.patient.id)
+        self.db.commit()
+
+    def last_seen(self, patient_id=None):
+        self.db.expire_all()
+        row = self.db.query(DoctorPatient).filter_by(doctor_id=self.doctor.id, patient_id=patient_id or self.patient.id).one()
+        return row.last_seen_at.replace(tzinfo=None)
+
+    def test_seen_only_moves_last_seen_forward(self):
+        may, june = datetime.datetime(2026, 5, 1, 9), datetime.datetime(2026, 6, 1, 9)
+        self.seen_at(may)
+        self.assertEqual(self.last_seen(), may)
+        self.seen_at(june)
+        self.assertEqual(self.last_seen(), june)
+        self.seen_at(may)
+        self.assertEqual(self.last_seen(), june)
+        self.assertEqual(self.db.query(DoctorPatient).count(), 1)
+
+    def test_backfill_adds_missing_pairs_without_moving_back(self):
+        june = datetime.datetime(2026, 6, 1, 9)
+        self.seen_at(june)
+        self.db.add_all([
+            MedicalRecord(patient_id=self.patient.id, doctor_id=self.doctor.id, date=datetime.datetime(2026, 1, 1)),
+            Appointment(patient_id=self.other.id, doctor_id=self.doctor.id, appointment_time=datetime.datetime(2025, 2, 3, 10)),
+            Prescription(patient_id=self.other.id, doctor_id=self.doctor.id, date=datetime.datetime(2025, 4, 5)),
+            LabResult(patient_id=self.other.id, doctor_id=None, date=datetime.datetime(2025, 6, 7)),
+        ])
+        self.db.commit()
+        careteam.backfill(self.db)
+        self.db.commit()
+        self.assertEqual(self.last_seen(), june)
+        self.assertEqual(self.last_seen(self.other.id), datetime.datetime(2025, 4, 5))
+        self.assertEqual(self.db.query(DoctorPatient).count(), 2)
+
+    def test_panel_search_and_export_see_only_the_doctors_patients(self):
+        self.seen_at(datetime.datetime(2026, 6, 1, 9))
+        self.assertEqual([row.patient_id for row in careteam.panel_query(self.db, self.doctor.id)], [self.patient.id])
+        self.assertEqual([p.id for p in search_patients(self.db, 'patient', doctor_id=self.doctor.id)], [self.patient.id])
+        self.assertEqual(len(search_patients(self.db, 'patient')), 2)
+        statement = exports.patients_statement(self.doctor.id, {'id': PatientProfile.id})
+        self.assertEqual(self.db.execute(statement).scalars().all(), [self.patient.id])
+
+    def test_csv_export_cells_never_start_a_formula(self):
+        rows = [('=HYPERLINK("http://evil")', '+1 555', '-2+3', '@SUM(A1)', -4, 'Ann')]
+        csv_text = ''.join(exports._encode([rows], ['a', 'b', 'c', 'd', 'e', 'f'], 'csv'))
+        self.assertEqual(csv_text.splitlines()[1], '"\'=HYPERLINK(""http://evil"")",\'+1 555,\'-2+3,\'@SUM(A1),-4,Ann')
+
+
+class DoctorDirectoryVersionTests(SimpleTestCase):
+    def setUp(self):
+        cache.delete(directory.VERSION_KEY)
+        self.addCleanup(cache.delete, directory.VERSION_KEY)
+
+    def test_version_changes_only_on_invalidate(self):
+        version = directory.current_version()
+        # Well past the TTL of the cached lists
+        with mock.patch('time.time', return_value=time.time() + directory.TTL_SECONDS * 10):
+            self.assertEqual(directory.current_version(), version)
+        directory.invalidate()
+        self.assertNotEqual(directory.current_version(), version)
+
+
+@override_settings(STORAGES={'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+class BundleTagTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        for name in ('css/site.css', 'js/site.js'):
+            self.write(name)
+
+    def write(self, name):
+        os.makedirs(os.path.dirname(os.path.join(self.root, name)), exist_ok=True)
+        open(os.path.join(self.root, name), 'w').close()
+
+    def render(self):
+        with self.settings(STATICFILES_DIRS=[self.root], STATIC_ROOT=os.path.join(self.root, 'collected')):
+            return Template("{% load assets %}{% bundle 'dist/app.css' %}{% bundle 'dist/app.js' %}").render(Context())
+
+    def test_fresh_checkout_links_the_sources(self):
+        html = self.render()
+        self.assertIn('<link rel="stylesheet" href="/static/css/site.css">', html)
+        self.assertIn('<script src="/static/js/site.js"></script>', html)
+        self.assertNotIn('dist/', html)
+
+    def test_built_bundles_replace_the_sources(self):
+        for name in ('dist/app.css', 'dist/app.js'):
+            self.write(name)
+        html = self.render()
+        self.assertIn('<link rel="stylesheet" href="/static/dist/app.css">', html)
+        self.assertIn('<script src="/static/dist/app.js"></script>', html)
+        self.assertNotIn('site.', html)
+
+
+class LoadTestReportTests(SimpleTestCase):
+    def test_percentiles_use_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.50), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([7], 0.95), 7)
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_compare_flags_slower_endpoints(self):
+        def report(seconds):
+            recorder = Recorder()
+            for endpoint, value in seconds.items():
+                recorder.add(endpoint, value, True)
+            return build_report(recorder, 1.0, {})
+
+        rows = compare_reports(report({'home': 0.100, 'dashboard': 0.200}), report({'home': 0.105, 'dashboard': 0.300, 'new': 1}))
+        regressed = {endpoint: flag for endpoint, _, _, _, flag in rows}
+        self.assertEqual(regressed, {'(total)': True, 'home': False, 'dashboard': True})
+
+
+class DatasetGeneratorTests(SimpleTestCase):
+    def generate(self, seed):
+        means = {'records': 3, 'prescriptions': 2, 'labs': 4, 'appointments': 6}
+        first_ids = {User: 1, DoctorProfile: 1, PatientProfile: 1, MedicalRecord: 1}
+        generator = Generator(seed, 500, 3, means, first_ids, datetime.date(2026, 1, 1))
+        batches = [tables for _, tables in generator.doctor_batches('hash')] + [tables for _, tables in generator.patient_batches('hash')]
+        return {model: {name: values.tolist() for name, values in columns.items()} for tables in batches for model, columns in tables}
+
+    def test_same_seed_same_rows(self):
+        self.assertEqual(self.generate(3), self.generate(3))
+        self.assertNotEqual(self.generate(3)[Appointment], self.generate(4)[Appointment])
+
+    def test_rows_follow_relationships(self):
+        data = self.generate(5)
+        slots = list(zip(data[Appointment]['doctor_id'], data[Appointment]['appointment_time']))
+        self.assertEqual(len(slots), len(set(slots)))
+        self.assertTrue(all(time.weekday() < 5 and 9 <= time.hour < 17 for _, time in slots))
+        records = dict(zip(data[MedicalRecord]['id'], zip(data[MedicalRecord]['patient_id'], data[MedicalRecord]['doctor_id'])))
+        prescriptions = data[Prescription]
+        for record_id, patient_id, doctor_id in zip(prescriptions['medical_record_id'], prescriptions['patient_id'], prescriptions['doctor_id']):
+            if record_id is not None:
+                self.assertEqual(records[record_id], (patient_id, doctor_id))
+
+
+class SlowQueryLogTests(SimpleTestCase):
+    def test_fingerprint_ignores_values_and_list_lengths(self):
+        first = normalize("SELECT * FROM users WHERE id IN (?, ?, ?) AND name = 'Ann' LIMIT 10")
+        second = normalize("select *  from users\nwhere id in (?) and name = 'O''Brien' limit 20")
+        third = normalize('SELECT * FROM users WHERE id IN (%(id_1)s, %(id_2)s) AND name = %(name)s LIMIT %(param_1)s')
+        self.assertEqual(first, 'select * from users where id in (...) and name = ? limit ?')
+        self.assertEqual(fingerprint(first), fingerprint(second))
+        self.assertEqual(third, first)
+
+    def test_parameter_shape_has_types_only(self):
+        self.assertEqual(parameter_shape({'name': 'Ann', 'id': 3}), {'name': 'str', 'id': 'int'})
+        self.assertEqual(parameter_shape(('Ann', None)), ['str', 'NoneType'])
+
+    def test_summary_groups_by_fingerprint(self):
+        entries = [
+            {'type': 'statement', 'fingerprint': 'a', 'duration_ms': 300, 'ts': 1, 'sql': 's', 'params': [], 'view': 'v'},
+            {'type': 'statement', 'fingerprint': 'b', 'duration_ms': 250, 'ts': 2, 'sql': 't', 'params': [], 'view': None},
+            {'type': 'explain', 'fingerprint': 'a', 'ts': 3, 'plan': ['SCAN users']},
+            {'type': 'statement', 'fingerprint': 'a', 'duration_ms': 500, 'ts': 4, 'sql': 's', 'params': [], 'view': 'v'},
+        ]
+        summary = summarize(entries)
+        self.assertEqual([group['fingerprint'] for group in summary], ['a', 'b'])
+        self.assertEqual((summary[0]['count'], summary[0]['mean_ms'], summary[0]['max_ms']), (2, 400, 500))
+        self.assertEqual(summary[0]['plan'], ['SCAN users'])
+        self.assertEqual(summary[1]['views'], {'(no request)': 1})
+
+    def test_log_is_reopened_after_logrotate_moves_it(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'slow_queries.log')
+        for patcher in (mock.patch.object(slowquery, 'LOG_FILE', path), mock.patch.object(slowquery, '_file_logger', None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        with gzip.open(path + '.2.gz', 'wt', encoding='utf-8') as handle:
+            handle.write('{"n": 1}\n')
+        slowquery._write({'n': 2})
+        os.rename(path, path + '.1')
+        slowquery._write({'n': 3})
+        for handler in slowquery._file_logger.handlers:
+            handler.close()
+            self.addCleanup(slowquery._file_logger.removeHandler, handler)
+        self.assertEqual([entry['n'] for entry in read_log()], [1, 2, 3])
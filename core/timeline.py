@@ -0,0 +1,75 @@
+import datetime
+import heapq
+import itertools
+from collections import namedtuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload
+
+from .models import Appointment, LabResult, MedicalRecord, Prescription
+from .pagination import decode_cursor, encode_cursor
+
+TIMELINE_PAGE_SIZE = 30
+
+TimelineEvent = namedtuple('TimelineEvent', 'date rank id kind obj')
+
+# (kind, model, date column); the position is the tie-break rank for equal timestamps
+SOURCES = [
+    ('appointment', Appointment, Appointment.appointment_time),
+    ('medical_record', MedicalRecord, MedicalRecord.date),
+    ('lab_result', LabResult, LabResult.date),
+    ('prescription', Prescription, Prescription.date),
+]
+
+
+def _events(db, patient_id, rank, kind, model, date_column, cursor, batch_size):
+    """Newest-first events of one kind, fetched lazily in keyset batches off the (patient_id, date) index."""
+    query = (
+        db.query(model)
+        .options(joinedload(model.doctor))
+        .filter(model.patient_id == patient_id, date_column.isnot(None))
+        .order_by(date_column.desc(), model.id.desc())
+    )
+    if cursor is not None:
+        ts, cursor_rank, cursor_id = cursor
+        # Events sort by (date, rank, id) descending; keep only what comes after the cursor
+        if rank < cursor_rank:
+            query = query.filter(date_column <= ts)
+        elif rank == cursor_rank:
+            query = query.filter(date_column <= ts, tuple_(date_column, model.id) < tuple_(ts, cursor_id))
+        else:
+            query = query.filter(date_column < ts)
+    last = None
+    while True:
+        batch_query = query
+        if last is not None:
+            batch_query = batch_query.filter(date_column <= last[0], tuple_(date_column, model.id) < tuple_(*last))
+        rows = batch_query.limit(batch_size).all()
+        for row in rows:
+            yield TimelineEvent(getattr(row, date_column.key), rank, row.id, kind, row)
+        if len(rows) < batch_size:
+            return
+        last = (getattr(rows[-1], date_column.key), rows[-1].id)
+
+
+def patient_timeline(db, patient_id, cursor=None, page_size=TIMELINE_PAGE_SIZE):
+    """One page of a patient's appointments, records, lab results and prescriptions, newest first.
+
+    Each table is already sorted by its (patient_id, date) index, so the
+    sources are merged lazily with heapq.merge: a page reads at most about
+    ``page_size`` rows per table however long the history is. Returns the
+    events and the cursor for the next page (None on the last page).
+    """
+    decoded = decode_cursor(cursor, (datetime.datetime, int, int)) if cursor else None
+    streams = [
+        _events(db, patient_id, rank, kind, model, date_column, decoded, page_size + 1)
+        for rank, (kind, model, date_column) in enumerate(SOURCES)
+    ]
+    merged = heapq.merge(*streams, key=lambda e: (e.date, e.rank, e.id), reverse=True)
+    events = list(itertools.islice(merged, page_size + 1))
+    next_cursor = None
+    if len(events) > page_size:
+        events = events[:page_size]
+        last = events[-1]
+        next_cursor = encode_cursor([last.date, last.rank, last.id])
+    return events, next_cursor
@@ -0,0 +1,125 @@
+import numpy as np
+
+from .models import LabResult
+
+ROLLING_WINDOW = 3
+
+
+def load_series(db, patient_id, analyte_code=None):
+    """A patient's structured lab values as NumPy arrays, sorted by (analyte, unit, date).
+
+    Returns ``(codes, units, days, values)`` where ``days`` is the sample time
+    in fractional days since the epoch.
+    """
+    query = (
+        db.query(LabResult.analyte_code, LabResult.unit, LabResult.date, LabResult.value_numeric)
+        .filter(
+            LabResult.patient_id == patient_id,
+            LabResult.analyte_code.isnot(None),
+            LabResult.value_numeric.isnot(None),
+            LabResult.date.isnot(None),
+        )
+        .order_by(LabResult.analyte_code, LabResult.unit, LabResult.date, LabResult.id)
+    )
+    if analyte_code:
+        query = query.filter(LabResult.analyte_code == analyte_code)
+    rows = query.all()
+    if not rows:
+        empty = np.array([])
+        return empty.astype(object), empty.astype(object), empty, empty
+    codes, units, dates, values = zip(*rows)
+    days = np.array(dates, dtype='datetime64[s]').astype(np.float64) / 86400.0
+    return np.array(codes, dtype=object), np.array(units, dtype=object), days, np.array(values, dtype=np.float64)
+
+
+def rolling_mean(values, starts, window=ROLLING_WINDOW):
+    """Trailing mean over at most ``window`` points, never crossing into the previous series.
+
+    ``starts`` holds, for every sample, the index where its series begins.
+    """
+    index = np.arange(len(values))
+    first = np.maximum(starts, index - window + 1)
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    return (cumulative[index + 1] - cumulative[first]) / (index + 1 - first)
+
+
+def _series_starts(keys, n):
+    """Start index of every (analyte, unit) series in sorted samples."""
+    changed = np.zeros(max(n - 1, 0), dtype=bool)
+    for key in keys:
+        changed |= key[1:] != key[:-1]
+    return np.concatenate(([0], np.flatnonzero(changed) + 1))
+
+
+def compute_trends(codes, units, days, values, window=ROLLING_WINDOW):
+    """Per-(analyte, unit) summary computed for every series at once, with no per-sample Python loop.
+
+    Values in different units are never mixed: an analyte reported in two
+    units gets one entry per unit. Each entry has the latest value, the
+    change since the previous sample, the trailing rolling mean, the
+    least-squares slope per 30 days and the percent change from the first to
+    the latest sample.
+    """
+    n = len(values)
+    if n == 0:
+        return []
+    group_starts = _series_starts((codes, units), n)
+    group_ends = np.concatenate((group_starts[1:], [n])) - 1
+    counts = group_ends - group_starts + 1
+    starts = np.repeat(group_starts, counts)
+
+    rolling = rolling_mean(values, starts, window)
+
+    # Least-squares slope from per-group sums; time is centred on each group's first sample
+    t = days - days[starts]
+    sum_t = np.add.reduceat(t, group_starts)
+    sum_v = np.add.reduceat(values, group_starts)
+    sum_tt = np.add.reduceat(t * t, group_starts)
+    sum_tv = np.add.reduceat(t * values, group_starts)
+    denominator = counts * sum_tt - sum_t * sum_t
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(denominator > 0, (counts * sum_tv - sum_t * sum_v) / denominator, np.nan)
+        first_values = values[group_starts]
+        last_values = values[group_ends]
+        percent_change = np.where((first_values != 0) & (counts > 1), (last_values - first_values) / np.abs(first_values) * 100.0, np.nan)
+    previous = np.where(counts > 1, values[np.maximum(group_ends - 1, group_starts)], np.nan)
+    delta = last_values - previous
+
+    trends = []
+    for i, end in enumerate(group_ends):
+        trends.append({
+            'analyte_code': codes[end],
+            'unit': units[end],
+            'count': int(counts[i]),
+            'latest': float(last_values[i]),
+            'delta': _or_none(delta[i]),
+            'rolling_mean': float(rolling[end]),
+            'slope_per_30_days': _or_none(slope[i] * 30.0),
+            'percent_change': _or_none(percent_change[i]),
+        })
+    return trends
+
+
+def series_points(units, days, values, window=ROLLING_WINDOW):
+    """Dates, values, units and rolling means of a single analyte's samples, ready for JSON.
+
+    Samples come unit by unit, each unit in date order, and the rolling mean
+    restarts at every unit.
+    """
+    n = len(values)
+    group_starts = _series_starts((units,), n)
+    starts = np.repeat(group_starts, np.diff(np.concatenate((group_starts, [n]))))
+    return {
+        'dates': np.datetime_as_string((days * 86400).astype('datetime64[s]')).tolist(),
+        'values': values.tolist(),
+        'units': units.tolist(),
+        'rolling_mean': rolling_mean(values, starts, window).tolist(),
+    }
+
+
+def _or_none(value):
+    return None if np.isnan(value) else float(value)
+
+
+def patient_trends(db, patient_id, window=ROLLING_WINDOW):
+    return compute_trends(*load_series(db, patient_id), window=window)
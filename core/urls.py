@@ -1,5 +1,12 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import metrics, views
+
+# Under an ASGI server the chart reads can run as async views on their own pool
+if settings.ASYNC_READ_VIEWS:
+    from . import async_views as read_views
+else:
+    read_views = views
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -9,19 +16,29 @@ urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
     path('patient/profile/', views.patient_profile, name='patient_profile'),
     path('patient/profile/<int:patient_id>/', views.patient_profile_view, name='patient_profile_view'),
-    path('patient/lab-results/', views.patient_lab_results, name='patient_lab_results'),
-    path('patient/prescriptions/', views.patient_prescriptions, name='patient_prescriptions'),
-    path('patient/medical-history/', views.patient_medical_history, name='patient_medical_history'),
+    path('patient/lab-results/', read_views.patient_lab_results, name='patient_lab_results'),
+    path('patient/prescriptions/', read_views.patient_prescriptions, name='patient_prescriptions'),
+    path('patient/medical-history/', read_views.patient_medical_history, name='patient_medical_history'),
     path('patient/book-appointment/', views.book_appointment, name='book_appointment'),
-    path('patient/appointments/', views.patient_appointments, name='patient_appointments'),
+    path('doctors/search/', views.doctor_search, name='doctor_search'),
+    path('patient/appointments/', read_views.patient_appointments, name='patient_appointments'),
     path('doctor/appointments/', views.doctor_appointments, name='doctor_appointments'),
+    path('doctor/availability/', views.doctor_availability, name='doctor_availability'),
+    path('doctor/appointments/export/', views.doctor_appointments_export, name='doctor_appointments_export'),
     path('doctor/patients/', views.doctor_patients, name='doctor_patients'),
+    path('doctor/patients/search/', views.doctor_patient_search, name='doctor_patient_search'),
+    path('doctor/patients/export/', views.doctor_patients_export, name='doctor_patients_export'),
     path('doctor/patient/<int:patient_id>/add-medical-record/', views.add_medical_record, name='add_medical_record'),
     path('doctor/patient/<int:patient_id>/add-lab-result/', views.add_lab_result, name='add_lab_result'),
     path('doctor/patient/<int:patient_id>/add-prescription/', views.add_prescription, name='add_prescription'),
-    path('doctor/patient/<int:patient_id>/medical-history/', views.doctor_patient_medical_history, name='doctor_patient_medical_history'),
-    path('doctor/patient/<int:patient_id>/lab-results/', views.doctor_patient_lab_results, name='doctor_patient_lab_results'),
-    path('doctor/patient/<int:patient_id>/prescriptions/', views.doctor_patient_prescriptions, name='doctor_patient_prescriptions'),
+    path('doctor/patient/<int:patient_id>/medical-history/', read_views.doctor_patient_medical_history, name='doctor_patient_medical_history'),
+    path('doctor/patient/<int:patient_id>/lab-results/', read_views.doctor_patient_lab_results, name='doctor_patient_lab_results'),
+    path('doctor/patient/<int:patient_id>/lab-trends/', read_views.doctor_patient_lab_trends, name='doctor_patient_lab_trends'),
+    path('doctor/patient/<int:patient_id>/prescriptions/', read_views.doctor_patient_prescriptions, name='doctor_patient_prescriptions'),
+    path('doctor/patient/<int:patient_id>/timeline/', read_views.doctor_patient_timeline, name='doctor_patient_timeline'),
     path('doctor/medical-record/<int:record_id>/edit/', views.edit_medical_record, name='edit_medical_record'),
     path('change-password/', views.change_password, name='change_password'),
+    path('metrics', metrics.metrics, name='metrics'),
+    path('healthz', metrics.healthz, name='healthz'),
+    path('readyz', metrics.readyz, name='readyz'),
 ] 
\ No newline at end of file
@@ -3,26 +3,39 @@ from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.conf import settings
 from django.views.decorators.csrf import csrf_protect
-from .forms import RegistrationForm, LoginForm, PatientProfileForm, MedicalRecordForm, LabResultForm, PrescriptionForm, ChangePasswordForm
-from .models import SessionLocal, User, Base, PatientProfile, LabResult, Prescription, MedicalRecord, Appointment, DoctorProfile
+from .forms import RegistrationForm, LoginForm, PatientProfileForm, MedicalRecordForm, LabResultForm, PrescriptionForm, ChangePasswordForm, AvailabilityForm, AvailabilityExceptionForm
+from .db import pinned_to_primary, read_only, session_scope
+from .conditional import conditional_chart
+from .audit import audit_read
+from . import audit
+from . import careteam
+from .pagecache import cache_page_per_role
+from .ratelimit import login_limiter
+from .hashing import HashingBusy, hash_password, verify_and_upgrade, verify_password
+from .pagination import Page, paginate, filter_date_range
+from .search import search_patients, SEARCH_LIMIT, TYPEAHEAD_LIMIT
+from .timeline import patient_timeline
+from . import exports
+from .trends import load_series, compute_trends, patient_trends, series_points
+from .directory import doctor_directory, search_directory, specialties
+from .scheduling import SlotUnavailable, book_slot, doctor_free_slots, week_start
+from .models import User, PatientProfile, LabResult, Prescription, MedicalRecord, Appointment, DoctorProfile, DoctorAvailability, AvailabilityException, DoctorPatient
 from sqlalchemy.exc import IntegrityError
-from werkzeug.security import generate_password_hash, check_password_hash
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django import forms
 from sqlalchemy.orm import joinedload
 import time
-from django.core.cache import cache
+import datetime
 from django.utils.deprecation import MiddlewareMixin
 
 # Always deploy with HTTPS in production!
 # Never log sensitive data (passwords, tokens, medical info, etc.)
 
-# Ensure tables exist
-Base.metadata.create_all(bind=SessionLocal.kw["bind"])
-
 class SecurityHeadersMiddleware(MiddlewareMixin):
     def process_response(self, request, response):
-        response['Content-Security-Policy'] = "default-src 'self' https://cdn.jsdelivr.net https://cdnjs.cloudflare.com https://fonts.googleapis.com https://fonts.gstatic.com; style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net https://fonts.googleapis.com https://fonts.gstatic.com https://cdnjs.cloudflare.com; script-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net https://cdnjs.cloudflare.com; font-src 'self' https://fonts.gstatic.com https://cdnjs.cloudflare.com;"
+        # Everything is self-hosted (manage.py build_assets), with no inline scripts or style attributes;
+        # Bootstrap's CSS draws some icons from data: SVGs
+        response['Content-Security-Policy'] = "default-src 'self'; img-src 'self' data:; object-src 'none'; base-uri 'self'; form-action 'self'"
         response['Referrer-Policy'] = 'strict-origin-when-cross-origin'
         response['X-Frame-Options'] = 'DENY'
         response['X-Content-Type-Options'] = 'nosniff'
@@ -33,12 +46,12 @@ def register(request):
     if request.method == 'POST':
         form = RegistrationForm(request.POST)
         if form.is_valid():
-            db = SessionLocal()
+            db = request.db
             try:
                 user = User(
                     username=form.cleaned_data['username'],
                     email=form.cleaned_data['email'],
-                    password_hash=generate_password_hash(form.cleaned_data['password']),
+                    password_hash=hash_password(form.cleaned_data['password']),
                     role=form.cleaned_data['role'],
                 )
                 db.add(user)
@@ -56,8 +69,9 @@ def register(request):
             except IntegrityError:
                 db.rollback()
                 messages.error(request, 'Username or email already exists.')
-            finally:
-                db.close()
+            except HashingBusy:
+                messages.error(request, 'The server is busy. Please try again in a moment.')
+                return render(request, 'register.html', {'form': form}, status=503)
     else:
         form = RegistrationForm()
     return render(request, 'register.html', {'form': form})
@@ -66,32 +80,34 @@ def register(request):
 def login_view(request):
     if request.method == 'POST':
         form = LoginForm(request.POST)
+        limiter = login_limiter()
         ip = request.META.get('REMOTE_ADDR')
-        fail_key = f'login_fail_{ip}'
-        block_key = f'login_block_{ip}'
-        if cache.get(block_key):
+        username = request.POST.get('username', '')
+        if limiter.is_blocked(ip=ip, username=username):
             messages.error(request, 'Too many failed login attempts. Please try again later.')
             return render(request, 'login.html', {'form': form})
         if form.is_valid():
-            db = SessionLocal()
+            db = request.db
             user = db.query(User).filter_by(username=form.cleaned_data['username'], role=form.cleaned_data['role']).first()
-            if user and check_password_hash(user.password_hash, form.cleaned_data['password']):
-                cache.delete(fail_key)
-                cache.delete(block_key)
+            try:
+                # Stored hashes are upgraded to the current PASSWORD_HASH_METHOD here
+                authenticated = user is not None and verify_and_upgrade(db, user, form.cleaned_data['password'])
+            except HashingBusy:
+                messages.error(request, 'The server is busy. Please try again in a moment.')
+                return render(request, 'login.html', {'form': form}, status=503)
+            if authenticated:
+                # The IP counter is kept, so one valid account can't be used to reset it
+                limiter.reset(username=username)
                 request.session.cycle_key()  # Prevent session fixation
                 request.session['user_id'] = user.id
                 request.session['role'] = user.role
                 messages.success(request, f'Welcome, {user.username}!')
                 return redirect('dashboard')
             else:
-                fails = cache.get(fail_key, 0) + 1
-                cache.set(fail_key, fails, 600)
-                if fails >= 5:
-                    cache.set(block_key, True, 600)
+                if limiter.hit(ip=ip, username=username):
                     messages.error(request, 'Too many failed login attempts. Please try again in 10 minutes.')
                 else:
                     messages.error(request, 'Invalid username, password, or role.')
-            db.close()
     else:
         form = LoginForm()
     return render(request, 'login.html', {'form': form})
@@ -101,29 +117,26 @@ def logout_view(request):
     messages.info(request, 'You have been logged out.')
     return redirect('login')
 
+@cache_page_per_role()
 def dashboard(request):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id:
+    principal = request.principal
+    if not principal:
         return redirect('login')
-    return render(request, 'dashboard.html', {'role': role})
+    return render(request, 'dashboard.html', {'role': principal.role})
 
 def patient_profile(request):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id or role != 'patient':
+    principal = request.principal
+    if not principal or principal.role != 'patient':
         return redirect('login')
-    db = SessionLocal()
-    user = db.query(User).filter_by(id=user_id).first()
-    profile = db.query(PatientProfile).filter_by(user_id=user_id).first()
-    if not profile or profile.user_id != user_id:
-        db.close()
+    db = request.db
+    profile = db.query(PatientProfile).filter_by(user_id=principal.user_id).first()
+    if not profile:
         return HttpResponse('Unauthorized', status=403)
     if request.method == 'POST':
         form = PatientProfileForm(request.POST)
         if form.is_valid():
             if not profile:
-                profile = PatientProfile(user_id=user_id)
+                profile = PatientProfile(user_id=principal.user_id)
                 db.add(profile)
             profile.full_name = form.cleaned_data['full_name']
             profile.date_of_birth = form.cleaned_data['date_of_birth']
@@ -131,7 +144,6 @@ def patient_profile(request):
             profile.phone = form.cleaned_data['phone']
             db.commit()
             messages.success(request, 'Profile updated successfully.')
-            db.close()
             return redirect('patient_profile')
     else:
         initial = {}
@@ -143,187 +155,351 @@ def patient_profile(request):
                 'phone': profile.phone,
             }
         form = PatientProfileForm(initial=initial)
-    db.close()
     return render(request, 'patient_profile.html', {'form': form})
 
+@read_only
+@audit_read('patient_profiles')
 def patient_profile_view(request, patient_id):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id or role != 'doctor':
+    principal = request.principal
+    if not principal or principal.role != 'doctor':
         return redirect('login')
-    db = SessionLocal()
+    db = request.db
     profile = db.query(PatientProfile).filter_by(id=patient_id).first()
-    db.close()
     if not profile:
         return HttpResponse('Patient profile not found.', status=404)
     return render(request, 'patient_profile_view.html', {'profile': profile})
 
+@read_only
+@conditional_chart('patient', LabResult)
 def patient_lab_results(request):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id or role != 'patient':
+    principal = request.principal
+    if not principal or principal.role != 'patient':
         return redirect('login')
-    db = SessionLocal()
-    profile = db.query(PatientProfile).filter_by(user_id=user_id).first()
-    results = (
-        db.query(LabResult)
-        .options(joinedload(LabResult.doctor))
-        .filter_by(patient_id=profile.id)
-        .all()
-    ) if profile else []
-    db.close()
-    return render(request, 'patient_lab_results.html', {'results': results})
+    page = patient_records(request.db, request, principal.profile_id, LabResult, LabResult.date) if principal.profile_id else Page.empty()
+    return render(request, 'patient_lab_results.html', {'results': page.items, 'page': page})
 
+@read_only
+@conditional_chart('patient', Prescription)
 def patient_prescriptions(request):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id or role != 'patient':
+    principal = request.principal
+    if not principal or principal.role != 'patient':
         return redirect('login')
-    db = SessionLocal()
-    profile = db.query(PatientProfile).filter_by(user_id=user_id).first()
-    prescriptions = (
-        db.query(Prescription)
-        .options(joinedload(Prescription.doctor))
-        .filter_by(patient_id=profile.id)
-        .all()
-    ) if profile else []
-    db.close()
-    return render(request, 'patient_prescriptions.html', {'prescriptions': prescriptions})
+    page = patient_records(request.db, request, principal.profile_id, Prescription, Prescription.date) if principal.profile_id else Page.empty()
+    return render(request, 'patient_prescriptions.html', {'prescriptions': page.items, 'page': page})
 
+@read_only
+@conditional_chart('patient', MedicalRecord)
 def patient_medical_history(request):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id or role != 'patient':
+    principal = request.principal
+    if not principal or principal.role != 'patient':
         return redirect('login')
-    db = SessionLocal()
-    profile = db.query(PatientProfile).filter_by(user_id=user_id).first()
-    records = (
-        db.query(MedicalRecord)
-        .options(joinedload(MedicalRecord.doctor))
-        .filter_by(patient_id=profile.id)
-        .all()
-    ) if profile else []
-    db.close()
-    return render(request, 'patient_medical_history.html', {'records': records})
+    page = patient_records(request.db, request, principal.profile_id, MedicalRecord, MedicalRecord.date) if principal.profile_id else Page.empty()
+    return render(request, 'patient_medical_history.html', {'records': page.items, 'page': page})
 
+@read_only
+@conditional_chart('patient', Appointment)
 def patient_appointments(request):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id or role != 'patient':
+    principal = request.principal
+    if not principal or principal.role != 'patient':
         return redirect('login')
-    db = SessionLocal()
-    profile = db.query(PatientProfile).filter_by(user_id=user_id).first()
-    appointments = (
-        db.query(Appointment)
-        .options(joinedload(Appointment.doctor))
-        .filter_by(patient_id=profile.id)
-        .all()
-    ) if profile else []
-    db.close()
-    return render(request, 'patient_appointments.html', {'appointments': appointments})
+    page = patient_records(request.db, request, principal.profile_id, Appointment, Appointment.appointment_time) if principal.profile_id else Page.empty()
+    return render(request, 'patient_appointments.html', {'appointments': page.items, 'page': page})
+
+def patient_records(db, request, patient_id, model, date_column):
+    """One page of a patient's ``model`` rows (with their doctor), filtered and ordered from the query string.
+
+    Shared with the async views in core.async_views, which run it through AsyncSession.run_sync.
+    """
+    return paginate(
+        request,
+        filter_date_range(
+            db.query(model).options(joinedload(model.doctor)).filter_by(patient_id=patient_id),
+            date_column, request,
+        ),
+        date_column, model.id,
+    )
+
+def doctor_patient_records(db, request, patient_id, model, date_column):
+    """(patient, page); the patient is None, with an empty page, when ``patient_id`` does not exist."""
+    patient = db.query(PatientProfile).filter_by(id=patient_id).first()
+    return patient, patient_records(db, request, patient_id, model, date_column) if patient else Page.empty()
 
 class AppointmentForm(forms.Form):
-    doctor_id = forms.ChoiceField(label='Doctor', choices=[], required=True)
-    appointment_time = forms.DateTimeField(widget=forms.DateTimeInput(attrs={'type': 'datetime-local'}), required=True)
+    doctor_id = forms.IntegerField(widget=forms.HiddenInput, required=True)
+    slot = forms.ChoiceField(label='Time', choices=[], required=True)
     reason = forms.CharField(widget=forms.Textarea, required=True)
 
+def _slot_choices(slots):
+    return [(start.isoformat(), start.strftime('%a %d %b %Y, %H:%M')) for start, end in slots]
+
 def book_appointment(request):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id or role != 'patient':
+    principal = request.principal
+    if not principal or principal.role != 'patient':
         return redirect('login')
-    db = SessionLocal()
-    profile = db.query(PatientProfile).filter_by(user_id=user_id).first()
-    doctors = db.query(DoctorProfile).all()
-    doctor_choices = [(str(d.id), d.full_name or f"Doctor {d.id}") for d in doctors]
+    db = request.db
+    # Doctors are picked with the typeahead, so only the cached directory is needed here
+    directory, doctors_by_id = doctor_directory()
     debug_message = None
-    if not doctor_choices:
+    if not directory:
         debug_message = "No doctors are available. Please ask an admin to register a doctor."
+    try:
+        doctor_id = int(request.POST.get('doctor_id') or request.GET.get('doctor_id') or 0)
+    except ValueError:
+        doctor_id = 0
+    doctor = doctors_by_id.get(doctor_id)
+    doctor_id = doctor.id if doctor else None
+    today = datetime.date.today()
+    try:
+        if request.method == 'POST':
+            # Check the posted slot against the week it falls in
+            week = week_start(datetime.datetime.fromisoformat(request.POST.get('slot', '')).date())
+        else:
+            week = week_start(datetime.date.fromisoformat(request.GET.get('week', '')))
+    except ValueError:
+        week = week_start(today)
+    week = max(week, week_start(today))
+    # One range query per doctor-week; only genuinely free slots are offered
+    slots = doctor_free_slots(db, doctor_id, week, week + datetime.timedelta(days=7)) if doctor_id else []
+    slot_lengths = {start.isoformat(): end - start for start, end in slots}
+    slot_choices = _slot_choices(slots)
     if request.method == 'POST':
-        # Set choices before instantiating with POST data
-        form = AppointmentForm()
-        form.fields['doctor_id'].choices = doctor_choices
         form = AppointmentForm(request.POST)
-        form.fields['doctor_id'].choices = doctor_choices
+        form.fields['slot'].choices = slot_choices
         if form.is_valid():
-            appointment = Appointment(
-                patient_id=profile.id,
-                doctor_id=int(form.cleaned_data['doctor_id']),
-                appointment_time=form.cleaned_data['appointment_time'],
-                reason=form.cleaned_data['reason'],
-                status='pending',
-            )
-            db.add(appointment)
-            db.commit()
-            messages.success(request, 'Appointment booked successfully.')
-            db.close()
-            return redirect('dashboard')
+            slot = form.cleaned_data['slot']
+            try:
+                book_slot(
+                    db,
+                    principal.profile_id,
+                    doctor_id,
+                    datetime.datetime.fromisoformat(slot),
+                    int(slot_lengths[slot].total_seconds() // 60),
+                    form.cleaned_data['reason'],
+                )
+            except SlotUnavailable:
+                # Someone else got there first; offer the slots that are still free
+                slot_choices = _slot_choices(doctor_free_slots(db, doctor_id, week, week + datetime.timedelta(days=7)))
+                form.fields['slot'].choices = slot_choices
+                form.add_error('slot', 'That time was just booked by someone else. Please pick another slot.')
+            else:
+                messages.success(request, 'Appointment booked successfully.')
+                return redirect('dashboard')
+        elif 'slot' in form.errors:
+            form.errors['slot'] = form.error_class(['That time is no longer available. Please pick another slot.'])
     else:
-        form = AppointmentForm()
-        form.fields['doctor_id'].choices = doctor_choices
-    db.close()
-    return render(request, 'book_appointment.html', {'form': form, 'debug_message': debug_message})
+        form = AppointmentForm(initial={'doctor_id': doctor_id})
+        form.fields['slot'].choices = slot_choices
+    return render(request, 'book_appointment.html', {
+        'form': form,
+        'debug_message': debug_message,
+        'doctor_id': doctor_id,
+        'doctor': doctor,
+        'specialties': specialties(directory),
+        'week': week,
+        'previous_week': week - datetime.timedelta(days=7) if week > week_start(today) else None,
+        'next_week': week + datetime.timedelta(days=7),
+        'has_slots': bool(slot_choices),
+    })
+
+def doctor_availability(request):
+    principal = request.principal
+    if not principal or principal.role != 'doctor':
+        return redirect('login')
+    db = request.db
+    doctor_id = principal.profile_id
+    if not doctor_id:
+        return HttpResponse('Doctor profile not found.', status=404)
+    template_form = AvailabilityForm(prefix='tpl')
+    exception_form = AvailabilityExceptionForm(prefix='exc')
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        if action == 'add_template':
+            template_form = AvailabilityForm(request.POST, prefix='tpl')
+            if template_form.is_valid():
+                db.add(DoctorAvailability(doctor_id=doctor_id, **template_form.cleaned_data))
+                db.commit()
+                messages.success(request, 'Working hours added.')
+                return redirect('doctor_availability')
+        elif action == 'add_exception':
+            exception_form = AvailabilityExceptionForm(request.POST, prefix='exc')
+            if exception_form.is_valid():
+                db.add(AvailabilityException(doctor_id=doctor_id, **exception_form.cleaned_data))
+                db.commit()
+                messages.success(request, 'Exception added.')
+                return redirect('doctor_availability')
+        elif action in ('delete_template', 'delete_exception'):
+            model = DoctorAvailability if action == 'delete_template' else AvailabilityException
+            db.query(model).filter_by(id=request.POST.get('id'), doctor_id=doctor_id).delete()
+            db.commit()
+            messages.success(request, 'Removed.')
+            return redirect('doctor_availability')
+    templates = (
+        db.query(DoctorAvailability)
+        .filter_by(doctor_id=doctor_id)
+        .order_by(DoctorAvailability.weekday, DoctorAvailability.start_time)
+        .all()
+    )
+    exceptions = (
+        db.query(AvailabilityException)
+        .filter(AvailabilityException.doctor_id == doctor_id, AvailabilityException.date >= datetime.date.today())
+        .order_by(AvailabilityException.date, AvailabilityException.start_time)
+        .all()
+    )
+    return render(request, 'doctor_availability.html', {
+        'templates': templates,
+        'exceptions': exceptions,
+        'template_form': template_form,
+        'exception_form': exception_form,
+    })
 
 def create_missing_doctor_profiles():
-    db = SessionLocal()
-    doctor_users = db.query(User).filter_by(role='doctor').all()
-    for user in doctor_users:
-        if not db.query(DoctorProfile).filter_by(user_id=user.id).first():
-            doctor_profile = DoctorProfile(user_id=user.id, full_name=user.username)
-            db.add(doctor_profile)
-    db.commit()
-    db.close()
+    with session_scope() as db:
+        doctor_users = db.query(User).filter_by(role='doctor').all()
+        for user in doctor_users:
+            if not db.query(DoctorProfile).filter_by(user_id=user.id).first():
+                doctor_profile = DoctorProfile(user_id=user.id, full_name=user.username)
+                db.add(doctor_profile)
+        db.commit()
 
 def doctor_appointments(request):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id or role != 'doctor':
+    principal = request.principal
+    if not principal or principal.role != 'doctor':
         return redirect('login')
-    db = SessionLocal()
-    doctor_profile = db.query(DoctorProfile).filter_by(user_id=user_id).first()
-    appointments = (
-        db.query(Appointment)
-        .options(joinedload(Appointment.patient))
-        .filter_by(doctor_id=doctor_profile.id)
-        .all()
-    ) if doctor_profile else []
+    db = request.db
+    doctor_id = principal.profile_id
     # Handle status update actions
-    if request.method == 'POST':
+    if request.method == 'POST' and doctor_id:
         appointment_id = request.POST.get('appointment_id')
         action = request.POST.get('action')
-        appointment = db.query(Appointment).filter_by(id=appointment_id, doctor_id=doctor_profile.id).first()
+        appointment = db.query(Appointment).filter_by(id=appointment_id, doctor_id=doctor_id).first()
         if appointment and action in ['confirmed', 'completed', 'cancelled']:
             appointment.status = action
-            db.commit()
-            messages.success(request, f'Appointment marked as {action}.')
-        return redirect('doctor_appointments')
-    db.close()
-    return render(request, 'doctor_appointments.html', {'appointments': appointments})
+            try:
+                db.commit()
+            except IntegrityError:
+                # Reviving a cancelled appointment whose time has since been booked again
+                db.rollback()
+                messages.error(request, 'That appointment overlaps another booking and cannot be reinstated.')
+            else:
+                messages.success(request, f'Appointment marked as {action}.')
+        return redirect(request.get_full_path())
+    status = request.GET.get('status', '')
+    if doctor_id:
+        appointments_query = db.query(Appointment).options(joinedload(Appointment.patient)).filter_by(doctor_id=doctor_id)
+        if status in ('pending', 'confirmed', 'completed', 'cancelled'):
+            appointments_query = appointments_query.filter_by(status=status)
+        appointments_query = filter_date_range(appointments_query, Appointment.appointment_time, request)
+        page = paginate(request, appointments_query, Appointment.appointment_time, Appointment.id)
+    else:
+        page = Page.empty()
+    return render(request, 'doctor_appointments.html', {'appointments': page.items, 'page': page, 'status': status})
+
+def doctor_appointments_export(request):
+    principal = request.principal
+    if not principal or principal.role != 'doctor':
+        return redirect('login')
+    if not principal.profile_id:
+        return HttpResponse('Doctor profile not found.', status=404)
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return HttpResponse('Unsupported export format.', status=400)
+    try:
+        columns = exports.select_columns(exports.APPOINTMENT_COLUMNS, request.GET.get('columns'))
+    except exports.ExportError as e:
+        return HttpResponse(str(e), status=400)
+    statement = exports.appointments_statement(principal.profile_id, columns)
+    filters = {key: request.GET[key] for key in ('from', 'to') if request.GET.get(key)}
+    status = request.GET.get('status')
+    if status in ('pending', 'confirmed', 'completed', 'cancelled'):
+        statement = statement.where(Appointment.status == status)
+        filters['status'] = status
+    statement = filter_date_range(statement, Appointment.appointment_time, request)
+    audit.record(principal, 'export', 'appointments', None, request=request,
+                 details={'format': fmt, 'columns': list(columns), 'filters': filters})
+    return exports.export_response(
+        statement, list(columns), fmt, 'appointments',
+        compress=request.GET.get('gzip') == '1', use_replica=not pinned_to_primary(request),
+    )
 
+@read_only
 def doctor_patients(request):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id or role != 'doctor':
+    principal = request.principal
+    if not principal or principal.role != 'doctor':
         return redirect('login')
-    db = SessionLocal()
+    db = request.db
     query = request.GET.get('q', '').strip()
-    patients_query = db.query(PatientProfile)
     if query:
-        patients_query = patients_query.filter(PatientProfile.full_name.ilike(f'%{query}%'))
-    patients = patients_query.all()
-    db.close()
-    return render(request, 'doctor_patients.html', {'patients': patients, 'query': query})
+        # Within the panel, ranked and capped; refine the search rather than paging through matches
+        page = Page(search_patients(db, query, limit=SEARCH_LIMIT, doctor_id=principal.profile_id))
+    else:
+        # Only the doctor's own panel, most recently seen first
+        panel = careteam.panel_query(db, principal.profile_id)
+        page = paginate(request, panel, DoctorPatient.last_seen_at, DoctorPatient.patient_id)
+    return render(request, 'doctor_patients.html', {'patients': page.items, 'page': page, 'query': query})
+
+def doctor_patients_export(request):
+    principal = request.principal
+    if not principal or principal.role != 'doctor':
+        return redirect('login')
+    if not principal.profile_id:
+        return HttpResponse('Doctor profile not found.', status=404)
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return HttpResponse('Unsupported export format.', status=400)
+    try:
+        columns = exports.select_columns(exports.PATIENT_COLUMNS, request.GET.get('columns'))
+    except exports.ExportError as e:
+        return HttpResponse(str(e), status=400)
+    statement = exports.patients_statement(principal.profile_id, columns)
+    audit.record(principal, 'export', 'patients', None, request=request,
+                 details={'format': fmt, 'columns': list(columns), 'filters': {'panel': principal.profile_id}})
+    return exports.export_response(
+        statement, list(columns), fmt, 'patients',
+        compress=request.GET.get('gzip') == '1', use_replica=not pinned_to_primary(request),
+    )
+
+@read_only
+def doctor_patient_search(request):
+    principal = request.principal
+    if not principal or principal.role != 'doctor':
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    query = request.GET.get('q', '').strip()
+    if len(query) < 2:
+        return JsonResponse({'results': []})
+    patients = search_patients(request.db, query, limit=TYPEAHEAD_LIMIT, doctor_id=principal.profile_id)
+    return JsonResponse({'results': [
+        {
+            'id': p.id,
+            'full_name': p.full_name,
+            'date_of_birth': p.date_of_birth.isoformat() if p.date_of_birth else None,
+            'phone': p.phone,
+        }
+        for p in patients
+    ]})
+
+@read_only
+def doctor_search(request):
+    if not request.principal:
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    directory, _ = doctor_directory()
+    doctors = search_directory(
+        directory,
+        request.GET.get('q', '').strip(),
+        request.GET.get('specialty', '').strip(),
+        limit=TYPEAHEAD_LIMIT,
+    )
+    return JsonResponse({'results': [
+        {'id': d.id, 'full_name': d.full_name, 'specialty': d.specialty}
+        for d in doctors
+    ]})
 
 def add_medical_record(request, patient_id):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id or role != 'doctor':
+    principal = request.principal
+    if not principal or principal.role != 'doctor':
         return redirect('login')
-    db = SessionLocal()
+    db = request.db
     patient = db.query(PatientProfile).filter_by(id=patient_id).first()
-    doctor = db.query(DoctorProfile).filter_by(user_id=user_id).first()
-    if not patient or not doctor:
-        db.close()
+    if not patient or not principal.profile_id:
         return HttpResponse('Patient or doctor not found.', status=404)
     patient_name = patient.full_name
     if request.method == 'POST':
@@ -331,32 +507,29 @@ def add_medical_record(request, patient_id):
         if form.is_valid():
             record = MedicalRecord(
                 patient_id=patient.id,
-                doctor_id=doctor.id,
+                doctor_id=principal.profile_id,
                 diagnosis=form.cleaned_data['diagnosis'],
                 treatment=form.cleaned_data['treatment'],
                 date=form.cleaned_data['date'],
             )
             db.add(record)
+            careteam.seen(db, principal.profile_id, patient.id)
             db.commit()
             patient_id_val = patient.id
-            db.close()
+            audit.record(principal, 'create', 'medical_records', patient_id_val, record.id, request)
             messages.success(request, 'Medical record added.')
             return redirect('patient_profile_view', patient_id=patient_id_val)
     else:
         form = MedicalRecordForm()
-    db.close()
     return render(request, 'add_medical_record.html', {'form': form, 'patient': {'id': patient_id, 'full_name': patient_name}})
 
 def add_lab_result(request, patient_id):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id or role != 'doctor':
+    principal = request.principal
+    if not principal or principal.role != 'doctor':
         return redirect('login')
-    db = SessionLocal()
+    db = request.db
     patient = db.query(PatientProfile).filter_by(id=patient_id).first()
-    doctor = db.query(DoctorProfile).filter_by(user_id=user_id).first()
-    if not patient or not doctor:
-        db.close()
+    if not patient or not principal.profile_id:
         return HttpResponse('Patient or doctor not found.', status=404)
     patient_name = patient.full_name
     if request.method == 'POST':
@@ -364,41 +537,41 @@ def add_lab_result(request, patient_id):
         if form.is_valid():
             result = LabResult(
                 patient_id=patient.id,
-                doctor_id=doctor.id,
+                doctor_id=principal.profile_id,
                 test_name=form.cleaned_data['test_name'],
                 result=form.cleaned_data['result'],
                 date=form.cleaned_data['date'],
+                analyte_code=form.cleaned_data['analyte_code'],
+                value_numeric=form.cleaned_data['value_numeric'],
+                unit=form.cleaned_data['unit'],
             )
             db.add(result)
+            careteam.seen(db, principal.profile_id, patient.id)
             db.commit()
             patient_id_val = patient.id
-            db.close()
+            audit.record(principal, 'create', 'lab_results', patient_id_val, result.id, request)
             messages.success(request, 'Lab result added.')
             return redirect('patient_profile_view', patient_id=patient_id_val)
     else:
         form = LabResultForm()
-    db.close()
     return render(request, 'add_lab_result.html', {'form': form, 'patient': {'id': patient_id, 'full_name': patient_name}})
 
 def add_prescription(request, patient_id):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id or role != 'doctor':
+    principal = request.principal
+    if not principal or principal.role != 'doctor':
         return redirect('login')
-    db = SessionLocal()
+    db = request.db
     patient = db.query(PatientProfile).filter_by(id=patient_id).first()
-    doctor = db.query(DoctorProfile).filter_by(user_id=user_id).first()
-    if not patient or not doctor:
-        db.close()
+    if not patient or not principal.profile_id:
         return HttpResponse('Patient or doctor not found.', status=404)
     patient_name = patient.full_name
-    doctor_name = doctor.full_name
+    doctor_name = principal.display_name
     if request.method == 'POST':
         form = PrescriptionForm(request.POST)
         if form.is_valid():
             prescription = Prescription(
                 patient_id=patient.id,
-                doctor_id=doctor.id,
+                doctor_id=principal.profile_id,
                 medical_record_id=None,  # Could be linked to a record if needed
                 medication=form.cleaned_data['medication'],
                 dosage=form.cleaned_data['dosage'],
@@ -406,76 +579,103 @@ def add_prescription(request, patient_id):
                 date=form.cleaned_data['date'],
             )
             db.add(prescription)
+            careteam.seen(db, principal.profile_id, patient.id)
             db.commit()
             patient_id_val = patient.id
-            db.close()
+            audit.record(principal, 'create', 'prescriptions', patient_id_val, prescription.id, request)
             messages.success(request, 'Prescription added.')
             return redirect('patient_profile_view', patient_id=patient_id_val)
     else:
         form = PrescriptionForm()
-    db.close()
     return render(request, 'add_prescription.html', {'form': form, 'patient': {'id': patient_id, 'full_name': patient_name}, 'doctor_name': doctor_name})
 
+@read_only
+@audit_read('medical_records')
+@conditional_chart('doctor', MedicalRecord)
 def doctor_patient_medical_history(request, patient_id):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id or role != 'doctor':
+    principal = request.principal
+    if not principal or principal.role != 'doctor':
         return redirect('login')
-    db = SessionLocal()
-    patient = db.query(PatientProfile).filter_by(id=patient_id).first()
-    records = (
-        db.query(MedicalRecord)
-        .options(joinedload(MedicalRecord.doctor))
-        .filter_by(patient_id=patient_id)
-        .all()
-    ) if patient else []
-    db.close()
-    return render(request, 'doctor_patient_medical_history.html', {'patient': patient, 'records': records})
+    db = request.db
+    patient, page = doctor_patient_records(db, request, patient_id, MedicalRecord, MedicalRecord.date)
+    if not patient:
+        return HttpResponse('Patient profile not found.', status=404)
+    return render(request, 'doctor_patient_medical_history.html', {'patient': patient, 'records': page.items, 'page': page})
 
+@read_only
+@audit_read('lab_results')
+@conditional_chart('doctor', LabResult)
 def doctor_patient_lab_results(request, patient_id):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id or role != 'doctor':
+    principal = request.principal
+    if not principal or principal.role != 'doctor':
         return redirect('login')
-    db = SessionLocal()
-    patient = db.query(PatientProfile).filter_by(id=patient_id).first()
-    results = (
-        db.query(LabResult)
-        .options(joinedload(LabResult.doctor))
-        .filter_by(patient_id=patient_id)
-        .all()
-    ) if patient else []
-    db.close()
-    return render(request, 'doctor_patient_lab_results.html', {'patient': patient, 'results': results})
+    db = request.db
+    patient, page = doctor_patient_records(db, request, patient_id, LabResult, LabResult.date)
+    if not patient:
+        return HttpResponse('Patient profile not found.', status=404)
+    trends = patient_trends(db, patient_id)
+    return render(request, 'doctor_patient_lab_results.html', {'patient': patient, 'results': page.items, 'page': page, 'trends': trends})
 
+@read_only
+@audit_read('lab_results')
+@conditional_chart('doctor', LabResult)
+def doctor_patient_lab_trends(request, patient_id):
+    principal = request.principal
+    if not principal or principal.role != 'doctor':
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    db = request.db
+    if not db.query(PatientProfile.id).filter_by(id=patient_id).first():
+        return JsonResponse({'error': 'Patient profile not found.'}, status=404)
+    analyte = (request.GET.get('analyte') or '').strip().upper() or None
+    codes, units, days, values = load_series(db, patient_id, analyte)
+    data = {'trends': compute_trends(codes, units, days, values)}
+    if analyte:
+        data['series'] = series_points(units, days, values)
+    return JsonResponse(data)
+
+@read_only
+@audit_read('prescriptions')
+@conditional_chart('doctor', Prescription)
 def doctor_patient_prescriptions(request, patient_id):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id or role != 'doctor':
+    principal = request.principal
+    if not principal or principal.role != 'doctor':
+        return redirect('login')
+    db = request.db
+    patient, page = doctor_patient_records(db, request, patient_id, Prescription, Prescription.date)
+    if not patient:
+        return HttpResponse('Patient profile not found.', status=404)
+    return render(request, 'doctor_patient_prescriptions.html', {'patient': patient, 'prescriptions': page.items, 'page': page})
+
+@read_only
+@audit_read('timeline')
+@conditional_chart('doctor', MedicalRecord, LabResult, Prescription, Appointment)
+def doctor_patient_timeline(request, patient_id):
+    principal = request.principal
+    if not principal or principal.role != 'doctor':
         return redirect('login')
-    db = SessionLocal()
+    db = request.db
     patient = db.query(PatientProfile).filter_by(id=patient_id).first()
-    prescriptions = (
-        db.query(Prescription)
-        .options(joinedload(Prescription.doctor))
-        .filter_by(patient_id=patient_id)
-        .all()
-    ) if patient else []
-    db.close()
-    return render(request, 'doctor_patient_prescriptions.html', {'patient': patient, 'prescriptions': prescriptions})
+    if not patient:
+        return HttpResponse('Patient profile not found.', status=404)
+    events, next_cursor = patient_timeline(db, patient_id, cursor=request.GET.get('before'))
+    return render(request, 'doctor_patient_timeline.html', {
+        'patient': patient,
+        'events': events,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('before'),
+    })
 
+@cache_page_per_role()
 def home(request):
     return render(request, 'home.html')
 
 def edit_medical_record(request, record_id):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id or role != 'doctor':
+    principal = request.principal
+    if not principal or principal.role != 'doctor':
         return redirect('login')
-    db = SessionLocal()
+    db = request.db
     record = db.query(MedicalRecord).filter_by(id=record_id).first()
     if not record:
-        db.close()
         return HttpResponse('Medical record not found.', status=404)
     patient_id_val = record.patient_id
     if request.method == 'POST':
@@ -485,45 +685,44 @@ def edit_medical_record(request, record_id):
             record.treatment = form.cleaned_data['treatment']
             record.date = form.cleaned_data['date']
             db.commit()
-            db.close()
+            audit.record(principal, 'update', 'medical_records', patient_id_val, record_id, request)
             messages.success(request, 'Medical record updated.')
             return redirect('doctor_patient_medical_history', patient_id=patient_id_val)
     else:
+        audit.record(principal, 'read', 'medical_records', patient_id_val, record_id, request)
         form = MedicalRecordForm(initial={
             'diagnosis': record.diagnosis,
             'treatment': record.treatment,
             'date': record.date,
         })
-    db.close()
     return render(request, 'edit_medical_record.html', {'form': form, 'record': record, 'patient_id': patient_id_val})
 
 def change_password(request):
-    user_id = request.session.get('user_id')
-    role = request.session.get('role')
-    if not user_id:
+    principal = request.principal
+    if not principal:
         return redirect('login')
-    db = SessionLocal()
-    user = db.query(User).filter_by(id=user_id).first()
+    db = request.db
+    user = db.query(User).filter_by(id=principal.user_id).first()
     if not user:
-        db.close()
         messages.error(request, 'User not found.')
         return redirect('dashboard')
     if request.method == 'POST':
         form = ChangePasswordForm(request.POST, username=user.username, email=user.email)
         if form.is_valid():
             old_password = form.cleaned_data['old_password']
-            if not check_password_hash(user.password_hash, old_password):
-                form.add_error('old_password', 'Old password is incorrect.')
-            else:
-                user.password_hash = generate_password_hash(form.cleaned_data['new_password'])
-                db.commit()
-                db.close()
-                messages.success(request, 'Password changed successfully.')
-                return redirect('dashboard')
+            try:
+                if not verify_password(user.password_hash, old_password)[0]:
+                    form.add_error('old_password', 'Old password is incorrect.')
+                else:
+                    user.password_hash = hash_password(form.cleaned_data['new_password'])
+                    db.commit()
+                    messages.success(request, 'Password changed successfully.')
+                    return redirect('dashboard')
+            except HashingBusy:
+                messages.error(request, 'The server is busy. Please try again in a moment.')
     else:
         form = ChangePasswordForm(username=user.username, email=user.email)
-    db.close()
-    return render(request, 'change_password.html', {'form': form, 'role': role})
+    return render(request, 'change_password.html', {'form': form, 'role': principal.role})
 
 def custom_404(request, exception):
     return render(request, '404.html', status=404)
@@ -0,0 +1,22 @@
+from alembic import op
+
+
+def is_postgres():
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def create_index(name, table, columns, **kw):
+    """Create an index without blocking writes to ``table`` on Postgres."""
+    if is_postgres():
+        with op.get_context().autocommit_block():
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True, **kw)
+    else:
+        op.create_index(name, table, columns, **kw)
+
+
+def drop_index(name, table):
+    if is_postgres():
+        with op.get_context().autocommit_block():
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    else:
+        op.drop_index(name, table_name=table)
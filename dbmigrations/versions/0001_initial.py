@@ -0,0 +1,92 @@
+"""initial schema, as previously created by Base.metadata.create_all
+
+Revision ID: 0001_initial
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001_initial'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('username', sa.String(150), nullable=False, unique=True),
+        sa.Column('password_hash', sa.String(255), nullable=False),
+        sa.Column('role', sa.Enum('patient', 'doctor', name='user_roles'), nullable=False),
+        sa.Column('email', sa.String(255), nullable=False, unique=True),
+    )
+    op.create_table(
+        'patient_profiles',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id')),
+        sa.Column('full_name', sa.String(255)),
+        sa.Column('date_of_birth', sa.Date()),
+        sa.Column('address', sa.String(255)),
+        sa.Column('phone', sa.String(50)),
+    )
+    op.create_table(
+        'doctor_profiles',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id')),
+        sa.Column('full_name', sa.String(255)),
+        sa.Column('specialty', sa.String(255)),
+        sa.Column('phone', sa.String(50)),
+    )
+    op.create_table(
+        'medical_records',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('patient_id', sa.Integer(), sa.ForeignKey('patient_profiles.id')),
+        sa.Column('doctor_id', sa.Integer(), sa.ForeignKey('doctor_profiles.id')),
+        sa.Column('diagnosis', sa.Text()),
+        sa.Column('treatment', sa.Text()),
+        sa.Column('date', sa.DateTime()),
+    )
+    op.create_table(
+        'appointments',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('patient_id', sa.Integer(), sa.ForeignKey('patient_profiles.id')),
+        sa.Column('doctor_id', sa.Integer(), sa.ForeignKey('doctor_profiles.id')),
+        sa.Column('appointment_time', sa.DateTime()),
+        sa.Column('reason', sa.Text()),
+        sa.Column('status', sa.Enum('pending', 'confirmed', 'completed', 'cancelled', name='appointment_status')),
+    )
+    op.create_table(
+        'lab_results',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('patient_id', sa.Integer(), sa.ForeignKey('patient_profiles.id')),
+        sa.Column('doctor_id', sa.Integer(), sa.ForeignKey('doctor_profiles.id')),
+        sa.Column('test_name', sa.String(255)),
+        sa.Column('result', sa.Text()),
+        sa.Column('date', sa.DateTime()),
+    )
+    op.create_table(
+        'prescriptions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('patient_id', sa.Integer(), sa.ForeignKey('patient_profiles.id')),
+        sa.Column('doctor_id', sa.Integer(), sa.ForeignKey('doctor_profiles.id')),
+        sa.Column('medical_record_id', sa.Integer(), sa.ForeignKey('medical_records.id')),
+        sa.Column('medication', sa.String(255)),
+        sa.Column('dosage', sa.String(255)),
+        sa.Column('instructions', sa.Text()),
+        sa.Column('date', sa.DateTime()),
+    )
+
+
+def downgrade():
+    op.drop_table('prescriptions')
+    op.drop_table('lab_results')
+    op.drop_table('appointments')
+    op.drop_table('medical_records')
+    op.drop_table('doctor_profiles')
+    op.drop_table('patient_profiles')
+    op.drop_table('users')
+    sa.Enum(name='appointment_status').drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name='user_roles').drop(op.get_bind(), checkfirst=True)
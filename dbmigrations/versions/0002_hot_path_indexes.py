@@ -0,0 +1,36 @@
+"""indexes for per-patient history and doctor agenda queries
+
+Revision ID: 0002_hot_path_indexes
+Revises: 0001_initial
+Create Date: 2026-10-18
+
+The unique user_id indexes fail if a user already has two profiles of the
+same kind; remove the duplicates before upgrading.
+"""
+from dbmigrations.helpers import create_index, drop_index
+
+
+revision = '0002_hot_path_indexes'
+down_revision = '0001_initial'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_medical_records_patient_date', 'medical_records', ['patient_id', 'date'], False),
+    ('ix_lab_results_patient_date', 'lab_results', ['patient_id', 'date'], False),
+    ('ix_prescriptions_patient_date', 'prescriptions', ['patient_id', 'date'], False),
+    ('ix_appointments_doctor_time', 'appointments', ['doctor_id', 'appointment_time'], False),
+    ('ix_appointments_patient_time', 'appointments', ['patient_id', 'appointment_time'], False),
+    ('uq_patient_profiles_user_id', 'patient_profiles', ['user_id'], True),
+    ('uq_doctor_profiles_user_id', 'doctor_profiles', ['user_id'], True),
+]
+
+
+def upgrade():
+    for name, table, columns, unique in INDEXES:
+        create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    for name, table, columns, unique in reversed(INDEXES):
+        drop_index(name, table)
@@ -0,0 +1,48 @@
+"""indexed patient search: trigram name and phone indexes, date of birth
+
+Revision ID: 0003_patient_search
+Revises: 0002_hot_path_indexes
+Create Date: 2026-10-18
+
+On Postgres this needs the pg_trgm extension; the migration creates it,
+which requires a role allowed to run CREATE EXTENSION.
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+from dbmigrations.helpers import create_index, drop_index, is_postgres
+
+
+revision = '0003_patient_search'
+down_revision = '0002_hot_path_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('patient_profiles', sa.Column('phone_normalized', sa.String(50)))
+    bind = op.get_bind()
+    if is_postgres():
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("UPDATE patient_profiles SET phone_normalized = NULLIF(regexp_replace(phone, '\\D', '', 'g'), '')")
+    else:
+        rows = bind.execute(sa.text("SELECT id, phone FROM patient_profiles WHERE phone IS NOT NULL")).fetchall()
+        for row_id, phone in rows:
+            bind.execute(
+                sa.text("UPDATE patient_profiles SET phone_normalized = :digits WHERE id = :id"),
+                {'digits': re.sub(r'\D', '', phone) or None, 'id': row_id},
+            )
+    create_index('ix_patient_profiles_full_name_trgm', 'patient_profiles', ['full_name'],
+                 postgresql_using='gin', postgresql_ops={'full_name': 'gin_trgm_ops'})
+    create_index('ix_patient_profiles_phone_normalized', 'patient_profiles', ['phone_normalized'],
+                 postgresql_using='gin', postgresql_ops={'phone_normalized': 'gin_trgm_ops'})
+    create_index('ix_patient_profiles_date_of_birth', 'patient_profiles', ['date_of_birth'])
+
+
+def downgrade():
+    drop_index('ix_patient_profiles_date_of_birth', 'patient_profiles')
+    drop_index('ix_patient_profiles_phone_normalized', 'patient_profiles')
+    drop_index('ix_patient_profiles_full_name_trgm', 'patient_profiles')
+    op.drop_column('patient_profiles', 'phone_normalized')
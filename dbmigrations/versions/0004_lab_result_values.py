@@ -0,0 +1,30 @@
+"""structured numeric values on lab results
+
+Revision ID: 0004_lab_result_values
+Revises: 0003_patient_search
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from dbmigrations.helpers import create_index, drop_index
+
+
+revision = '0004_lab_result_values'
+down_revision = '0003_patient_search'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('lab_results', sa.Column('analyte_code', sa.String(32)))
+    op.add_column('lab_results', sa.Column('value_numeric', sa.Float()))
+    op.add_column('lab_results', sa.Column('unit', sa.String(32)))
+    create_index('ix_lab_results_patient_analyte_date', 'lab_results', ['patient_id', 'analyte_code', 'date'])
+
+
+def downgrade():
+    drop_index('ix_lab_results_patient_analyte_date', 'lab_results')
+    op.drop_column('lab_results', 'unit')
+    op.drop_column('lab_results', 'value_numeric')
+    op.drop_column('lab_results', 'analyte_code')
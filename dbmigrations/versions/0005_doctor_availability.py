@@ -0,0 +1,48 @@
+"""doctor availability templates, exceptions and appointment durations
+
+Revision ID: 0005_doctor_availability
+Revises: 0004_lab_result_values
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005_doctor_availability'
+down_revision = '0004_lab_result_values'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('appointments', sa.Column('duration_minutes', sa.Integer(), nullable=False, server_default='30'))
+    op.create_table(
+        'doctor_availability',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('doctor_id', sa.Integer(), sa.ForeignKey('doctor_profiles.id'), nullable=False),
+        sa.Column('weekday', sa.Integer(), nullable=False),
+        sa.Column('start_time', sa.Time(), nullable=False),
+        sa.Column('end_time', sa.Time(), nullable=False),
+        sa.Column('slot_minutes', sa.Integer(), nullable=False, server_default='30'),
+    )
+    op.create_index('ix_doctor_availability_doctor_weekday', 'doctor_availability', ['doctor_id', 'weekday'])
+    op.create_table(
+        'availability_exceptions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('doctor_id', sa.Integer(), sa.ForeignKey('doctor_profiles.id'), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('start_time', sa.Time()),
+        sa.Column('end_time', sa.Time()),
+        sa.Column('available', sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column('slot_minutes', sa.Integer(), nullable=False, server_default='30'),
+        sa.Column('reason', sa.String(255)),
+    )
+    op.create_index('ix_availability_exceptions_doctor_date', 'availability_exceptions', ['doctor_id', 'date'])
+
+
+def downgrade():
+    op.drop_index('ix_availability_exceptions_doctor_date', table_name='availability_exceptions')
+    op.drop_table('availability_exceptions')
+    op.drop_index('ix_doctor_availability_doctor_weekday', table_name='doctor_availability')
+    op.drop_table('doctor_availability')
+    op.drop_column('appointments', 'duration_minutes')
@@ -0,0 +1,55 @@
+"""exclusion constraint against overlapping appointments per doctor
+
+Revision ID: 0006_appointment_no_overlap
+Revises: 0005_doctor_availability
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from dbmigrations.helpers import is_postgres
+
+
+revision = '0006_appointment_no_overlap'
+down_revision = '0005_doctor_availability'
+branch_labels = None
+depends_on = None
+
+# Two non-cancelled appointments of one doctor may not overlap in time.
+# btree_gist provides the gist "=" operator class needed for doctor_id.
+NO_OVERLAP = """
+    ALTER TABLE appointments ADD CONSTRAINT ex_appointments_no_overlap
+    EXCLUDE USING gist (
+        doctor_id WITH =,
+        tsrange(appointment_time, appointment_time + duration_minutes * interval '1 minute') WITH &&
+    )
+    WHERE (status <> 'cancelled' AND appointment_time IS NOT NULL)
+"""
+
+OVERLAPS = """
+    SELECT count(*) FROM appointments a JOIN appointments b
+      ON a.doctor_id = b.doctor_id AND a.id < b.id
+     AND a.status <> 'cancelled' AND b.status <> 'cancelled'
+     AND tsrange(a.appointment_time, a.appointment_time + a.duration_minutes * interval '1 minute')
+      && tsrange(b.appointment_time, b.appointment_time + b.duration_minutes * interval '1 minute')
+"""
+
+
+def upgrade():
+    # Only Postgres can enforce this; other backends rely on the check in core.scheduling.book_slot
+    if not is_postgres():
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    clashes = op.get_bind().execute(sa.text(OVERLAPS)).scalar()
+    if clashes:
+        raise RuntimeError(
+            f'{clashes} pair(s) of overlapping appointments exist; cancel or move the duplicates '
+            'before adding ex_appointments_no_overlap.'
+        )
+    op.execute(NO_OVERLAP)
+
+
+def downgrade():
+    if not is_postgres():
+        return
+    op.execute('ALTER TABLE appointments DROP CONSTRAINT IF EXISTS ex_appointments_no_overlap')
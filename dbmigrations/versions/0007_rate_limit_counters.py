@@ -0,0 +1,28 @@
+"""shared sliding-window rate limit counters
+
+Revision ID: 0007_rate_limit_counters
+Revises: 0006_appointment_no_overlap
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0007_rate_limit_counters'
+down_revision = '0006_appointment_no_overlap'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'rate_limit_counters',
+        sa.Column('key', sa.String(255), primary_key=True),
+        sa.Column('window_start', sa.BigInteger(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('previous_count', sa.Integer(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table('rate_limit_counters')
@@ -0,0 +1,41 @@
+"""change tracking for patient chart rows
+
+Revision ID: 0008_updated_at
+Revises: 0007_rate_limit_counters
+Create Date: 2026-10-18
+
+Existing rows get the time of the upgrade as their updated_at.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from dbmigrations.helpers import create_index, drop_index
+
+
+revision = '0008_updated_at'
+down_revision = '0007_rate_limit_counters'
+branch_labels = None
+depends_on = None
+
+TABLES = ['patient_profiles', 'medical_records', 'appointments', 'lab_results', 'prescriptions']
+# (patient_id, updated_at) lets count() and max(updated_at) per patient run as index-only scans
+INDEXED_TABLES = ['medical_records', 'appointments', 'lab_results', 'prescriptions']
+
+
+def upgrade():
+    for table in TABLES:
+        # Batch mode so SQLite rebuilds the table; it cannot add a column with a non-constant default
+        with op.batch_alter_table(table) as batch:
+            batch.add_column(sa.Column(
+                'updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now(),
+            ))
+    for table in INDEXED_TABLES:
+        create_index(f'ix_{table}_patient_updated', table, ['patient_id', 'updated_at'])
+
+
+def downgrade():
+    for table in reversed(INDEXED_TABLES):
+        drop_index(f'ix_{table}_patient_updated', table)
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table) as batch:
+            batch.drop_column('updated_at')
@@ -0,0 +1,37 @@
+"""append-only PHI access audit log
+
+Revision ID: 0009_audit_log
+Revises: 0008_updated_at
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0009_audit_log'
+down_revision = '0008_updated_at'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'audit_log',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), primary_key=True),
+        sa.Column('occurred_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('actor_user_id', sa.Integer(), nullable=False),
+        sa.Column('actor_role', sa.String(20), nullable=False),
+        sa.Column('action', sa.Enum('read', 'create', 'update', name='audit_action'), nullable=False),
+        sa.Column('resource', sa.String(64), nullable=False),
+        sa.Column('patient_id', sa.Integer(), nullable=False),
+        sa.Column('record_id', sa.Integer()),
+        sa.Column('path', sa.String(255)),
+        sa.Column('ip_address', sa.String(45)),
+    )
+    op.create_index('ix_audit_log_patient_occurred', 'audit_log', ['patient_id', 'occurred_at'])
+    op.create_index('ix_audit_log_actor_occurred', 'audit_log', ['actor_user_id', 'occurred_at'])
+
+
+def downgrade():
+    op.drop_table('audit_log')
+    sa.Enum(name='audit_action').drop(op.get_bind(), checkfirst=True)
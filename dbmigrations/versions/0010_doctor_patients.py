@@ -0,0 +1,43 @@
+"""doctor-patient care-team panel
+
+Revision ID: 0010_doctor_patients
+Revises: 0009_audit_log
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0010_doctor_patients'
+down_revision = '0009_audit_log'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'doctor_patients',
+        sa.Column('doctor_id', sa.Integer(), sa.ForeignKey('doctor_profiles.id'), primary_key=True),
+        sa.Column('patient_id', sa.Integer(), sa.ForeignKey('patient_profiles.id'), primary_key=True),
+        sa.Column('last_seen_at', sa.DateTime(timezone=True), nullable=False),
+    )
+    # Every pair with a booking or chart entry so far, last seen at its latest one (capped at now)
+    op.execute("""
+        INSERT INTO doctor_patients (doctor_id, patient_id, last_seen_at)
+        SELECT doctor_id, patient_id,
+               max(CASE WHEN seen_at IS NULL OR seen_at > CURRENT_TIMESTAMP THEN CURRENT_TIMESTAMP ELSE seen_at END)
+        FROM (
+            SELECT doctor_id, patient_id, appointment_time AS seen_at FROM appointments
+            UNION ALL SELECT doctor_id, patient_id, date FROM medical_records
+            UNION ALL SELECT doctor_id, patient_id, date FROM lab_results
+            UNION ALL SELECT doctor_id, patient_id, date FROM prescriptions
+        ) AS activity
+        WHERE doctor_id IS NOT NULL AND patient_id IS NOT NULL
+        GROUP BY doctor_id, patient_id
+    """)
+    # Built after the backfill; the table is new, so nothing is blocked
+    op.create_index('ix_doctor_patients_doctor_last_seen', 'doctor_patients', ['doctor_id', 'last_seen_at', 'patient_id'])
+
+
+def downgrade():
+    op.drop_table('doctor_patients')
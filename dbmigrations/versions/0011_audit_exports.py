@@ -0,0 +1,43 @@
+"""audit bulk exports
+
+Revision ID: 0011_audit_exports
+Revises: 0010_doctor_patients
+Create Date: 2026-10-18
+
+Exports span many patients, so patient_id becomes nullable; their columns
+and filters go in the new details column. Downgrading deletes export
+entries, since the old schema cannot hold them.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from dbmigrations.helpers import is_postgres
+
+
+revision = '0011_audit_exports'
+down_revision = '0010_doctor_patients'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if is_postgres():
+        # ADD VALUE cannot run inside a transaction block before Postgres 12
+        with op.get_context().autocommit_block():
+            op.execute("ALTER TYPE audit_action ADD VALUE IF NOT EXISTS 'export'")
+    with op.batch_alter_table('audit_log') as batch:
+        batch.alter_column('patient_id', existing_type=sa.Integer(), nullable=True)
+        batch.add_column(sa.Column('details', sa.JSON()))
+
+
+def downgrade():
+    op.execute("DELETE FROM audit_log WHERE action = 'export' OR patient_id IS NULL")
+    with op.batch_alter_table('audit_log') as batch:
+        batch.drop_column('details')
+        batch.alter_column('patient_id', existing_type=sa.Integer(), nullable=False)
+    if is_postgres():
+        # Enum values cannot be dropped; swap in a type without 'export'
+        op.execute('ALTER TYPE audit_action RENAME TO audit_action_old')
+        sa.Enum('read', 'create', 'update', name='audit_action').create(op.get_bind())
+        op.execute('ALTER TABLE audit_log ALTER COLUMN action TYPE audit_action USING action::text::audit_action')
+        op.execute('DROP TYPE audit_action_old')
@@ -0,0 +1,35 @@
+"""change tracking for doctor profiles
+
+Revision ID: 0012_doctor_profiles_updated_at
+Revises: 0011_audit_exports
+Create Date: 2026-10-18
+
+Chart page validators include the latest doctor profile change, since the
+pages show doctors' names. Existing rows get the time of the upgrade.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from dbmigrations.helpers import create_index, drop_index
+
+
+revision = '0012_doctor_profiles_updated_at'
+down_revision = '0011_audit_exports'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Batch mode so SQLite rebuilds the table; it cannot add a column with a non-constant default
+    with op.batch_alter_table('doctor_profiles') as batch:
+        batch.add_column(sa.Column(
+            'updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now(),
+        ))
+    # max(updated_at) is read on every chart request
+    create_index('ix_doctor_profiles_updated_at', 'doctor_profiles', ['updated_at'])
+
+
+def downgrade():
+    drop_index('ix_doctor_profiles_updated_at', 'doctor_profiles')
+    with op.batch_alter_table('doctor_profiles') as batch:
+        batch.drop_column('updated_at')
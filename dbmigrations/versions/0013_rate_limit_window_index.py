@@ -0,0 +1,23 @@
+"""index rate limit counters by window
+
+Revision ID: 0013_rate_limit_window_index
+Revises: 0012_doctor_profiles_updated_at
+Create Date: 2026-10-18
+
+manage.py purge_rate_limits deletes counters by window_start.
+"""
+from dbmigrations.helpers import create_index, drop_index
+
+
+revision = '0013_rate_limit_window_index'
+down_revision = '0012_doctor_profiles_updated_at'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    create_index('ix_rate_limit_counters_window_start', 'rate_limit_counters', ['window_start'])
+
+
+def downgrade():
+    drop_index('ix_rate_limit_counters_window_start', 'rate_limit_counters')
@@ -0,0 +1,60 @@
+"""count appointments without a status in the overlap constraint
+
+Revision ID: 0014_no_overlap_null_status
+Revises: 0013_rate_limit_window_index
+Create Date: 2026-10-18
+
+status <> 'cancelled' is NULL for rows without a status, so the partial
+exclusion constraint from 0006 skipped them. IS DISTINCT FROM treats them
+as booked, like core.scheduling does.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from dbmigrations.helpers import is_postgres
+
+
+revision = '0014_no_overlap_null_status'
+down_revision = '0013_rate_limit_window_index'
+branch_labels = None
+depends_on = None
+
+NO_OVERLAP = """
+    ALTER TABLE appointments ADD CONSTRAINT ex_appointments_no_overlap
+    EXCLUDE USING gist (
+        doctor_id WITH =,
+        tsrange(appointment_time, appointment_time + duration_minutes * interval '1 minute') WITH &&
+    )
+    WHERE ({condition} AND appointment_time IS NOT NULL)
+"""
+
+OVERLAPS = """
+    SELECT count(*) FROM appointments a JOIN appointments b
+      ON a.doctor_id = b.doctor_id AND a.id < b.id
+     AND a.status IS DISTINCT FROM 'cancelled' AND b.status IS DISTINCT FROM 'cancelled'
+     AND tsrange(a.appointment_time, a.appointment_time + a.duration_minutes * interval '1 minute')
+      && tsrange(b.appointment_time, b.appointment_time + b.duration_minutes * interval '1 minute')
+"""
+
+
+def _replace_constraint(condition):
+    op.execute('ALTER TABLE appointments DROP CONSTRAINT IF EXISTS ex_appointments_no_overlap')
+    op.execute(NO_OVERLAP.format(condition=condition))
+
+
+def upgrade():
+    if not is_postgres():
+        return
+    clashes = op.get_bind().execute(sa.text(OVERLAPS)).scalar()
+    if clashes:
+        raise RuntimeError(
+            f'{clashes} pair(s) of overlapping appointments exist, counting those without a status; '
+            'cancel or move the duplicates before upgrading.'
+        )
+    _replace_constraint("status IS DISTINCT FROM 'cancelled'")
+
+
+def downgrade():
+    if not is_postgres():
+        return
+    _replace_constraint("status <> 'cancelled'")
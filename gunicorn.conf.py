@@ -0,0 +1,27 @@
+# gunicorn loads this file automatically: gunicorn pmc.wsgi
+import os
+import shutil
+import tempfile
+
+# Must be set before prometheus_client is imported anywhere, in the master and the workers
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "pmc-prometheus")
+)
+
+from prometheus_client import multiprocess  # noqa: E402
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", 4))
+threads = int(os.getenv("GUNICORN_THREADS", 1))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+
+
+def on_starting(server):
+    # Samples left over from a previous run would be summed into the new one
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Drop the dead worker's live gauges (pool connections, audit queue)
+    multiprocess.mark_process_dead(worker.pid)
@@ -5,6 +5,13 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+To serve the async chart views (core/async_views.py), run for example:
+
+    ASYNC_READ_VIEWS=1 uvicorn pmc.asgi:application --host 0.0.0.0 --port 8000 --workers 4
+
+Each process keeps one asyncpg pool (DB_ASYNC_POOL_SIZE) next to the sync
+pool used by the remaining views.
 """
 
 import os
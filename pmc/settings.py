@@ -35,6 +35,10 @@ SECRET_KEY = os.getenv("SECRET_KEY")  # Set this in your .env file and never com
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# Keep compiled templates in memory (the cached loader). Defaults to on when
+# DEBUG is off; set CACHE_TEMPLATES=1 to get it in a DEBUG deployment too.
+CACHE_TEMPLATES = os.getenv("CACHE_TEMPLATES", "" if DEBUG else "1").lower() in ("1", "true", "yes")
+
 ALLOWED_HOSTS = ['phms-jde.onrender.com']
 
 
@@ -46,18 +50,25 @@ INSTALLED_APPS = [
     "django.contrib.contenttypes",
     "django.contrib.sessions",
     "django.contrib.messages",
-    "django.contrib.staticfiles",
+    # Before staticfiles, so core's collectstatic overrides the stock one
     "core",
+    "django.contrib.staticfiles",
 ]
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "core.metrics.MetricsMiddleware",
+    "core.querycount.QueryCountMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
+    "core.db.DBSessionMiddleware",
+    "core.principal.PrincipalMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.views.SecurityHeadersMiddleware",
 ]
 
 ROOT_URLCONF = "pmc.urls"
@@ -66,13 +77,22 @@ TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
-        "APP_DIRS": True,
         "OPTIONS": {
             "context_processors": [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
             ],
+            # Without CACHE_TEMPLATES, plain loaders re-read templates so edits show up at once
+            "loaders": [
+                ("django.template.loaders.cached.Loader", [
+                    "django.template.loaders.filesystem.Loader",
+                    "django.template.loaders.app_directories.Loader",
+                ]),
+            ] if CACHE_TEMPLATES else [
+                "django.template.loaders.filesystem.Loader",
+                "django.template.loaders.app_directories.Loader",
+            ],
         },
     },
 ]
@@ -138,6 +158,92 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = "/static/"
+STATICFILES_DIRS = [BASE_DIR / "static"]
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# Assets are vendored and bundled by `manage.py build_assets`, then
+# `manage.py collectstatic` fingerprints them (app.<hash>.css) and writes
+# .gz/.br variants. WhiteNoise serves those from the app with
+# "Cache-Control: max-age=315360000, immutable". In DEBUG, files are served
+# from static/ unhashed.
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+}
+# Off DEBUG, a page referencing an asset missing from the manifest raises
+# ValueError; static/dist/ is not committed, so collectstatic (core's
+# override) refuses to run until build_assets has produced the bundles.
+# Without them (a fresh checkout), {% bundle %} links the unbundled sources.
+WHITENOISE_MANIFEST_STRICT = True
+
+# Page, fragment and app caches (core.pagecache, {% cache %}, core.directory,
+# core.principal). The core.metrics backends count hits and misses per key prefix. Set REDIS_URL to share them across workers and nodes;
+# otherwise each process has its own in-memory cache, and invalidation is
+# per process: e.g. a new doctor reaches the other workers' directory only
+# after core.directory.TTL_SECONDS.
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "core.metrics.InstrumentedRedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "core.metrics.InstrumentedLocMemCache",
+        }
+    }
+
+# Read replicas (DATABASE_REPLICA_URLS): after a write, a user's reads stay on
+# the primary for this many seconds so they see what they just saved.
+READ_REPLICA_STICKY_SECONDS = int(os.getenv("READ_REPLICA_STICKY_SECONDS", 10))
+
+# Serve the patient and doctor_patient chart views as async views on an
+# asyncpg engine (core.async_db). Only enable this when running under an ASGI
+# server such as uvicorn (see pmc/asgi.py): the async pool is bound to the
+# server's event loop.
+ASYNC_READ_VIEWS = os.getenv("ASYNC_READ_VIEWS", "false").lower() in ("1", "true", "yes")
+
+# Password hashing (core.hashing). PASSWORD_HASH_METHOD is a werkzeug method
+# string such as "scrypt:32768:8:1" or "pbkdf2:sha256:600000"; stored hashes
+# are upgraded to it on the user's next successful login. Hashes run in a pool
+# of PASSWORD_HASH_WORKERS processes per app worker (0 = inline), with at most
+# WORKERS * QUEUE_FACTOR in flight; callers wait PASSWORD_HASH_TIMEOUT seconds
+# for a slot before getting a "busy, retry" response.
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 1))
+PASSWORD_HASH_QUEUE_FACTOR = int(os.getenv("PASSWORD_HASH_QUEUE_FACTOR", 4))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 5))
+
+# Login rate limiting (core.ratelimit): failed attempts allowed per sliding
+# window, per username and per client IP. The IP limit is looser because a
+# clinic's staff often share one address. DatabaseBackend shares counters
+# across workers and nodes; core.ratelimit.LocalBackend keeps them in-process.
+# Schedule `manage.py purge_rate_limits` (e.g. hourly) to delete idle counters.
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "core.ratelimit.DatabaseBackend")
+LOGIN_RATE_LIMIT_WINDOW = int(os.getenv("LOGIN_RATE_LIMIT_WINDOW", 600))
+LOGIN_RATE_LIMIT_PER_USERNAME = int(os.getenv("LOGIN_RATE_LIMIT_PER_USERNAME", 5))
+LOGIN_RATE_LIMIT_PER_IP = int(os.getenv("LOGIN_RATE_LIMIT_PER_IP", 50))
+
+# PHI access audit log (core.audit): events are queued in memory and written
+# by a background thread per worker in batches of up to AUDIT_BATCH_SIZE, at
+# most AUDIT_FLUSH_SECONDS after they happen. When AUDIT_QUEUE_SIZE events are
+# waiting, further events are written by the request thread instead.
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", 10000))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 500))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", 1))
+
+# Per-request SQL instrumentation (core.querycount): a statement run this many
+# times in one request is reported as a likely N+1 pattern.
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", 5))
+
+# Operational endpoints (core.metrics): /metrics for Prometheus, /healthz for
+# liveness and /readyz for readiness (SELECT 1 on the primary). Under gunicorn,
+# gunicorn.conf.py sets PROMETHEUS_MULTIPROC_DIR so /metrics covers every
+# worker. Scrapers must send METRICS_TOKEN as a Bearer token; with no token
+# set, /metrics answers 403 unless DEBUG is on.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
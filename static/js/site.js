@@ -0,0 +1,66 @@
+// Animate alerts
+document.querySelectorAll('.alert').forEach(function(alert) {
+    alert.classList.add('fade', 'show');
+    setTimeout(function() { alert.classList.remove('show'); alert.classList.add('hide'); }, 4000);
+});
+
+// Typeahead suggestions; the JSON endpoint comes from the input's data-suggest-url
+function suggestInto(input, box, params, render, minLength) {
+    var timer = null;
+    return function() {
+        clearTimeout(timer);
+        timer = setTimeout(function() {
+            var query = params();
+            if (!query) { box.innerHTML = ''; return; }
+            fetch(input.dataset.suggestUrl + '?' + query, {credentials: 'same-origin'})
+                .then(function(r) { return r.json(); })
+                .then(function(data) {
+                    box.innerHTML = '';
+                    (data.results || []).forEach(function(item) { box.appendChild(render(item)); });
+                });
+        }, 200);
+    };
+}
+
+// Book appointment: pick a doctor by name and/or specialty
+(function() {
+    var form = document.getElementById('doctor-picker');
+    var input = document.getElementById('doctor-search');
+    var specialty = document.getElementById('doctor-specialty');
+    var box = document.getElementById('doctor-suggestions');
+    if (!form || !input || !specialty || !box) { return; }
+    var suggest = suggestInto(input, box, function() {
+        var q = input.value.trim();
+        if (!q && !specialty.value) { return ''; }
+        return 'q=' + encodeURIComponent(q) + '&specialty=' + encodeURIComponent(specialty.value);
+    }, function(d) {
+        var a = document.createElement('button');
+        a.type = 'button';
+        a.className = 'list-group-item list-group-item-action';
+        a.textContent = d.full_name + (d.specialty ? ' · ' + d.specialty : '');
+        a.addEventListener('click', function() {
+            document.getElementById('doctor-id').value = d.id;
+            form.submit();
+        });
+        return a;
+    });
+    input.addEventListener('input', suggest);
+    specialty.addEventListener('change', suggest);
+})();
+
+// My Patients: jump to a patient's profile
+(function() {
+    var input = document.getElementById('patient-search');
+    var box = document.getElementById('patient-suggestions');
+    if (!input || !box) { return; }
+    input.addEventListener('input', suggestInto(input, box, function() {
+        var q = input.value.trim();
+        return q.length < 2 ? '' : 'q=' + encodeURIComponent(q);
+    }, function(p) {
+        var a = document.createElement('a');
+        a.className = 'list-group-item list-group-item-action';
+        a.href = '/patient/profile/' + p.id + '/';
+        a.textContent = p.full_name + (p.date_of_birth ? ' · ' + p.date_of_birth : '') + (p.phone ? ' · ' + p.phone : '');
+        return a;
+    }));
+})();